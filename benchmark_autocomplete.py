@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos endpoints de autocomplete (search_produtos, search_clientes,
+search_fornecedores) sob carga concorrente: WSGI x ASGI.
+
+Roda dentro do processo, sem servidor HTTP, contra o banco configurado.
+--concorrencia clientes fazem requisições em sequência:
+- WSGI: atendidos por --workers-wsgi threads (como workers síncronos do gunicorn);
+- ASGI: atendidos por um único event loop, via AsyncClient.
+
+--latencia-db simula um banco remoto (atraso por consulta), que é onde um
+worker síncrono fica parado esperando I/O. Sem latência, o resultado mede
+basicamente CPU (GIL) e o ASGI tende a perder pelo custo das trocas de thread
+do ORM assíncrono.
+
+Uso:
+    python benchmark_autocomplete.py --email usuario@exemplo.com --concorrencia 30 --workers-wsgi 4 --latencia-db 20
+"""
+import argparse
+import asyncio
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from asgiref.sync import ThreadSensitiveContext
+
+# Configurar Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sistema_encomendas.settings')
+django.setup()
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from encomendas.models import Usuario
+
+TERMOS = ['a', 'di', 'pa', 'vi', 'co']
+
+
+def urls_de_busca():
+    nomes = ('search_produtos', 'search_clientes', 'search_fornecedores')
+    return [f'{reverse(nome)}?q={termo}' for termo in TERMOS for nome in nomes]
+
+
+def simular_latencia(segundos):
+    """Acrescenta `segundos` a cada consulta SQL (em qualquer thread)."""
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(segundos)
+        return execute(sql, params, many, context)
+
+    def instalar(sender, connection, **kwargs):
+        connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(instalar, weak=False)
+
+
+def resumo(nome, latencias, erros, duracao):
+    latencias = sorted(latencias)
+    p95 = latencias[int(len(latencias) * 0.95) - 1] if latencias else 0
+    print(
+        f'{nome:5} {len(latencias) / duracao:8.1f} req/s | '
+        f'p50 {statistics.median(latencias) * 1000 if latencias else 0:7.1f} ms | '
+        f'p95 {p95 * 1000:7.1f} ms | erros {erros}'
+    )
+
+
+def benchmark_wsgi(usuario, urls, requisicoes, concorrencia, workers):
+    latencias, erros = [], []
+    lock = threading.Lock()
+    local = threading.local()
+    clients = queue.Queue()
+    for _ in range(workers): # Logged in before timing starts
+        client = Client()
+        client.force_login(usuario)
+        clients.put(client)
+
+    def requisicao(url, enviada_em):
+        if not hasattr(local, 'client'): # One Client (and DB connection) per worker thread
+            local.client = clients.get()
+        status = local.client.get(url).status_code
+        with lock:
+            latencias.append(time.perf_counter() - enviada_em) # Includes time queued for a worker
+            if status != 200:
+                erros.append(status)
+
+    def fechar_conexoes(_):
+        connections.close_all()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        # Each client keeps one request in flight, like the ASGI run below
+        pendentes = [executor.submit(requisicao, urls[n % len(urls)], time.perf_counter()) for n in range(concorrencia)]
+        enviadas = concorrencia
+        while pendentes:
+            pendentes.pop(0).result()
+            if enviadas < requisicoes:
+                pendentes.append(executor.submit(requisicao, urls[enviadas % len(urls)], time.perf_counter()))
+                enviadas += 1
+        list(executor.map(fechar_conexoes, range(workers)))
+    resumo('WSGI', latencias, len(erros), time.perf_counter() - inicio)
+
+
+async def benchmark_asgi(usuario, urls, requisicoes, concorrencia):
+    latencias, erros = [], []
+
+    async def login():
+        client = AsyncClient()
+        async with ThreadSensitiveContext():
+            await client.aforce_login(usuario)
+        return client
+
+    clients = await asyncio.gather(*(login() for _ in range(concorrencia))) # Before timing starts
+
+    async def worker(client, indices):
+        for i in indices:
+            inicio = time.perf_counter()
+            # ASGIHandler gives each request its own context for sync_to_async
+            # (ORM) calls; AsyncClient does not, so do it here as a server would.
+            async with ThreadSensitiveContext():
+                status = (await client.get(urls[i % len(urls)])).status_code
+            latencias.append(time.perf_counter() - inicio)
+            if status != 200:
+                erros.append(status)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        worker(client, range(n, requisicoes, concorrencia)) for n, client in enumerate(clients)
+    ))
+    resumo('ASGI', latencias, len(erros), time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', required=True, help='Usuário (membro de alguma equipe) usado nas buscas')
+    parser.add_argument('--requisicoes', type=int, default=600)
+    parser.add_argument('--concorrencia', type=int, default=30, help='Clientes simultâneos')
+    parser.add_argument('--workers-wsgi', type=int, default=4, help='Threads atendendo no modo WSGI')
+    parser.add_argument('--latencia-db', type=float, default=0, help='Atraso por consulta, em ms')
+    args = parser.parse_args()
+
+    try:
+        usuario = Usuario.objects.get_by_natural_key(args.email)
+    except Usuario.DoesNotExist:
+        sys.exit(f'Usuário {args.email} não encontrado.')
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver'] # Host used by the test clients
+    if args.latencia_db:
+        simular_latencia(args.latencia_db / 1000)
+
+    urls = urls_de_busca()
+    print(
+        f'{args.requisicoes} requisições, {args.concorrencia} clientes, '
+        f'{args.workers_wsgi} workers WSGI, latência do banco {args.latencia_db} ms'
+    )
+    benchmark_wsgi(usuario, urls, args.requisicoes, args.concorrencia, args.workers_wsgi)
+    asyncio.run(benchmark_asgi(usuario, urls, args.requisicoes, args.concorrencia))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,70 @@
 # encomendas/admin.py
 from django.contrib import admin
+from django.core.cache import caches
+from django.db.models import Count
 from .models import (
     Cliente, Fornecedor, Produto, Encomenda, ItemEncomenda, Entrega,
     Usuario, Equipe, MembroEquipe, ConviteEquipe
 )
+from .paginacao import PaginatorEstimado
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.urls import reverse # Import reverse
 from django.utils.html import format_html # Import format_html
 
+FILTRO_CACHE = 'default'
+FILTRO_TIMEOUT = 60 * 60 # New values show up in the filter within the hour
+FILTRO_MAX_VALORES = 200
+
+
+class CachedAllValuesFilter(admin.AllValuesFieldListFilter):
+    """
+    AllValuesFieldListFilter without the SELECT DISTINCT over the whole table
+    on every changelist: the distinct values are cached and capped.
+    """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f'admin:filtro:{model._meta.label_lower}:{field_path}'
+        valores = self.lookup_choices # Still a lazy queryset here
+        self.lookup_choices = caches[FILTRO_CACHE].get_or_set(
+            key, lambda: list(valores[:FILTRO_MAX_VALORES]), FILTRO_TIMEOUT
+        )
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists of tables that grow without bound: no second COUNT for the
+    "N total" link, and the unfiltered count comes from the table statistics.
+    Subclasses set list_select_related to cover every relation list_display
+    (and the __str__ of the related objects) touches, so a page costs a fixed
+    number of queries.
+    """
+    show_full_result_count = False
+    paginator = PaginatorEstimado
+
 @admin.register(Cliente)
-class ClienteAdmin(admin.ModelAdmin):
+class ClienteAdmin(LargeTableAdmin):
     list_display = ['codigo', 'nome', 'bairro', 'telefone', 'equipe']
-    list_filter = ['equipe', 'bairro', 'created_at']
+    list_filter = ['equipe', ('bairro', CachedAllValuesFilter), 'created_at']
     search_fields = ['nome', 'codigo', 'endereco', 'equipe__nome']
     ordering = ['equipe', 'nome']
-    # If using Django 4.0+, you might need list_select_related = ['equipe'] for performance
+    list_select_related = ['equipe']
 
 @admin.register(Fornecedor)
-class FornecedorAdmin(admin.ModelAdmin):
+class FornecedorAdmin(LargeTableAdmin):
     list_display = ['codigo', 'nome', 'telefone', 'email', 'equipe']
     list_filter = ['equipe', 'created_at']
     search_fields = ['nome', 'codigo', 'contato', 'equipe__nome']
     ordering = ['equipe', 'nome']
+    list_select_related = ['equipe']
 
 @admin.register(Produto)
-class ProdutoAdmin(admin.ModelAdmin):
+class ProdutoAdmin(LargeTableAdmin):
     list_display = ['codigo', 'nome', 'categoria', 'preco_base', 'equipe']
-    list_filter = ['equipe', 'categoria', 'created_at']
+    list_filter = ['equipe', ('categoria', CachedAllValuesFilter), 'created_at']
     search_fields = ['nome', 'codigo', 'descricao', 'equipe__nome']
     ordering = ['equipe', 'nome']
+    list_select_related = ['equipe']
 
 
 class ItemEncomendaInline(admin.TabularInline):
@@ -68,9 +104,10 @@ class EntregaInline(admin.StackedInline):
 
 
 @admin.register(Encomenda)
-class EncomendaAdmin(admin.ModelAdmin):
+class EncomendaAdmin(LargeTableAdmin):
     list_display = ['numero_encomenda', 'cliente', 'equipe', 'status', 'valor_total', 'data_criacao']
-    list_filter = ['equipe', 'status', 'data_criacao', 'responsavel_criacao']
+    list_filter = ['equipe', 'status', 'data_criacao', ('responsavel_criacao', CachedAllValuesFilter)]
+    list_select_related = ['cliente__equipe', 'equipe']
     search_fields = ['numero_encomenda', 'cliente__nome', 'cliente__codigo', 'equipe__nome']
     ordering = ['-numero_encomenda']
     readonly_fields = ['numero_encomenda', 'data_criacao', 'valor_total', 'updated_at']
@@ -110,23 +147,26 @@ class EncomendaAdmin(admin.ModelAdmin):
 
 
 @admin.register(ItemEncomenda)
-class ItemEncomendaAdmin(admin.ModelAdmin):
+class ItemEncomendaAdmin(LargeTableAdmin):
     list_display = ['get_encomenda_link', 'produto', 'fornecedor', 'quantidade', 'preco_cotado', 'valor_total']
+    list_select_related = ['produto__equipe', 'fornecedor__equipe'] # Their __str__ shows the team
     list_filter = ['encomenda__equipe', 'encomenda__status', 'produto__categoria']
     search_fields = ['encomenda__numero_encomenda', 'produto__nome', 'fornecedor__nome', 'encomenda__equipe__nome']
     readonly_fields = ['valor_total']
     autocomplete_fields = ['encomenda', 'produto', 'fornecedor']
 
     def get_encomenda_link(self, obj):
-        link = reverse("admin:encomendas_encomenda_change", args=[obj.encomenda.pk])
-        return format_html('<a href="{}">#{}</a>', link, obj.encomenda.numero_encomenda)
+        # numero_encomenda is the primary key: no need to load the order
+        link = reverse("admin:encomendas_encomenda_change", args=[obj.encomenda_id])
+        return format_html('<a href="{}">#{}</a>', link, obj.encomenda_id)
     get_encomenda_link.short_description = 'Encomenda'
 
 
 @admin.register(Entrega)
-class EntregaAdmin(admin.ModelAdmin):
+class EntregaAdmin(LargeTableAdmin):
     list_display = ['get_encomenda_link', 'data_entrega', 'responsavel_entrega', 'data_entrega_realizada', 'entregue_por']
-    list_filter = ['encomenda__equipe', 'data_entrega', 'data_entrega_realizada', 'responsavel_entrega']
+    list_filter = ['encomenda__equipe', 'data_entrega', 'data_entrega_realizada', ('responsavel_entrega', CachedAllValuesFilter)]
+    list_select_related = False # Only encomenda_id is shown
     search_fields = ['encomenda__numero_encomenda', 'responsavel_entrega', 'entregue_por', 'encomenda__equipe__nome']
     # --- UPDATED readonly_fields ---
     readonly_fields = ['display_valor_restante', 'data_realizada'] # Use the method name here
@@ -150,8 +190,9 @@ class EntregaAdmin(admin.ModelAdmin):
     )
 
     def get_encomenda_link(self, obj):
-        link = reverse("admin:encomendas_encomenda_change", args=[obj.encomenda.pk])
-        return format_html('<a href="{}">#{}</a>', link, obj.encomenda.numero_encomenda)
+        # numero_encomenda is the primary key: no need to load the order
+        link = reverse("admin:encomendas_encomenda_change", args=[obj.encomenda_id])
+        return format_html('<a href="{}">#{}</a>', link, obj.encomenda_id)
     get_encomenda_link.short_description = 'Encomenda'
 
     # --- ADDED METHOD ---
@@ -173,21 +214,33 @@ class UsuarioAdmin(BaseUserAdmin):
     search_fields = ('nome_completo', 'email', 'identificacao')
 
 
+class MembroEquipeInline(admin.TabularInline):
+    # Members go through MembroEquipe (papel), so they are edited here rather than with filter_horizontal
+    model = MembroEquipe
+    extra = 0
+    autocomplete_fields = ['usuario']
+
+
 @admin.register(Equipe)
 class EquipeAdmin(admin.ModelAdmin):
     list_display = ('nome', 'administrador', 'ativa', 'get_member_count')
     list_filter = ('ativa',)
     search_fields = ('nome', 'administrador__nome_completo', 'administrador__email')
-    filter_horizontal = ('membros',)
+    list_select_related = ('administrador',)
+    inlines = [MembroEquipeInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(membros_count=Count('membroequipe'))
 
+    @admin.display(description='Nº Membros', ordering='membros_count')
     def get_member_count(self, obj):
-        return obj.membros.count()
-    get_member_count.short_description = 'Nº Membros'
+        return obj.membros_count
 
 
 @admin.register(MembroEquipe)
 class MembroEquipeAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'equipe', 'papel')
+    list_select_related = ('usuario', 'equipe')
     list_filter = ('equipe', 'papel')
     search_fields = ('usuario__nome_completo', 'usuario__email', 'equipe__nome')
     autocomplete_fields = ['usuario', 'equipe']
@@ -196,6 +249,7 @@ class MembroEquipeAdmin(admin.ModelAdmin):
 @admin.register(ConviteEquipe)
 class ConviteEquipeAdmin(admin.ModelAdmin):
     list_display = ('email', 'equipe', 'papel', 'status', 'criado_por', 'data_criacao', 'data_expiracao')
+    list_select_related = ('equipe', 'criado_por')
     list_filter = ('equipe', 'status', 'papel')
     search_fields = ('email', 'equipe__nome', 'criado_por__nome_completo')
     readonly_fields = ('data_criacao', 'data_resposta')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EncomendasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'encomendas'
+
+    def ready(self):
+        from . import signals # noqa: F401 (connects the receivers)
+        from . import vendor # noqa: F401 (registers the deploy check)
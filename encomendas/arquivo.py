@@ -0,0 +1,128 @@
+# encomendas/arquivo.py
+
+"""
+Archive of closed orders. Delivered and cancelled orders that nobody has
+touched for ARQUIVO_IDADE_DIAS move, with their items and delivery, from
+Encomenda/ItemEncomenda/Entrega to EncomendaArquivada/ItemEncomendaArquivado/
+EntregaArquivada. Lists, queues, searches and the conditional GET versions
+then only read the orders still in play; the archive is read on request
+(`?arquivo=1` on encomenda_list and encomenda_detail).
+
+Rows keep their primary keys, so an archived order keeps its number. The
+move runs in chunks of LOTE orders, each chunk in its own transaction: the
+orders are selected FOR UPDATE with the conditions checked again, copied
+with bulk_create and removed with raw DELETEs. Neither side sends signals:
+the derived data already reads both tables when it is recomputed (the sales
+rollup, the price index and the usage counter rebuild), so archiving moves
+no total. Only the team generations are bumped, for the cached lists, and
+the cached archive sums (valor_arquivado) dropped.
+
+Primary keys are never reused while newer rows exist. (MySQL before 8.0
+recomputes AUTO_INCREMENT from the highest id at restart; the age limit
+keeps the newest orders hot.)
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import team_cache
+from .models import (
+    Encomenda, EncomendaArquivada, Entrega, EntregaArquivada, ItemEncomenda, ItemEncomendaArquivado,
+)
+
+FECHADAS = ('entregue', 'cancelada')
+LOTE = 500 # Orders per transaction
+
+VALOR_CACHE = 'default'
+VALOR_TIMEOUT = 60 * 60 # Also covers archived rows removed with a deleted cliente/produto
+
+# Hot model -> archive model of the rows that belong to an order
+TABELAS = (
+    (Entrega, EntregaArquivada),
+    (ItemEncomenda, ItemEncomendaArquivado),
+)
+
+
+def idade():
+    return timedelta(days=getattr(settings, 'ARQUIVO_IDADE_DIAS', 365))
+
+
+def _campos(modelo):
+    """Columns copied into an archive model: all of them but the archiving date."""
+    return [campo.attname for campo in modelo._meta.concrete_fields if campo.name != 'arquivada_em']
+
+
+def candidatas(limite=None):
+    """Closed orders last changed before `limite` (default: now minus the archive age)."""
+    if limite is None:
+        limite = timezone.now() - idade()
+    return Encomenda.objects.filter(status__in=FECHADAS, updated_at__lt=limite)
+
+
+def _arquivar_lote(limite, depois_de, lote):
+    with transaction.atomic():
+        encomendas = list(
+            candidatas(limite).filter(pk__gt=depois_de).select_for_update()
+            .order_by('pk').values(*_campos(EncomendaArquivada))[:lote]
+        )
+        if not encomendas:
+            return []
+        pks = [encomenda['numero_encomenda'] for encomenda in encomendas]
+
+        EncomendaArquivada.objects.bulk_create(EncomendaArquivada(**encomenda) for encomenda in encomendas)
+        for quente, arquivo in TABELAS:
+            linhas = quente.objects.filter(encomenda_id__in=pks).values(*_campos(arquivo))
+            arquivo.objects.bulk_create((arquivo(**linha) for linha in linhas), batch_size=1000)
+
+        # Raw DELETEs: delete() would send post_delete for every row, uncounting
+        # the orders and recomputing rollups that already include the archive
+        for quente, _ in TABELAS:
+            quente.objects.filter(encomenda_id__in=pks)._raw_delete(quente.objects.db)
+        Encomenda.objects.filter(pk__in=pks)._raw_delete(Encomenda.objects.db)
+
+        equipe_ids = {encomenda['equipe_id'] for encomenda in encomendas}
+        for equipe_id in equipe_ids:
+            team_cache.bump_generation_on_commit(equipe_id)
+        transaction.on_commit(lambda: caches[VALOR_CACHE].delete_many([_valor_key(equipe_id) for equipe_id in equipe_ids]))
+    return pks
+
+
+def arquivar(limite=None, lote=LOTE):
+    """Moves every candidate order to the archive, `lote` orders per transaction. Returns how many moved."""
+    if limite is None:
+        limite = timezone.now() - idade()
+    total, ultimo = 0, 0
+    while True:
+        pks = _arquivar_lote(limite, ultimo, lote)
+        if not pks:
+            return total
+        total += len(pks)
+        ultimo = pks[-1]
+
+
+# --- Totals ---
+
+def _valor_key(equipe_id):
+    return f'arquivo:{equipe_id}:valor'
+
+
+def valor_arquivado(equipe_ids):
+    """
+    Sum of the archived items of these teams. Cached per team: the archive
+    only grows when arquivar() runs, which drops the cached sums.
+    """
+    cache = caches[VALOR_CACHE]
+    chaves = {_valor_key(equipe_id): equipe_id for equipe_id in equipe_ids}
+    valores = cache.get_many(chaves)
+    for chave, equipe_id in chaves.items():
+        if chave not in valores:
+            valores[chave] = ItemEncomendaArquivado.objects.filter(
+                encomenda__equipe_id=equipe_id,
+            ).aggregate(valor=Sum('valor_total'))['valor'] or Decimal('0.00')
+            cache.set(chave, valores[chave], VALOR_TIMEOUT)
+    return sum(valores.values(), Decimal('0.00'))
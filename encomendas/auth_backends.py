@@ -0,0 +1,79 @@
+# encomendas/auth_backends.py
+
+"""
+Authentication backends (settings.AUTHENTICATION_BACKENDS).
+"""
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics
+
+UserModel = get_user_model()
+
+USER_CACHE = 'default'
+USER_CACHE_TIMEOUT = 15 * 60
+
+# Never copied into the shared cache; loaded from the database if accessed.
+UNCACHED_FIELDS = ('password', 'token_reset_senha')
+
+
+def _user_key(user_id):
+    return f'user:{user_id}:fields'
+
+
+def invalidate_user(user_id):
+    """Drops the cached row; the next request loads the user from the database."""
+    caches[USER_CACHE].delete(_user_key(user_id))
+
+
+def invalidate_user_on_commit(user_id):
+    # After the commit, so a concurrent request cannot cache the old row again.
+    transaction.on_commit(partial(invalidate_user, user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that keeps the Usuario row of logged-in users in the shared cache.
+
+    AuthenticationMiddleware calls get_user() on every request; with this
+    backend that is a cache hit instead of a SELECT. The entry is dropped
+    whenever the user is saved or deleted (see signals.py), which includes
+    password changes: the session auth hash check then sees the new password
+    right away and other sessions are logged out as usual.
+
+    Only the field values are cached, without the password hash or the reset
+    token (UNCACHED_FIELDS): the session auth hash, an HMAC of the password
+    that sessions already store, is cached in their place.
+    """
+
+    def get_user(self, user_id):
+        cache = caches[USER_CACHE]
+        key = _user_key(user_id)
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.incr('auth.user_cache.hit')
+            user = self._from_cache(cached)
+            return user if self.user_can_authenticate(user) else None
+        metrics.incr('auth.user_cache.miss')
+        user = super().get_user(user_id)
+        if user is not None:
+            cache.set(key, self._to_cache(user), USER_CACHE_TIMEOUT)
+        return user
+
+    @staticmethod
+    def _to_cache(user):
+        fields = {
+            field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields if field.attname not in UNCACHED_FIELDS
+        }
+        return {'fields': fields, 'session_auth_hash': user.get_session_auth_hash()}
+
+    @staticmethod
+    def _from_cache(cached):
+        fields = cached['fields']
+        user = UserModel.from_db(None, list(fields), list(fields.values()))
+        user._session_auth_hash = cached['session_auth_hash']
+        return user
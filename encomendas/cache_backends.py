@@ -0,0 +1,117 @@
+# encomendas/cache_backends.py
+
+"""
+Two-tier cache backend: a per-process LRU in front of a shared cache.
+
+Reads try the local LRU first and fall back to the shared backend, copying
+hits into the local tier. Writes go to both. The local tier never sees other
+processes' writes, so its entries live at most LOCAL_TIMEOUT seconds; keys
+that embed a version (like the team generation keys from `team_cache`) are
+immutable and can safely be served locally for that whole period.
+
+    'team': {
+        'BACKEND': 'encomendas.cache_backends.TwoTierCache',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'SHARED_ALIAS': 'default',   # Alias of the shared cache in CACHES
+            'LOCAL_MAX_ENTRIES': 2000,   # LRU size per process
+            'LOCAL_TIMEOUT': 300,        # Upper bound for local entries
+        },
+    }
+"""
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+
+
+class TwoTierCache(BaseCache):
+
+    def __init__(self, server, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._shared_alias = options.pop('SHARED_ALIAS', 'default')
+        self._local_timeout = options.pop('LOCAL_TIMEOUT', 300)
+        local_max_entries = options.pop('LOCAL_MAX_ENTRIES', 1000)
+        super().__init__({**params, 'OPTIONS': options})
+        # LocMemCache keeps entries in LRU order and evicts the oldest ones.
+        self._local = LocMemCache(
+            f'two-tier:{server or self._shared_alias}',
+            {'TIMEOUT': self._local_timeout, 'OPTIONS': {'MAX_ENTRIES': local_max_entries}},
+        )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _local_backend_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        added = self.shared.add(key, value, self._timeout(timeout))
+        if added:
+            self._local.set(key, value, self._local_backend_timeout(timeout))
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        sentinel = object()
+        value = self._local.get(key, sentinel)
+        if value is not sentinel:
+            metrics.incr('cache.local_hit')
+            return value
+        value = self.shared.get(key, sentinel)
+        if value is sentinel:
+            metrics.incr('cache.miss')
+            return default
+        metrics.incr('cache.shared_hit')
+        self._local.set(key, value, self._local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        found = self._local.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            from_shared = self.shared.get_many(missing)
+            for key, value in from_shared.items():
+                self._local.set(key, value, self._local_timeout)
+            found.update(from_shared)
+        return {keys[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, self._timeout(timeout))
+        self._local.set(key, value, self._local_backend_timeout(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._local.touch(key, self._local_backend_timeout(timeout))
+        return self.shared.touch(key, self._timeout(timeout))
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._local.delete(key)
+        return self.shared.delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._local.has_key(key) or self.shared.has_key(key)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters must be shared: only the shared tier is authoritative.
+        key = self.make_and_validate_key(key, version=version)
+        self._local.delete(key)
+        return self.shared.incr(key, delta)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
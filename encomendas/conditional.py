@@ -0,0 +1,96 @@
+# encomendas/conditional.py
+
+"""
+Conditional GET (ETag / Last-Modified) for authenticated pages and JSON APIs.
+
+`conditional_page(version_func)` runs `version_func(request, *args, **kwargs)`
+before the view. It should do one cheap query and return
+`(etag_parts, last_modified)` (last_modified may be None), or None to skip
+conditional handling (e.g. the object does not exist; the view then answers
+as usual). When the client's validators still match, a 304 is returned
+without running the view; otherwise the view's response gets the validators.
+
+The ETag also varies on the user (and their profile's last update) and the
+CSRF cookie, since pages embed both,
+and conditional handling is skipped while flash messages are pending.
+
+Async views are supported; `version_func` stays synchronous and runs in
+the sync thread (sync_to_async).
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import metrics
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(
+        '|'.join(str(part) for part in parts).encode(), usedforsecurity=False
+    ).hexdigest()
+    return quote_etag(digest)
+
+
+def latest(*timestamps):
+    """Most recent of the given datetimes, ignoring None."""
+    timestamps = [ts for ts in timestamps if ts is not None]
+    return max(timestamps) if timestamps else None
+
+
+def conditional_page(version_func):
+    def decorator(view_func):
+        def _validators(request, *args, **kwargs):
+            """(etag, last_modified_ts), or None when the view should just run."""
+            if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+                return None
+            version = version_func(request, *args, **kwargs)
+            if version is None:
+                return None
+            etag_parts, last_modified = version
+            etag = make_etag(
+                request.user.pk, getattr(request.user, 'data_atualizacao', ''),
+                request.COOKIES.get('csrftoken', ''), request.get_full_path(), *etag_parts
+            )
+            return etag, int(last_modified.timestamp()) if last_modified else None
+
+        def _not_modified(request, validators):
+            response = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+            metrics.incr(f'conditional.{view_func.__name__}.{"not_modified" if response is not None else "full"}')
+            return response
+
+        def _finish(response, validators):
+            if response.status_code not in (200, 304):
+                return response
+            etag, last_modified_ts = validators
+            response.headers.setdefault('ETag', etag)
+            if last_modified_ts is not None:
+                response.headers.setdefault('Last-Modified', http_date(last_modified_ts))
+            # Per-user content: browsers may keep it but must revalidate each time
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        if iscoroutinefunction(view_func):
+            async def _wrapped_view(request, *args, **kwargs):
+                validators = await sync_to_async(_validators)(request, *args, **kwargs)
+                if validators is None:
+                    return await view_func(request, *args, **kwargs)
+                response = _not_modified(request, validators)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                return _finish(response, validators)
+        else:
+            def _wrapped_view(request, *args, **kwargs):
+                validators = _validators(request, *args, **kwargs)
+                if validators is None:
+                    return view_func(request, *args, **kwargs)
+                response = _not_modified(request, validators)
+                if response is None:
+                    response = view_func(request, *args, **kwargs)
+                return _finish(response, validators)
+
+        return wraps(view_func)(_wrapped_view)
+    return decorator
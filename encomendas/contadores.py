@@ -0,0 +1,149 @@
+# encomendas/contadores.py
+
+"""
+Usage counters stored on the catalog rows: how many orders a cliente has
+(`encomendas_count`, `ultima_encomenda`) and how many order items use a
+produto or fornecedor (`uso_count`, `ultimo_uso`), so the lists can sort
+and filter by popularity without counting anything.
+
+Counters move with relative `F()` updates inside the writing transaction:
+concurrent writers never overwrite each other's increments and a rollback
+takes the increment with it. Changes are grouped by delta, so a whole
+order's items cost one UPDATE per distinct delta and model. The update()
+calls send no signals and leave `updated_at` alone: a counter moving is not
+an edit of the cliente/produto/fornecedor.
+
+The last-use dates only move forward; deleting the latest order does not
+bring them back. `reconstruir_contadores` recomputes everything exactly.
+Archived orders (arquivo.py) still count: archiving leaves the counters
+alone and the rebuild reads both tables.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.db.models import Count, DateField, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import (
+    Cliente, Encomenda, EncomendaArquivada, Fornecedor, ItemEncomenda, ItemEncomendaArquivado, Produto,
+)
+
+
+def _dia(valor):
+    if isinstance(valor, datetime): # Encomenda.data_encomenda defaults to timezone.now
+        return timezone.localtime(valor).date() if timezone.is_aware(valor) else valor.date()
+    return valor
+
+
+def _aplicar(model, contador, campo_data, deltas, dia=None):
+    por_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if pk is not None and delta:
+            por_delta[delta].append(pk)
+    for delta, pks in por_delta.items():
+        valores = {contador: F(contador) + delta}
+        if delta > 0 and dia is not None:
+            dia_valor = Value(_dia(dia), output_field=DateField())
+            # GREATEST is NULL on MySQL/SQLite when the column is still empty
+            valores[campo_data] = Coalesce(Greatest(campo_data, dia_valor), dia_valor)
+        model.objects.filter(pk__in=pks).update(**valores)
+
+
+# --- Clientes ---
+
+def registrar_encomenda(encomenda, criada):
+    """Counts a new order, or an order whose cliente changed since it was loaded."""
+    anterior = None if criada else getattr(encomenda, '_cliente_contadores', None)
+    if anterior == encomenda.cliente_id:
+        return
+    deltas = Counter({encomenda.cliente_id: 1})
+    deltas[anterior] -= 1
+    _aplicar(Cliente, 'encomendas_count', 'ultima_encomenda', deltas, encomenda.data_encomenda)
+
+
+def remover_encomenda(encomenda):
+    cliente_id = getattr(encomenda, '_cliente_contadores', None) or encomenda.cliente_id
+    _aplicar(Cliente, 'encomendas_count', 'ultima_encomenda', {cliente_id: -1})
+
+
+# --- Produtos and fornecedores ---
+
+def _uso_anterior(item):
+    return getattr(item, '_uso_contadores', (None, None))
+
+
+def itens_alterados(itens, novos=False):
+    """(item, (previous produto, previous fornecedor)) of new items and of items moved since they were loaded."""
+    alterados = []
+    for item in itens:
+        anterior = (None, None) if novos else _uso_anterior(item)
+        if anterior != (item.produto_id, item.fornecedor_id):
+            alterados.append((item, anterior))
+    return alterados
+
+
+def registrar_itens(itens, dia, novos=False):
+    """
+    Counts new items (`novos`) and moves the count of items whose
+    produto/fornecedor changed since they were loaded. `dia` is the order
+    date.
+    """
+    produtos, fornecedores = Counter(), Counter()
+    for item, (produto_anterior, fornecedor_anterior) in itens_alterados(itens, novos):
+        produtos[item.produto_id] += 1
+        produtos[produto_anterior] -= 1
+        fornecedores[item.fornecedor_id] += 1
+        fornecedores[fornecedor_anterior] -= 1
+    _aplicar(Produto, 'uso_count', 'ultimo_uso', produtos, dia)
+    _aplicar(Fornecedor, 'uso_count', 'ultimo_uso', fornecedores, dia)
+
+
+def remover_itens(itens):
+    produtos, fornecedores = Counter(), Counter()
+    for item in itens:
+        produto_anterior, fornecedor_anterior = _uso_anterior(item)
+        produtos[produto_anterior or item.produto_id] -= 1
+        fornecedores[fornecedor_anterior or item.fornecedor_id] -= 1
+    _aplicar(Produto, 'uso_count', 'ultimo_uso', produtos)
+    _aplicar(Fornecedor, 'uso_count', 'ultimo_uso', fornecedores)
+
+
+def lembrar_itens(itens):
+    """After saving: the items' current produto/fornecedor become their counted state."""
+    for item in itens:
+        item._uso_contadores = (item.produto_id, item.fornecedor_id)
+
+
+# --- Rebuild ---
+
+def _por_linha(queryset, campo, agregado):
+    return Subquery(queryset.filter(**{campo: OuterRef('pk')}).values(campo).annotate(valor=agregado).values('valor'))
+
+
+def _contagem(modelos, campo):
+    """Rows of the hot and archive models pointing at the outer row."""
+    quente, arquivo = modelos
+    return Coalesce(_por_linha(quente.objects, campo, Count('pk')), 0) + Coalesce(_por_linha(arquivo.objects, campo, Count('pk')), 0)
+
+
+def _mais_recente(modelos, campo, campo_data):
+    quente, arquivo = (_por_linha(modelo.objects, campo, Max(campo_data)) for modelo in modelos)
+    # GREATEST is NULL on MySQL/SQLite when either side has no rows
+    return Coalesce(Greatest(quente, arquivo), quente, arquivo)
+
+
+def reconstruir_equipe(equipe_id):
+    """Recomputes every counter of a team with one UPDATE per model. Returns the rows updated."""
+    encomendas = (Encomenda, EncomendaArquivada)
+    atualizadas = Cliente.objects.filter(equipe_id=equipe_id).update(
+        encomendas_count=_contagem(encomendas, 'cliente'),
+        ultima_encomenda=_mais_recente(encomendas, 'cliente', 'data_encomenda'),
+    )
+    itens = (ItemEncomenda, ItemEncomendaArquivado)
+    for model, campo in ((Produto, 'produto'), (Fornecedor, 'fornecedor')):
+        atualizadas += model.objects.filter(equipe_id=equipe_id).update(
+            uso_count=_contagem(itens, campo),
+            ultimo_uso=_mais_recente(itens, campo, 'encomenda__data_encomenda'),
+        )
+    return atualizadas
@@ -0,0 +1,51 @@
+# encomendas/context_processors.py
+
+"""
+Template context processors (registered in settings.TEMPLATES).
+"""
+from django.utils.functional import cached_property
+
+from . import membership
+
+
+class Navegacao:
+    """Navigation data of the logged-in user, loaded on first access.
+
+    Templates use `navegacao.equipes`, `navegacao.convites_pendentes` and
+    `navegacao.equipe_atual` instead of `user.equipes...`, so pages that never
+    touch them do not pay for them and the others do at most one cache lookup.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def _membership(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return membership.Membership((), 0)
+        return membership.get_membership(user)
+
+    @property
+    def equipes(self):
+        return self._membership.equipes
+
+    @property
+    def convites_pendentes(self):
+        return self._membership.convites_pendentes
+
+    @cached_property
+    def equipe_atual(self):
+        """Entry (id, nome, papel) of the team in the URL, if the user belongs to it."""
+        match = self.request.resolver_match
+        equipe_id = match.kwargs.get('equipe_id') if match else None
+        if equipe_id is None:
+            return None
+        return next((equipe for equipe in self.equipes if equipe.id == str(equipe_id)), None)
+
+
+def navegacao(request):
+    # One instance per request, shared by every template rendered for it.
+    if not hasattr(request, '_navegacao'):
+        request._navegacao = Navegacao(request)
+    return {'navegacao': request._navegacao}
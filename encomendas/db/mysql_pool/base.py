@@ -0,0 +1,143 @@
+# encomendas/db/mysql_pool/base.py
+
+"""
+MySQL backend with a bounded, per-process connection pool.
+
+Use it as the ENGINE ('encomendas.db.mysql_pool') instead of
+'django.db.backends.mysql'. Django still "closes" the connection at the end of
+every request (CONN_MAX_AGE = 0), but closing now hands the physical
+connection back to the pool instead of tearing down the TCP socket. Session
+setup (OPTIONS['init_command'], isolation level, SQL_AUTO_IS_NULL) therefore
+runs once per physical connection, not once per request. There is one pool
+per alias and set of connection parameters, so a wrapper whose NAME changes
+(test databases) never gets a connection to the previous database.
+
+Pool settings go in a top-level 'POOL' key of the database settings:
+
+    'POOL': {
+        'MAX_SIZE': 10,        # Physical connections per process
+        'TIMEOUT': 10,         # Seconds to wait for a free connection
+        'MAX_LIFETIME': 1800,  # Recycle connections older than this (0 = never)
+        'PING_INTERVAL': 30,   # Ping before reuse if idle longer than this
+    }
+"""
+import threading
+
+from django.db.backends.mysql import base as mysql_base
+from django.utils.asyncio import async_unsafe
+
+from encomendas import metrics
+from .pool import ConnectionPool, PoolTimeout
+
+Database = mysql_base.Database
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10.0,
+    'MAX_LIFETIME': 1800.0,
+    'PING_INTERVAL': 30.0,
+}
+
+_pools = {} # (alias, connection parameters) -> pool
+_pools_lock = threading.Lock()
+
+
+def _identidade(conn_params):
+    """
+    Hashable form of the parameters a physical connection is opened with
+    (host, port, database, user, options...). Django changes NAME on the
+    fly (test database creation, parallel test clones): connections for the
+    new parameters must come from a new pool, never from the old one.
+    """
+    # 'conv' is the driver's converter table: the same for every connection
+    return tuple(sorted((chave, repr(valor)) for chave, valor in conn_params.items() if chave != 'conv'))
+
+
+def get_pool(alias, settings_dict, conn_params):
+    """Returns the process-wide pool for a database alias and its connection parameters, creating it once."""
+    chave = (alias, _identidade(conn_params))
+    pool = _pools.get(chave)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(chave)
+        if pool is None:
+            config = {**POOL_DEFAULTS, **settings_dict.get('POOL', {})}
+            database = conn_params.get('database', conn_params.get('db'))
+            pool = ConnectionPool(
+                connect=lambda: _connect(conn_params),
+                max_size=int(config['MAX_SIZE']),
+                timeout=float(config['TIMEOUT']),
+                max_lifetime=float(config['MAX_LIFETIME']),
+                ping_interval=float(config['PING_INTERVAL']),
+                name=f'{alias}:{database}',
+            )
+            # The alias moved to other parameters: the old pool's idle connections are not coming back
+            for (outro_alias, _), outro in _pools.items():
+                if outro_alias == alias:
+                    outro.close_idle()
+            _pools[chave] = pool
+    return pool
+
+
+def pool_stats():
+    """Stats of every pool in this process, keyed by 'alias:database'."""
+    return {pool.name: pool.stats() for pool in list(_pools.values())}
+
+
+def _connect(conn_params):
+    # The driver runs OPTIONS['init_command'] here, once per physical connection.
+    connection = Database.connect(**conn_params)
+    # Same mysqlclient workaround as Django's own get_new_connection()
+    if connection.encoders.get(bytes) is bytes:
+        connection.encoders.pop(bytes)
+    return connection
+
+
+metrics.register_collector('db_pool', pool_stats)
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+    """Django's MySQL wrapper, borrowing physical connections from a pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = self._pooled = None
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict, conn_params)
+        try:
+            self._pooled = pool.acquire()
+            self._pool = pool # Released to the pool it came from, whatever NAME says by then
+        except PoolTimeout as e:
+            # Surface as a regular DB error (wrapped into django.db.OperationalError)
+            raise Database.OperationalError(str(e)) from e
+        return self._pooled.raw
+
+    def init_connection_state(self):
+        if self._pooled is not None and self._pooled.initialized:
+            return # Session already configured when this connection was created
+        super().init_connection_state()
+        if self._pooled is not None:
+            self._pooled.initialized = True
+
+    @async_unsafe
+    def _close(self):
+        pooled, self._pooled = self._pooled, None
+        if pooled is None:
+            return super()._close()
+        pool = self._pool
+        # Closed inside atomic(): Django keeps referencing the connection, so
+        # it can never be shared. Same for connections that raised errors and
+        # no longer answer.
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+        if not discard and not self.get_autocommit():
+            # Switching autocommit back on at the next checkout would COMMIT
+            # whatever is pending, so roll it back now.
+            try:
+                with self.wrap_database_errors:
+                    self.connection.rollback()
+            except Exception:
+                discard = True
+        pool.release(pooled, discard=discard)
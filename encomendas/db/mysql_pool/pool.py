@@ -0,0 +1,199 @@
+# encomendas/db/mysql_pool/pool.py
+
+"""
+Driver-agnostic, bounded connection pool used by the `mysql_pool` backend.
+
+A pool owns physical DB-API connections created by a `connect` callable.
+Connections are handed out LIFO (the most recently used one is the most likely
+to still be alive), pinged before reuse when they have been idle for a while,
+and recycled after `max_lifetime` seconds. The pool is per process: after a
+fork the inherited sockets are forgotten, never closed, because the parent
+still owns them.
+"""
+import collections
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class PooledConnection:
+    """A physical connection plus the bookkeeping the pool needs."""
+
+    __slots__ = ('raw', 'created_at', 'last_used', 'initialized')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = self.last_used = time.monotonic()
+        # Set by the backend once its per-connection session setup has run
+        self.initialized = False
+
+
+class ConnectionPool:
+    """Bounded pool of physical connections with pre-ping health checks."""
+
+    def __init__(self, connect, max_size=10, timeout=10.0, max_lifetime=1800.0,
+                 ping_interval=30.0, name='default'):
+        self.name = name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = collections.deque()
+        self._size = 0 # Physical connections open: idle + in use
+        self._pid = os.getpid()
+        self._counters = collections.Counter()
+        self._wait_time = 0.0
+
+    # --- Checkout / checkin ---
+
+    def acquire(self):
+        """Returns a healthy PooledConnection, creating one if under the limit."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            pooled, create = self._checkout(deadline)
+            if create:
+                return self._create()
+            if self._is_healthy(pooled):
+                pooled.last_used = time.monotonic()
+                self._count('reused')
+                return pooled
+            # Dead connection: drop it and try again (maybe creating a new one)
+            self._count('ping_failures')
+            self._discard(pooled)
+
+    def release(self, pooled, discard=False):
+        """Returns a connection to the pool, or closes it if it should not be reused."""
+        if pooled is None:
+            return
+        if os.getpid() != self._pid:
+            return # Belongs to the parent process; nothing to hand back
+        if discard or self._is_expired(pooled):
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def close_idle(self):
+        """Closes every idle connection (e.g. on shutdown or in tests)."""
+        with self._cond:
+            idle, self._idle = list(self._idle), collections.deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+    # --- Metrics ---
+
+    def stats(self):
+        """Snapshot of the pool state and counters."""
+        with self._cond:
+            idle = len(self._idle)
+            size = self._size
+            counters = dict(self._counters)
+            wait_time = self._wait_time
+        return {
+            'max_size': self.max_size,
+            'size': size,
+            'idle': idle,
+            'in_use': size - idle,
+            'created': counters.get('created', 0),
+            'reused': counters.get('reused', 0),
+            'closed': counters.get('closed', 0),
+            'ping_failures': counters.get('ping_failures', 0),
+            'waits': counters.get('waits', 0),
+            'timeouts': counters.get('timeouts', 0),
+            'wait_time_ms': round(wait_time * 1000, 3),
+        }
+
+    # --- Internals ---
+
+    def _checkout(self, deadline):
+        """Takes an idle connection or a slot to create one; waits when full."""
+        with self._cond:
+            self._reset_after_fork()
+            waited_since = None
+            while True:
+                while self._idle:
+                    pooled = self._idle.pop()
+                    if self._is_expired(pooled):
+                        self._size -= 1
+                        self._close_raw(pooled)
+                        continue
+                    self._account_wait(waited_since)
+                    return pooled, False
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._account_wait(waited_since)
+                    return None, True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    self._account_wait(waited_since)
+                    raise PoolTimeout(
+                        f"Pool '{self.name}' esgotado: {self.max_size} conexões em uso "
+                        f"após {self.timeout}s de espera."
+                    )
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    self._counters['waits'] += 1
+                self._cond.wait(remaining)
+
+    def _count(self, name):
+        with self._cond: # Re-entrant: safe to call while already holding it
+            self._counters[name] += 1
+
+    def _account_wait(self, waited_since):
+        if waited_since is not None:
+            self._wait_time += time.monotonic() - waited_since
+
+    def _create(self):
+        try:
+            raw = self._connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._count('created')
+        return PooledConnection(raw)
+
+    def _is_expired(self, pooled):
+        return bool(self.max_lifetime) and time.monotonic() - pooled.created_at > self.max_lifetime
+
+    def _is_healthy(self, pooled):
+        if time.monotonic() - pooled.last_used < self.ping_interval:
+            return True
+        try:
+            # Never let the driver reconnect silently: a new socket would lose
+            # the session state set up when the connection was created.
+            pooled.raw.ping(False)
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, pooled):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close_raw(pooled)
+
+    def _close_raw(self, pooled):
+        self._count('closed')
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass # Already broken; nothing else to release
+
+    def _reset_after_fork(self):
+        # Called with the lock held.
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._idle = collections.deque()
+            self._size = 0
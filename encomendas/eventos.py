@@ -0,0 +1,82 @@
+# encomendas/eventos.py
+
+"""
+In-process pub/sub hub behind the per-team event stream (views.api_eventos_equipe).
+
+The hub carries no data: `publicar(equipe_id)` only wakes the streams of that
+team open in this process, which then read what changed from the database.
+The database stays the single source of truth, so a wake-up that is lost or
+arrives out of order costs nothing.
+
+Writes made by another worker never reach this hub. Streams therefore also
+poll: every `POLL_INTERVAL` seconds they compare the team generation
+(team_cache, shared by all processes) and query the database only when it
+moved.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+
+POLL_INTERVAL = 5 # Seconds between checks for writes made by other workers
+HEARTBEAT_INTERVAL = 15 # Keeps proxies from closing an idle stream
+STREAM_MAX_AGE = 5 * 60 # The browser reconnects (with Last-Event-ID) after this
+RETRY_MS = 3000
+
+_assinantes = defaultdict(set) # equipe_id -> {(loop, asyncio.Event)}
+_lock = threading.Lock()
+
+
+class Assinatura:
+    """Subscription of one stream to a team. Use as a context manager inside the event loop."""
+
+    def __init__(self, equipe_id):
+        self.equipe_id = str(equipe_id)
+        self.evento = asyncio.Event()
+        self._chave = (asyncio.get_running_loop(), self.evento)
+
+    def __enter__(self):
+        with _lock:
+            _assinantes[self.equipe_id].add(self._chave)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _lock:
+            assinantes = _assinantes[self.equipe_id]
+            assinantes.discard(self._chave)
+            if not assinantes:
+                del _assinantes[self.equipe_id]
+
+    async def esperar(self, timeout):
+        """True if woken by publicar(), False on timeout."""
+        try:
+            await asyncio.wait_for(self.evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.evento.clear()
+        return True
+
+
+def publicar(equipe_id):
+    """Wakes every stream of the team open in this process. Safe to call from any thread."""
+    with _lock:
+        assinantes = list(_assinantes.get(str(equipe_id), ()))
+    for loop, evento in assinantes:
+        try:
+            loop.call_soon_threadsafe(evento.set)
+        except RuntimeError: # Loop already closed; its stream is going away
+            pass
+
+
+def publicar_on_commit(equipe_id):
+    # Only after the commit: the stream must be able to read the change.
+    if equipe_id is not None:
+        transaction.on_commit(partial(publicar, equipe_id))
+
+
+def assinantes(equipe_id):
+    """Number of streams of a team open in this process."""
+    with _lock:
+        return len(_assinantes.get(str(equipe_id), ()))
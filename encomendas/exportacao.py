@@ -0,0 +1,450 @@
+# encomendas/exportacao.py
+
+"""
+Export and import of one team's data (commands export_equipe and
+import_equipe): backups, and moving a store to another installation.
+dumpdata/loaddata build an object per row, keep them all in memory and
+save them one by one; here rows travel as value lists, LOTE at a time.
+
+File format: gzip-compressed JSON Lines. The first line is a header (the
+team, the export time and the id range of each table). Then come the
+tables in dependency order, each as one line with its model and columns
+followed by one line per row: the list of values, in column order.
+
+Export reads each table in keyset chunks (pk > last pk, LOTE rows), all in
+one transaction: constant memory on every backend (MySQLdb buffers whole
+result sets, so .iterator() does not stream there), and under MySQL's
+REPEATABLE READ one consistent snapshot of the team.
+
+Import runs in one transaction, so a failed import leaves nothing behind.
+Members are matched to existing users by e-mail and created otherwise,
+password hash included. Every other integer id is remapped by adding an
+offset per table: zero when the exported id range is free here (order
+numbers are kept, e.g. when restoring a deleted team), past the highest
+id otherwise. An offset needs no lookup table, however many rows there
+are. Rows are written with raw multi-row INSERTs: timestamps are kept and
+no signals run, so the usage counters, the sales rollup, the price index
+and the change log are imported as they were exported, not recomputed.
+Run it while the tables are quiet: an order created meanwhile could take
+an id of the offset range, and the import then fails (and rolls back).
+
+Some columns are unique across the database, not per team (UNICOS): the
+códigos of clientes, produtos and fornecedores, and the username and
+identificação of users. Before anything is written the file is read up
+to those tables and every value another team (or user) already holds
+here is reported; nothing is imported then. `prefixo` prepends a string
+to the imported códigos instead (the word index is rebuilt for them);
+users have no such option, since their identificação is a document number.
+
+Not exported: groups, permissions and staff/superuser flags of the users,
+password reset tokens. Users created by an import are never staff or
+superusers, even from a file that carries the flags (older exports): they
+are reset and reported in `avisos`. `is_active` is kept, so an account
+disabled at the source stays disabled. The file holds password hashes:
+keep it as safe as the database.
+"""
+import gzip
+import json
+import time
+import uuid
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from . import membership, team_cache
+from .historico import MODELOS as MODELOS_HISTORICO
+from .models import (
+    AlteracaoEncomenda, Cliente, ConviteEquipe, Encomenda, EncomendaArquivada, Entrega, EntregaArquivada, Equipe,
+    Fornecedor, ItemEncomenda, ItemEncomendaArquivado, MembroEquipe, PalavraCliente, PalavraFornecedor, PalavraProduto,
+    PrecoFornecedor, Produto, Usuario, VendaClienteMensal, VendaMensal, atualizar_busca, palavras_busca,
+)
+
+FORMATO = 'encomendas.equipe'
+VERSAO = 1
+LOTE = 2000 # Rows per SELECT on export and per INSERT on import (fewer where the backend limits parameters)
+COMPRESSAO = 6 # gzip level: 9 costs about twice the CPU for a few % less
+
+# Archive tables share the primary keys of the hot tables (arquivo.py): one offset for both
+ESPACOS = {EncomendaArquivada: Encomenda, ItemEncomendaArquivado: ItemEncomenda, EntregaArquivada: Entrega}
+# Integer columns that point at a row without being a ForeignKey
+REFERENCIAS = {(AlteracaoEncomenda, 'encomenda_numero'): Encomenda}
+
+COLUNAS_OCULTAS = {Usuario: ('token_reset_senha', 'data_expiracao_token', 'is_staff', 'is_superuser')}
+PRIVILEGIOS = ('is_staff', 'is_superuser') # Never granted by an import
+
+# Columns unique across the database, not per team: another team here may already hold a value
+UNICOS = {Usuario: ('username', 'identificacao'), Cliente: ('codigo',), Produto: ('codigo',), Fornecedor: ('codigo',)}
+# Models whose código `prefixo` applies to, with their word index
+PREFIXAVEIS = {Cliente: PalavraCliente, Produto: PalavraProduto, Fornecedor: PalavraFornecedor}
+EXEMPLOS = 10 # Conflicting values listed per column
+
+
+def _tabelas(equipe_id):
+    """(model, rows of the team) in dependency order."""
+    usuarios = Q(pk__in=MembroEquipe.objects.filter(equipe_id=equipe_id).values('usuario_id')) | Q(
+        pk__in=Equipe.objects.filter(pk=equipe_id).values('administrador_id')
+    )
+    numeros = Q(encomenda_numero__in=Encomenda.objects.filter(equipe_id=equipe_id).values('pk')) | Q(
+        encomenda_numero__in=EncomendaArquivada.objects.filter(equipe_id=equipe_id).values('pk')
+    )
+    return (
+        (Usuario, Usuario.objects.filter(usuarios)),
+        (Equipe, Equipe.objects.filter(pk=equipe_id)),
+        (MembroEquipe, MembroEquipe.objects.filter(equipe_id=equipe_id)),
+        (ConviteEquipe, ConviteEquipe.objects.filter(equipe_id=equipe_id)),
+        (Cliente, Cliente.objects.filter(equipe_id=equipe_id)),
+        (Produto, Produto.objects.filter(equipe_id=equipe_id)),
+        (Fornecedor, Fornecedor.objects.filter(equipe_id=equipe_id)),
+        (PalavraCliente, PalavraCliente.objects.filter(equipe_id=equipe_id)),
+        (PalavraProduto, PalavraProduto.objects.filter(equipe_id=equipe_id)),
+        (PalavraFornecedor, PalavraFornecedor.objects.filter(equipe_id=equipe_id)),
+        (Encomenda, Encomenda.objects.filter(equipe_id=equipe_id)),
+        (ItemEncomenda, ItemEncomenda.objects.filter(encomenda__equipe_id=equipe_id)),
+        (Entrega, Entrega.objects.filter(encomenda__equipe_id=equipe_id)),
+        (EncomendaArquivada, EncomendaArquivada.objects.filter(equipe_id=equipe_id)),
+        (ItemEncomendaArquivado, ItemEncomendaArquivado.objects.filter(encomenda__equipe_id=equipe_id)),
+        (EntregaArquivada, EntregaArquivada.objects.filter(encomenda__equipe_id=equipe_id)),
+        (VendaMensal, VendaMensal.objects.filter(equipe_id=equipe_id)),
+        (VendaClienteMensal, VendaClienteMensal.objects.filter(equipe_id=equipe_id)),
+        (PrecoFornecedor, PrecoFornecedor.objects.filter(produto__equipe_id=equipe_id)),
+        (AlteracaoEncomenda, AlteracaoEncomenda.objects.filter(numeros)),
+    )
+
+
+def _colunas(model):
+    ocultas = COLUNAS_OCULTAS.get(model, ())
+    return [campo.attname for campo in model._meta.concrete_fields if campo.attname not in ocultas]
+
+
+def _remapeado(model):
+    """Whether the model's ids get an offset (users are matched by e-mail, UUIDs kept)."""
+    return model is not Usuario and not isinstance(model._meta.pk, models.UUIDField)
+
+
+def _json(valor):
+    # Not DjangoJSONEncoder: it cuts datetimes to milliseconds
+    if isinstance(valor, (datetime, date, dt_time)):
+        return valor.isoformat()
+    if isinstance(valor, (Decimal, uuid.UUID)):
+        return str(valor)
+    raise TypeError(f'{type(valor).__name__} não serializável')
+
+
+def taxa(linhas, segundos):
+    """' (N linhas/s)' for the commands' throughput reports."""
+    return f' ({linhas / segundos:.0f} linhas/s)' if linhas and segundos > 0 else ''
+
+
+# --- Export ---
+
+def exportar(equipe_id, caminho, lote=LOTE):
+    """
+    Writes the team to a .jsonl.gz file. Yields (model, rows, seconds) as
+    each table is written; the caller must exhaust it.
+    """
+    if not Equipe.objects.filter(pk=equipe_id).exists():
+        raise ValueError(f'Equipe {equipe_id} não encontrada.')
+    codificar = json.JSONEncoder(default=_json, ensure_ascii=False, separators=(',', ':')).encode
+    tabelas = _tabelas(equipe_id)
+    with transaction.atomic(), gzip.open(caminho, 'wt', encoding='utf-8', compresslevel=COMPRESSAO) as saida:
+        faixas = {}
+        for model, linhas in tabelas:
+            if _remapeado(model):
+                faixa = linhas.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+                if faixa['minimo'] is not None:
+                    faixas[model._meta.label_lower] = [faixa['minimo'], faixa['maximo']]
+        saida.write(codificar({
+            'formato': FORMATO, 'versao': VERSAO, 'equipe': str(equipe_id),
+            'exportado_em': timezone.now(), 'faixas': faixas,
+        }) + '\n')
+
+        for model, linhas in tabelas:
+            inicio = time.monotonic()
+            colunas = _colunas(model)
+            indice_pk = colunas.index(model._meta.pk.attname)
+            saida.write(codificar({'tabela': model._meta.label_lower, 'colunas': colunas}) + '\n')
+            total, ultimo = 0, None
+            while True:
+                pedaco = linhas.order_by('pk') if ultimo is None else linhas.filter(pk__gt=ultimo).order_by('pk')
+                pedaco = list(pedaco.values_list(*colunas)[:lote])
+                if not pedaco:
+                    break
+                saida.writelines(codificar(linha) + '\n' for linha in pedaco)
+                total += len(pedaco)
+                ultimo = pedaco[-1][indice_pk]
+            yield model, total, time.monotonic() - inicio
+
+
+# --- Import ---
+
+def _deslocamento(modelos, minimo, maximo):
+    """Offset of an id space: 0 if [minimo, maximo] is free, else past the highest id."""
+    if not any(model._base_manager.filter(pk__range=(minimo, maximo)).exists() for model in modelos):
+        return 0
+    maior = max(model._base_manager.aggregate(maior=Max('pk'))['maior'] or 0 for model in modelos)
+    return maior + 1 - minimo
+
+
+def _deslocamentos(faixas):
+    """Offset of each remapped model, from the id ranges in the header."""
+    por_espaco = {}
+    for label, (minimo, maximo) in faixas.items():
+        model = _MODELOS.get(label)
+        if model is None or not _remapeado(model):
+            raise ValueError(f'Tabela desconhecida: {label}')
+        espaco = ESPACOS.get(model, model)
+        anterior = por_espaco.get(espaco, (minimo, maximo))
+        por_espaco[espaco] = (min(minimo, anterior[0]), max(maximo, anterior[1]))
+    deslocamentos = {}
+    for espaco, (minimo, maximo) in por_espaco.items():
+        modelos = [espaco] + [arquivo for arquivo, quente in ESPACOS.items() if quente is espaco]
+        deslocamentos[espaco] = _deslocamento(modelos, minimo, maximo)
+    return deslocamentos
+
+
+def _valores_unicos(caminho):
+    """
+    {model: [{column: value}]} of the UNICOS columns in the file (users with
+    their e-mail). Stops at the first table after the last of them.
+    """
+    valores, restantes, model = {}, set(UNICOS), None
+    with gzip.open(caminho, 'rt', encoding='utf-8') as entrada:
+        linhas = _linhas(entrada)
+        next(linhas, None) # Header, checked by importar
+        for linha in linhas:
+            if isinstance(linha, dict):
+                restantes.discard(model)
+                if not restantes:
+                    break
+                model = _MODELOS.get(linha.get('tabela'))
+                colunas = linha.get('colunas', [])
+                if model in UNICOS:
+                    indices = [colunas.index(coluna) for coluna in UNICOS[model] + (('email',) if model is Usuario else ())]
+                    nomes = [colunas[indice] for indice in indices]
+                    valores[model] = []
+                continue
+            if model in UNICOS:
+                valores[model].append({nome: linha[indice] for nome, indice in zip(nomes, indices)})
+    return valores
+
+
+def _usados(model, coluna, candidatos):
+    """(value, e-mail or None) of the rows here holding one of the candidate values, LOTE values per query."""
+    candidatos = list(candidatos)
+    extra = ('email',) if model is Usuario else ()
+    for inicio in range(0, len(candidatos), LOTE):
+        filtro = {f'{coluna}__in': candidatos[inicio:inicio + LOTE]}
+        for valor, *email in model._base_manager.filter(**filtro).values_list(coluna, *extra):
+            yield valor, email[0] if email else None
+
+
+def _exemplos(valores):
+    valores = sorted(valores)
+    resto = f' e mais {len(valores) - EXEMPLOS}' if len(valores) > EXEMPLOS else ''
+    return ', '.join(valores[:EXEMPLOS]) + resto
+
+
+def _conflitos(valores, prefixo=''):
+    """One message per UNICOS column whose values from the file are already taken here."""
+    conflitos = []
+    for model in PREFIXAVEIS:
+        maximo = model._meta.get_field('codigo').max_length
+        codigos = {prefixo + linha['codigo'] for linha in valores.get(model, ())}
+        longos = {codigo for codigo in codigos if len(codigo) > maximo}
+        if longos:
+            conflitos.append(f'{model._meta.verbose_name_plural}: código com mais de {maximo} caracteres ({_exemplos(longos)})')
+        usados = {valor for valor, _ in _usados(model, 'codigo', codigos - longos)}
+        if usados:
+            conflitos.append(f'{model._meta.verbose_name_plural}: código já usado por outra equipe ({_exemplos(usados)})')
+
+    # Users known here by e-mail are reused as they are: only the new ones insert their values
+    usuarios = valores.get(Usuario, [])
+    existentes = {email for email, _ in _usados(Usuario, 'email', {linha['email'] for linha in usuarios})}
+    novos = [linha for linha in usuarios if linha['email'] not in existentes]
+    for coluna in UNICOS[Usuario]:
+        donos = {linha[coluna]: linha['email'] for linha in novos}
+        usados = {valor for valor, email in _usados(Usuario, coluna, donos) if email != donos.get(valor)}
+        if usados:
+            nome = Usuario._meta.get_field(coluna).verbose_name
+            conflitos.append(f'{Usuario._meta.verbose_name_plural}: {nome} já usado por outro usuário ({_exemplos(usados)})')
+    return conflitos
+
+
+def _reindexar(model, equipe_id, lote):
+    """Rebuilds the team's word index of `model` from its `busca` column, in keyset chunks."""
+    palavras = PREFIXAVEIS[model]
+    palavras.objects.filter(equipe_id=equipe_id).delete()
+    linhas, ultimo = model._base_manager.filter(equipe_id=equipe_id).order_by('pk'), None
+    while True:
+        pedaco = linhas if ultimo is None else linhas.filter(pk__gt=ultimo)
+        pedaco = list(pedaco.values_list('pk', 'busca')[:lote])
+        if not pedaco:
+            break
+        _inserir(palavras, [
+            palavras(equipe_id=equipe_id, objeto_id=pk, palavra=palavra)
+            for pk, busca in pedaco for palavra in palavras_busca(busca)
+        ], lote, com_pk=False)
+        ultimo = pedaco[-1][0]
+
+
+# Models in the file by label (the querysets are only built, never run)
+_MODELOS = {model._meta.label_lower: model for model, _ in _tabelas(None)}
+
+
+class _Tabela:
+    """Turns the rows of one table in the file into model instances with their ids remapped."""
+
+    def __init__(self, model, colunas, deslocamentos, usuarios, prefixo=''):
+        self.model = model
+        self.colunas = colunas
+        self.prefixo = prefixo if model in PREFIXAVEIS else ''
+        campos = {campo.attname: campo for campo in model._meta.concrete_fields}
+        conversores = []
+        for coluna in colunas:
+            campo = campos.get(coluna)
+            if campo is None:
+                raise ValueError(f'Coluna desconhecida: {model._meta.label_lower}.{coluna}')
+            if campo.primary_key and _remapeado(model):
+                destino = model
+            elif campo.is_relation:
+                destino = campo.related_model
+            else:
+                destino = REFERENCIAS.get((model, coluna))
+            if destino is Usuario:
+                conversores.append(usuarios.get)
+            elif destino is not None and _remapeado(destino):
+                conversores.append(self._somar(deslocamentos.get(ESPACOS.get(destino, destino), 0)))
+            else:
+                conversores.append(None)
+        self.conversores = conversores
+        self.historico = model is AlteracaoEncomenda
+        if self.historico:
+            # objeto_id points at the table named in the row's `modelo` column
+            self.objeto = colunas.index('objeto_id')
+            self.modelo = colunas.index('modelo')
+            self.deslocamento_objeto = {
+                nome: deslocamentos.get(espaco, 0) for espaco, nome in MODELOS_HISTORICO.items()
+            }
+
+    @staticmethod
+    def _somar(deslocamento):
+        return lambda valor: valor + deslocamento if valor is not None else None
+
+    def instancia(self, linha):
+        valores = [
+            valor if conversor is None else conversor(valor) for valor, conversor in zip(linha, self.conversores)
+        ]
+        if self.historico and valores[self.objeto] is not None:
+            valores[self.objeto] += self.deslocamento_objeto[valores[self.modelo]]
+        instancia = self.model(**dict(zip(self.colunas, valores)))
+        if self.prefixo:
+            instancia.codigo = self.prefixo + instancia.codigo
+            atualizar_busca(instancia, {}) # The código is part of the search copy
+        return instancia
+
+
+def _inserir(model, instancias, lote, com_pk=True):
+    """Raw multi-row INSERTs: no auto_now, no save(), no signals."""
+    campos = [campo for campo in model._meta.concrete_fields if com_pk or not campo.primary_key]
+    tamanho = max(1, min(lote, connection.ops.bulk_batch_size(campos, instancias)))
+    for inicio in range(0, len(instancias), tamanho):
+        model._base_manager._insert(instancias[inicio:inicio + tamanho], fields=campos, raw=True)
+
+
+def _usuarios(instancias, lote, avisos):
+    """
+    Old id -> id here of every exported user; users unknown here (by
+    e-mail) are created, without staff or superuser rights.
+    """
+    existentes = dict(Usuario.objects.filter(email__in=[usuario.email for usuario in instancias]).values_list('email', 'pk'))
+    novos = [usuario for usuario in instancias if usuario.email not in existentes]
+    for usuario in novos:
+        privilegios = [campo for campo in PRIVILEGIOS if getattr(usuario, campo)]
+        if privilegios:
+            avisos.append(f'{usuario.email}: {", ".join(privilegios)} removido(s) na importação.')
+        for campo in privilegios:
+            setattr(usuario, campo, False)
+    _inserir(Usuario, novos, lote, com_pk=False)
+    ids = dict(Usuario.objects.filter(email__in=[usuario.email for usuario in instancias]).values_list('email', 'pk'))
+    return {usuario.pk: ids[usuario.email] for usuario in instancias}
+
+
+def _linhas(entrada):
+    for numero, texto in enumerate(entrada, start=1):
+        try:
+            yield json.loads(texto)
+        except ValueError:
+            raise ValueError(f'Linha {numero} inválida: não é JSON.')
+
+
+def importar(caminho, lote=LOTE, prefixo='', avisos=None):
+    """
+    Reads a file written by `exportar` into this database, in one
+    transaction. Yields (model, rows, seconds) as each table is written;
+    the caller must exhaust it. `prefixo` is prepended to the códigos of
+    clientes, produtos and fornecedores; `avisos` (a list) receives what
+    was changed on the way in.
+    """
+    avisos = avisos if avisos is not None else []
+    with transaction.atomic(), gzip.open(caminho, 'rt', encoding='utf-8') as entrada:
+        linhas = _linhas(entrada)
+        cabecalho = next(linhas, None)
+        if not isinstance(cabecalho, dict) or cabecalho.get('formato') != FORMATO:
+            raise ValueError('Arquivo não é uma exportação de equipe.')
+        if cabecalho.get('versao') != VERSAO:
+            raise ValueError(f'Versão {cabecalho.get("versao")} do arquivo não suportada (esperada {VERSAO}).')
+        equipe_id = cabecalho['equipe']
+        if Equipe.objects.filter(pk=equipe_id).exists():
+            raise ValueError(f'A equipe {equipe_id} já existe neste banco.')
+        conflitos = _conflitos(_valores_unicos(caminho), prefixo)
+        if conflitos:
+            raise ValueError('Valores já usados neste banco: ' + '; '.join(conflitos) + '.')
+
+        deslocamentos = _deslocamentos(cabecalho['faixas'])
+        usuarios = {} # Filled by the first table, read by the later ones
+        tabela, pendentes = None, []
+
+        def gravar():
+            if tabela.model is Usuario:
+                usuarios.update(_usuarios(pendentes, lote, avisos))
+            else:
+                _inserir(tabela.model, pendentes, lote)
+            pendentes.clear()
+
+        for linha in linhas:
+            if isinstance(linha, dict): # Next table
+                if tabela is not None:
+                    gravar()
+                    yield tabela.model, total, time.monotonic() - inicio
+                model = _MODELOS.get(linha.get('tabela'))
+                if model is None:
+                    raise ValueError(f'Tabela desconhecida: {linha.get("tabela")}')
+                tabela, total, inicio = _Tabela(model, linha['colunas'], deslocamentos, usuarios, prefixo), 0, time.monotonic()
+                continue
+            if tabela is None:
+                raise ValueError('Linha de dados antes do nome da tabela.')
+            pendentes.append(tabela.instancia(linha))
+            total += 1
+            # Users are kept until their table ends: they are matched all at once
+            if len(pendentes) >= lote and tabela.model is not Usuario:
+                gravar()
+        if tabela is not None:
+            gravar()
+            yield tabela.model, total, time.monotonic() - inicio
+
+        if prefixo:
+            for model in PREFIXAVEIS:
+                _reindexar(model, equipe_id, lote)
+
+        # Explicit ids do not move PostgreSQL sequences (MySQL and SQLite follow by themselves)
+        modelos = [model for model in _MODELOS.values() if _remapeado(model)]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), modelos):
+                cursor.execute(sql)
+
+        team_cache.bump_generation_on_commit(equipe_id)
+        membership.invalidate_on_commit(*usuarios.values())
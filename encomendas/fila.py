@@ -0,0 +1,120 @@
+# encomendas/fila.py
+
+"""
+Work queues: orders awaiting quotation, orders ready to deliver and
+scheduled deliveries, from which attendants and drivers claim items so two
+people never work on the same order.
+
+A claim is a lease: `reservada_por`/`reservada_ate` on the row. An item is
+free when it has no lease or the lease expired, so work abandoned by a
+closed tab returns to the queue by itself after FILA_LEASE seconds.
+
+Claiming runs `SELECT ... FOR UPDATE SKIP LOCKED` on backends that support
+it (MySQL 8, PostgreSQL): concurrent workers skip each other's rows instead
+of waiting on them, and each gets distinct items. Elsewhere (SQLite) it
+falls back to a conditional UPDATE that only takes rows still free, which
+is just as safe but may return fewer items than asked under contention.
+
+Claims are written with QuerySet.update(): no signals, so claiming does not
+invalidate the team caches nor move `updated_at`. Model saves of loaded rows
+leave the claim columns out (models.preservar_reserva), so an edit form
+holding an older copy does not undo a claim made meanwhile.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Encomenda, Entrega
+
+Fila = namedtuple('Fila', ['nome', 'descricao', 'model', 'itens', 'ordem'])
+
+FILAS = {
+    fila.nome: fila for fila in [
+        Fila('cotacao', 'Encomendas aguardando cotação', Encomenda,
+             lambda equipe_id: Encomenda.objects.filter(equipe_id=equipe_id, status='cotacao'),
+             ('data_criacao', 'numero_encomenda')),
+        Fila('pronta', 'Encomendas prontas para entrega', Encomenda,
+             lambda equipe_id: Encomenda.objects.filter(equipe_id=equipe_id, status='pronta'),
+             ('updated_at', 'numero_encomenda')),
+        Fila('entregas', 'Entregas programadas até hoje', Entrega,
+             lambda equipe_id: Entrega.objects.filter(
+                 encomenda__equipe_id=equipe_id,
+                 data_prevista__lte=timezone.localdate(),
+                 data_realizada__isnull=True,
+             ).exclude(encomenda__status='cancelada'),
+             ('data_prevista', 'id')),
+    ]
+}
+
+MAX_ITENS_POR_RESERVA = 20
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'FILA_LEASE', 15 * 60))
+
+
+def _livres(queryset, agora):
+    return queryset.filter(Q(reservada_ate__isnull=True) | Q(reservada_ate__lt=agora))
+
+
+def _minhas(queryset, usuario, agora):
+    return queryset.filter(reservada_por=usuario, reservada_ate__gte=agora)
+
+
+def reservar(fila, equipe_id, usuario, quantidade=1):
+    """Claims up to `quantidade` free items of a queue for `usuario`. Returns their pks."""
+    fila = FILAS[fila]
+    quantidade = max(1, min(quantidade, MAX_ITENS_POR_RESERVA))
+    agora = timezone.now()
+    ate = agora + lease()
+    candidatos = _livres(fila.itens(equipe_id), agora).order_by(*fila.ordem)
+
+    features = connection.features
+    if features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            trava = {'skip_locked': True}
+            if features.has_select_for_update_of:
+                trava['of'] = ('self',) # Do not lock the joined encomenda/cliente rows
+            pks = list(candidatos.select_for_update(**trava).values_list('pk', flat=True)[:quantidade])
+            fila.model.objects.filter(pk__in=pks).update(reservada_por=usuario, reservada_ate=ate)
+        return pks
+
+    # Fallback: the UPDATE re-checks that each row is still free, so a row
+    # taken in between by someone else is simply not claimed here.
+    pks = list(candidatos.values_list('pk', flat=True)[:quantidade])
+    _livres(fila.model.objects.filter(pk__in=pks), agora).update(reservada_por=usuario, reservada_ate=ate)
+    return list(
+        fila.model.objects.filter(pk__in=pks, reservada_por=usuario, reservada_ate=ate)
+        .order_by(*fila.ordem).values_list('pk', flat=True)
+    )
+
+
+def renovar(fila, equipe_id, usuario, pks):
+    """Extends the user's live leases on `pks`. Returns how many were extended."""
+    fila = FILAS[fila]
+    agora = timezone.now()
+    return _minhas(fila.itens(equipe_id).filter(pk__in=pks), usuario, agora).update(reservada_ate=agora + lease())
+
+
+def liberar(fila, equipe_id, usuario, pks):
+    """Gives the user's items back to the queue. Returns how many were released."""
+    fila = FILAS[fila]
+    # Not through fila.itens(): items that already left the queue are released too
+    queryset = fila.model.objects.filter(pk__in=pks, reservada_por=usuario)
+    if fila.model is Entrega:
+        queryset = queryset.filter(encomenda__equipe_id=equipe_id)
+    else:
+        queryset = queryset.filter(equipe_id=equipe_id)
+    return queryset.update(reservada_por=None, reservada_ate=None)
+
+
+def resumo(fila, equipe_id, usuario):
+    """(free items, the user's claimed items queryset) of a queue."""
+    fila = FILAS[fila]
+    agora = timezone.now()
+    itens = fila.itens(equipe_id)
+    return _livres(itens, agora).count(), _minhas(itens, usuario, agora).order_by(*fila.ordem)
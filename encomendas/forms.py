@@ -4,6 +4,34 @@ from django.forms import inlineformset_factory, BaseInlineFormSet
 from .models import Encomenda, Cliente, Produto, Fornecedor, ItemEncomenda, Entrega, Equipe # Import Equipe
 from datetime import date
 
+# --- Select filled client-side from the team catalog snapshot ---
+class CatalogoSelect(forms.Select):
+    """
+    Select that only renders the empty and the selected option(s). The full
+    option list comes from the team catalog snapshot (api_catalogo_equipe),
+    which the page loads once and the browser caches, instead of repeating
+    every produto/fornecedor/cliente in each item form. Validation still uses
+    the field's queryset.
+    """
+    def __init__(self, catalogo, attrs=None):
+        attrs = {**(attrs or {}), 'data-catalogo': catalogo}
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if v not in ('', None)]
+        choices = [('', self.choices.field.empty_label or '')]
+        if selected:
+            field = self.choices.field
+            for obj in field.queryset.filter(pk__in=selected):
+                choices.append((obj.pk, field.label_from_instance(obj)))
+        groups = []
+        for index, (option_value, option_label) in enumerate(choices):
+            groups.append((None, [self.create_option(
+                name, option_value, option_label, str(option_value) in value, index, attrs=attrs
+            )], index))
+        return groups
+
+
 # --- Base Forms for Cliente, Fornecedor, Produto ---
 # These might not need changes if 'equipe' is set in the view
 # Or, add 'equipe' to fields/exclude if needed.
@@ -55,7 +83,7 @@ class EncomendaForm(forms.ModelForm):
         # Exclude 'equipe' as it's set by the view context
         fields = ['cliente', 'data_encomenda', 'responsavel_criacao', 'status', 'observacoes']
         widgets = {
-            'cliente': forms.Select(attrs={'class': 'form-select'}), # Choices filtered in __init__
+            'cliente': CatalogoSelect('clientes', attrs={'class': 'form-select'}), # Choices filtered in __init__
             'data_encomenda': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'responsavel_criacao': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nome do responsável'}),
             'status': forms.Select(attrs={'class': 'form-select'}),
@@ -86,8 +114,8 @@ class ItemEncomendaForm(forms.ModelForm):
         model = ItemEncomenda
         fields = ['produto', 'fornecedor', 'quantidade', 'preco_cotado', 'observacoes']
         widgets = {
-            'produto': forms.Select(attrs={'class': 'form-select produto-select'}), # Filtered in __init__
-            'fornecedor': forms.Select(attrs={'class': 'form-select'}), # Filtered in __init__
+            'produto': CatalogoSelect('produtos', attrs={'class': 'form-select produto-select'}), # Filtered in __init__
+            'fornecedor': CatalogoSelect('fornecedores', attrs={'class': 'form-select fornecedor-select'}), # Filtered in __init__
             'quantidade': forms.NumberInput(attrs={'class': 'form-control', 'min': '1', 'value': '1'}),
             'preco_cotado': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': '0.00'}),
             'observacoes': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Observações do item (opcional)'}),
@@ -111,15 +139,10 @@ class ItemEncomendaForm(forms.ModelForm):
 
 # --- Base FormSet to pass kwargs to forms ---
 class BaseItemEncomendaFormSet(BaseInlineFormSet):
-    def __init__(self, *args, **kwargs):
-        # Pop the custom kwarg before passing to super
-        self.form_kwargs = kwargs.pop('form_kwargs', {})
-        super().__init__(*args, **kwargs)
-
-    def _construct_form(self, i, **kwargs):
-        # Pass the stored kwargs to each form instance
-        kwargs.update(self.form_kwargs)
-        return super()._construct_form(i, **kwargs)
+    # BaseFormSet stores form_kwargs itself and passes them to every form,
+    # empty_form included. Popping them here (as before) left self.form_kwargs
+    # empty, so the items never received their team and had no choices.
+    pass
 
 
 # --- ItemEncomenda Formset (Using the base class) ---
@@ -233,19 +256,44 @@ class FiltroEncomendaForm(forms.Form):
 
 
 # Simple search forms for team-specific lists
-class FiltroClienteForm(forms.Form):
+class FiltroCadastroForm(forms.Form):
+    """Sorting and usage filter shared by the cliente/produto/fornecedor lists (stored counters)."""
+    ORDEM_CHOICES = [
+        ('nome', 'Nome'),
+        ('uso', 'Mais usados'),
+        ('recentes', 'Usados recentemente'),
+    ]
+    USO_CHOICES = [
+        ('', 'Todos'),
+        ('usados', 'Já usados'),
+        ('sem_uso', 'Nunca usados'),
+    ]
+
+    ordem = forms.ChoiceField(
+        choices=ORDEM_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    uso = forms.ChoiceField(
+        choices=USO_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+
+class FiltroClienteForm(FiltroCadastroForm):
     search = forms.CharField(
         required=False,
         widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Buscar cliente...'})
     )
 
-class FiltroProdutoForm(forms.Form):
+class FiltroProdutoForm(FiltroCadastroForm):
     search = forms.CharField(
         required=False,
         widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Buscar produto...'})
     )
 
-class FiltroFornecedorForm(forms.Form):
+class FiltroFornecedorForm(FiltroCadastroForm):
     search = forms.CharField(
         required=False,
         widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Buscar fornecedor...'})
@@ -11,7 +11,7 @@ from django.conf import settings # Import settings
 import re
 
 # Import models from the main models file
-from .models import Usuario, MembroEquipe
+from .models import Usuario, MembroEquipe, normalizar_email
 
 # No need for this if Usuario is imported directly
 # Usuario = get_user_model()
@@ -106,9 +106,9 @@ class RegistroUsuarioForm(UserCreationForm):
 
     def clean_email(self):
         """Valida se o email já está registrado"""
-        email = self.cleaned_data.get('email')
-        # Case-insensitive check
-        if Usuario.objects.filter(email__iexact=email).exists():
+        email = normalizar_email(self.cleaned_data.get('email'))
+        # Stored lowercased, so the exact match covers any case
+        if Usuario.objects.filter(email=email).exists():
             raise ValidationError('Este email já está registrado.')
         return email
 
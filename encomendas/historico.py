@@ -0,0 +1,230 @@
+# encomendas/historico.py
+
+"""
+Change log of orders: who changed which field of an Encomenda, of its items
+or of its delivery, and when, in AlteracaoEncomenda. Append-only: rows are
+inserted and never updated.
+
+Saving or deleting a tracked row (signals.py) diffs its fields against the
+values it was loaded with and buffers one event; nothing is written then.
+The events of a transaction are written with a single bulk_create when it
+commits, so an order edit costs one extra INSERT however many items it
+touches. Successive saves of the same row in one transaction (the order
+form saves the order, then its total) are merged into one event.
+
+Each transaction gets one buffer, flushed by its own on_commit callback,
+so a rolled back transaction takes its events with it. Each event also
+queues a no-op marker callback: a rolled back savepoint drops its markers,
+and the flush leaves out the events whose marker is gone. Outside a transaction an event is written at once. Writes
+that skip signals (bulk_create/bulk_update/update) call `registrar`
+themselves.
+
+The acting user comes from HistoricoMiddleware; changes made outside a
+request (commands, shell) are recorded without one.
+"""
+import threading
+import weakref
+from contextvars import ContextVar
+
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import AlteracaoEncomenda, Encomenda, Entrega, ItemEncomenda
+
+CRIACAO, ALTERACAO, EXCLUSAO = 'criacao', 'alteracao', 'exclusao'
+
+# Tracked fields of each model (timestamps and queue claims are not changes)
+CAMPOS = {
+    Encomenda: ('cliente', 'equipe', 'data_encomenda', 'responsavel_criacao', 'status', 'observacoes', 'valor_total'),
+    ItemEncomenda: ('produto', 'fornecedor', 'quantidade', 'preco_cotado', 'valor_total', 'observacoes'),
+    Entrega: (
+        'data_entrega', 'responsavel_entrega', 'valor_pago_adiantamento', 'data_prevista', 'data_realizada',
+        'data_entrega_realizada', 'hora_entrega', 'entregue_por', 'assinatura_cliente', 'observacoes_entrega',
+    ),
+}
+MODELOS = {Encomenda: 'encomenda', ItemEncomenda: 'item', Entrega: 'entrega'}
+
+POR_PAGINA = 20 # Events per page of an order's history
+
+# A callable, not the user: asgiref inspects every context variable when it
+# copies the context, which would resolve a lazy request.user in async code
+_usuario = ContextVar('historico_usuario', default=None)
+
+
+def definir_usuario(obter_usuario):
+    """
+    Sets who the next events are attributed to: `obter_usuario` returns the
+    user and is only called when an event is recorded. Returns a token for `restaurar`.
+    """
+    return _usuario.set(obter_usuario)
+
+
+def restaurar(token):
+    _usuario.reset(token)
+
+
+def _usuario_id():
+    obter_usuario = _usuario.get()
+    usuario = obter_usuario() if obter_usuario is not None else None
+    return usuario.pk if usuario is not None and usuario.is_authenticated else None
+
+
+def _valores(instance):
+    # Through __dict__: never load a deferred field here
+    valores = {}
+    for campo in CAMPOS[type(instance)]:
+        attname = type(instance)._meta.get_field(campo).attname
+        if attname in instance.__dict__:
+            valores[campo] = instance.__dict__[attname]
+    return valores
+
+
+def lembrar(instance):
+    """Remembers the values the instance was loaded (or last recorded) with."""
+    instance._historico = _valores(instance)
+
+
+# --- Buffering ---
+
+def _juntar(eventos):
+    """Merges successive events of the same row into one; drops changes undone within the transaction."""
+    juntos, por_objeto = [], {}
+    for evento in eventos:
+        chave = (evento.modelo, evento.objeto_id)
+        anterior = por_objeto.get(chave) if evento.objeto_id is not None else None
+        if anterior is None or anterior.acao == EXCLUSAO or evento.acao != ALTERACAO:
+            juntos.append(evento)
+            por_objeto[chave] = evento
+            continue
+        for campo, (antes, depois) in evento.alteracoes.items():
+            if campo in anterior.alteracoes:
+                antes = anterior.alteracoes[campo][0]
+            anterior.alteracoes[campo] = [antes, depois]
+        if anterior.acao == ALTERACAO:
+            anterior.alteracoes = {campo: par for campo, par in anterior.alteracoes.items() if par[0] != par[1]}
+    return [evento for evento in juntos if evento.alteracoes]
+
+
+class _Marca:
+    """
+    on_commit callback standing for one buffered event. Django drops the
+    callbacks of a rolled back savepoint, and with them the only reference
+    to the marker; the buffer holds it weakly to tell which events survived.
+    """
+    __slots__ = ('__weakref__',)
+
+    def __call__(self):
+        pass
+
+
+_local = threading.local()
+
+
+def _novo_lote():
+    """Starts the buffer of the current transaction, written by its own on_commit callback."""
+    eventos = [] # (event, weak reference to its marker)
+
+    def gravar():
+        if getattr(_local, 'lote', None) is lote:
+            _local.lote = None
+        vivos = [evento for evento, marca in eventos if marca() is not None]
+        if vivos := _juntar(vivos):
+            AlteracaoEncomenda.objects.bulk_create(vivos)
+
+    # The buffer is alive while its callback is queued: a rollback drops it
+    lote = (eventos, weakref.ref(gravar))
+    transaction.on_commit(gravar)
+    return lote
+
+
+def _adicionar(evento):
+    """Buffers an event until the transaction commits. False outside a transaction."""
+    if not transaction.get_connection().in_atomic_block:
+        return False
+    lote = getattr(_local, 'lote', None)
+    if lote is None or lote[1]() is None:
+        lote = _local.lote = _novo_lote()
+    marca = _Marca()
+    transaction.on_commit(marca)
+    lote[0].append((evento, weakref.ref(marca)))
+    return True
+
+
+def registrar(instance, acao):
+    """Records a creation, change or deletion of a tracked row against the values it was loaded with."""
+    atuais = _valores(instance)
+    if acao == CRIACAO:
+        alteracoes = {campo: [None, valor] for campo, valor in atuais.items() if valor not in (None, '')}
+    elif acao == EXCLUSAO:
+        alteracoes = {campo: [valor, None] for campo, valor in atuais.items() if valor not in (None, '')}
+    else:
+        anteriores = getattr(instance, '_historico', {})
+        alteracoes = {
+            campo: [anteriores[campo], valor]
+            for campo, valor in atuais.items() if campo in anteriores and anteriores[campo] != valor
+        }
+        if not alteracoes:
+            return
+    instance._historico = atuais
+
+    evento = AlteracaoEncomenda(
+        encomenda_numero=instance.pk if isinstance(instance, Encomenda) else instance.encomenda_id,
+        modelo=MODELOS[type(instance)],
+        objeto_id=instance.pk,
+        acao=acao,
+        alteracoes=alteracoes,
+        usuario_id=_usuario_id(),
+        criado_em=timezone.now(),
+    )
+    if not _adicionar(evento):
+        AlteracaoEncomenda.objects.bulk_create([evento])
+
+
+def registrar_varios(instances, acao):
+    for instance in instances:
+        registrar(instance, acao)
+
+
+# --- Reading ---
+
+def pagina(numero, antes_de=None):
+    """
+    Events of an order, newest first, POR_PAGINA at a time. `antes_de` is the
+    id of the last event of the previous page (keyset pagination: every
+    page is an index range scan, however deep). Returns (events, next cursor or None).
+    """
+    eventos = AlteracaoEncomenda.objects.filter(encomenda_numero=numero).select_related('usuario').order_by('-id')
+    if antes_de is not None:
+        eventos = eventos.filter(id__lt=antes_de)
+    eventos = list(eventos[:POR_PAGINA + 1])
+    proximo = eventos[POR_PAGINA - 1].id if len(eventos) > POR_PAGINA else None
+    return eventos[:POR_PAGINA], proximo
+
+
+def _legivel(field, valor):
+    # Values come back from JSON: dates and times as ISO strings, decimals as strings
+    if valor is None or valor == '':
+        return '—'
+    if field.choices:
+        return dict(field.flatchoices).get(valor, valor)
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    if field.is_relation:
+        return f'#{valor}'
+    if isinstance(field, models.DateTimeField):
+        momento = parse_datetime(valor)
+        return (timezone.localtime(momento) if timezone.is_aware(momento) else momento).strftime('%d/%m/%Y %H:%M')
+    if isinstance(field, models.DateField):
+        return parse_date(valor[:10]).strftime('%d/%m/%Y') # A new order's default date is a datetime
+    return valor
+
+
+def descrever(evento):
+    """(field label, before, after) of each change of an event, for display."""
+    model = next(model for model, nome in MODELOS.items() if nome == evento.modelo)
+    linhas = []
+    for campo, (antes, depois) in evento.alteracoes.items():
+        field = model._meta.get_field(campo)
+        linhas.append((field.verbose_name, _legivel(field, antes), _legivel(field, depois)))
+    return linhas
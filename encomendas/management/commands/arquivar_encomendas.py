@@ -0,0 +1,33 @@
+# encomendas/management/commands/arquivar_encomendas.py
+
+"""
+Moves delivered and cancelled orders unchanged for ARQUIVO_IDADE_DIAS to
+the archive tables (arquivo.py), in chunks of one transaction each. Safe to
+stop and rerun at any time. Meant for cron, at night:
+
+    0 3 * * *  python manage.py arquivar_encomendas
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from encomendas import arquivo
+
+
+class Command(BaseCommand):
+    help = 'Move para o arquivo as encomendas entregues ou canceladas sem alterações há mais de N dias.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Idade mínima em dias. Padrão: ARQUIVO_IDADE_DIAS.')
+        parser.add_argument('--lote', type=int, default=arquivo.LOTE, help='Encomendas por transação.')
+
+    def handle(self, *args, **options):
+        if options['dias'] is not None and options['dias'] < 1:
+            raise CommandError('--dias deve ser pelo menos 1.')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser pelo menos 1.')
+        idade = timedelta(days=options['dias']) if options['dias'] is not None else arquivo.idade()
+
+        total = arquivo.arquivar(timezone.now() - idade, options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} encomenda(s) arquivada(s).'))
@@ -0,0 +1,37 @@
+# encomendas/management/commands/baixar_assets.py
+
+"""
+Downloads the pinned front-end libraries into encomendas/static/vendor/.
+
+The pages load these files from STATIC_ROOT, served by WhiteNoise with hashed
+names, so run this once (and commit the result, licences included) whenever a
+version in encomendas.vendor changes, then collectstatic. `check --deploy`
+fails while a pinned file is missing.
+"""
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encomendas.vendor import VENDOR_DIR, VENDOR_FILES
+
+
+class Command(BaseCommand):
+    help = 'Baixa as bibliotecas de front-end (Bootstrap, Select2, jQuery) para static/vendor/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Baixa novamente arquivos já existentes.')
+
+    def handle(self, *args, **options):
+        for url, relative_path in VENDOR_FILES:
+            destination = VENDOR_DIR / relative_path
+            if destination.exists() and not options['force']:
+                self.stdout.write(f'{relative_path} já existe.')
+                continue
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    content = response.read()
+            except OSError as e:
+                raise CommandError(f'Erro ao baixar {url}: {e}')
+            destination.write_bytes(content)
+            self.stdout.write(self.style.SUCCESS(f'{relative_path} ({len(content)} bytes)'))
@@ -0,0 +1,45 @@
+# encomendas/management/commands/export_equipe.py
+
+"""
+Writes one team (orders, archive, catalog, members, derived tables and
+change log) to a gzip-compressed JSON Lines file, reading in keyset chunks
+(exportacao.py). For backups and for stores that leave:
+
+    python manage.py export_equipe <equipe_id> equipe.jsonl.gz
+
+Read back with import_equipe.
+"""
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from encomendas import exportacao
+
+
+class Command(BaseCommand):
+    help = 'Exporta uma equipe para um arquivo JSON Lines compactado (gzip), para backup ou migração.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('equipe', help='ID da equipe.')
+        parser.add_argument('arquivo', help='Arquivo de saída (.jsonl.gz).')
+        parser.add_argument('--lote', type=int, default=exportacao.LOTE, help='Linhas por consulta.')
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser pelo menos 1.')
+        inicio, total = time.monotonic(), 0
+        try:
+            for model, linhas, segundos in exportacao.exportar(options['equipe'], options['arquivo'], options['lote']):
+                total += linhas
+                self.stdout.write(f'{model._meta.verbose_name_plural}: {linhas} linha(s) em {segundos:.1f}s{exportacao.taxa(linhas, segundos)}.')
+        except (ValueError, ValidationError) as e: # ValidationError: not a UUID
+            raise CommandError(e.messages[0] if isinstance(e, ValidationError) else str(e))
+
+        segundos = time.monotonic() - inicio
+        tamanho = os.path.getsize(options['arquivo']) / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} linha(s) exportada(s) em {segundos:.1f}s{exportacao.taxa(total, segundos)}; '
+            f'{tamanho:.1f} MB ({tamanho / max(segundos, 0.001):.1f} MB/s).'
+        ))
@@ -0,0 +1,40 @@
+# encomendas/management/commands/gerar_manifestos.py
+
+"""
+Builds the day's delivery manifests (manifesto.py) of every team ahead of
+time, so the first driver to open the page does not wait for it. Meant for
+cron, early in the morning:
+
+    30 6 * * *  python manage.py gerar_manifestos
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from encomendas import manifesto
+from encomendas.models import Entrega, Equipe
+
+
+class Command(BaseCommand):
+    help = 'Gera antecipadamente os roteiros de entrega do dia de cada equipe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dia', help='Dia (AAAA-MM-DD). Padrão: hoje.')
+
+    def handle(self, *args, **options):
+        try:
+            dia = date.fromisoformat(options['dia']) if options['dia'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('Use o formato AAAA-MM-DD em --dia.')
+
+        # Only teams with something to deliver in the manifest's window
+        equipes = Equipe.objects.filter(
+            pk__in=Entrega.objects.filter(data_prevista__range=manifesto.janela(dia)).values('encomenda__equipe_id'),
+        )
+        for equipe in equipes:
+            roteiro = manifesto.get_manifesto(equipe.id, dia)
+            self.stdout.write(
+                f'{equipe.nome}: {roteiro.total_entregas} entrega(s) em {len(roteiro.paradas)} bairro(s).'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Roteiros de {dia:%d/%m/%Y} gerados.'))
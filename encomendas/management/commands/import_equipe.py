@@ -0,0 +1,48 @@
+# encomendas/management/commands/import_equipe.py
+
+"""
+Reads a team written by export_equipe into this database, in one
+transaction, with raw multi-row INSERTs and ids remapped by offset
+(exportacao.py). The team must not exist here yet, and nothing is
+written if another team already uses one of its códigos (or another user
+one of its usernames or identificações); --prefixo renames the códigos:
+
+    python manage.py import_equipe equipe.jsonl.gz
+    python manage.py import_equipe equipe.jsonl.gz --prefixo L2-
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from encomendas import exportacao
+
+
+class Command(BaseCommand):
+    help = 'Importa uma equipe de um arquivo gerado por export_equipe, numa única transação.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo gerado por export_equipe (.jsonl.gz).')
+        parser.add_argument('--lote', type=int, default=exportacao.LOTE, help='Linhas por INSERT.')
+        parser.add_argument(
+            '--prefixo', default='',
+            help='Prefixo dos códigos de clientes, produtos e fornecedores (quando outra equipe já usa os mesmos).',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser pelo menos 1.')
+        inicio, total, avisos = time.monotonic(), 0, []
+        try:
+            for model, linhas, segundos in exportacao.importar(options['arquivo'], options['lote'], options['prefixo'], avisos):
+                total += linhas
+                self.stdout.write(f'{model._meta.verbose_name_plural}: {linhas} linha(s) em {segundos:.1f}s{exportacao.taxa(linhas, segundos)}.')
+        except (ValueError, OSError) as e: # OSError: missing file, not gzip
+            raise CommandError(f'{e} Nada foi importado.')
+        except DatabaseError as e: # E.g. a row created by another team during the import
+            raise CommandError(f'Erro do banco: {e}. Nada foi importado.')
+
+        for aviso in avisos:
+            self.stdout.write(self.style.WARNING(aviso))
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(f'{total} linha(s) importada(s) em {segundos:.1f}s{exportacao.taxa(total, segundos)}.'))
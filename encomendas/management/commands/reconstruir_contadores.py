@@ -0,0 +1,36 @@
+# encomendas/management/commands/reconstruir_contadores.py
+
+"""
+Recomputes the stored usage counters of clientes, produtos and fornecedores
+(see contadores.py) from the orders and their items, archived ones included.
+
+Each team is three set-based UPDATEs with correlated subqueries, run in the
+database; no rows are loaded into Python. Needed whenever the counters may
+have drifted (e.g. after a manual data fix in SQL) and to bring the last-use
+dates back after orders were deleted.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from encomendas import contadores
+from encomendas.models import Equipe
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores de uso de clientes, produtos e fornecedores a partir das encomendas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--equipe', action='append', default=[], help='ID da equipe (pode repetir). Padrão: todas.')
+
+    def handle(self, *args, **options):
+        equipes = Equipe.objects.order_by('nome')
+        if options['equipe']:
+            equipes = equipes.filter(id__in=options['equipe'])
+
+        total = 0
+        for equipe_id, nome in equipes.values_list('id', 'nome'):
+            with transaction.atomic():
+                linhas = contadores.reconstruir_equipe(equipe_id)
+            total += linhas
+            self.stdout.write(f'{nome}: {linhas} cadastro(s) atualizados.')
+        self.stdout.write(self.style.SUCCESS(f'Contadores de uso recalculados: {total} cadastro(s).'))
@@ -0,0 +1,32 @@
+# encomendas/management/commands/reconstruir_precos.py
+
+"""
+Rebuilds the supplier price index (PrecoFornecedor, see precos.py) from
+the hot and archived order items, per team, in one ordered pass over each table.
+
+Needed once after deploying the index and whenever it may have drifted
+(e.g. after a manual data fix in SQL).
+"""
+from django.core.management.base import BaseCommand
+
+from encomendas import precos
+from encomendas.models import Equipe, Produto
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de preços por fornecedor (PrecoFornecedor) a partir dos itens das encomendas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--equipe', action='append', default=[], help='ID da equipe (pode repetir). Padrão: todas.')
+
+    def handle(self, *args, **options):
+        equipes = Equipe.objects.order_by('nome')
+        if options['equipe']:
+            equipes = equipes.filter(id__in=options['equipe'])
+
+        total = 0
+        for equipe_id, nome in equipes.values_list('id', 'nome'):
+            linhas = precos.reconstruir(Produto.objects.filter(equipe_id=equipe_id).values('id'))
+            total += linhas
+            self.stdout.write(f'{nome}: {linhas} par(es) produto/fornecedor.')
+        self.stdout.write(self.style.SUCCESS(f'Índice de preços reconstruído: {total} linha(s).'))
@@ -0,0 +1,48 @@
+# encomendas/management/commands/reconstruir_vendas.py
+
+"""
+Rebuilds the sales rollup (VendaMensal, see vendas.py) from the hot and
+archived order items.
+
+Teams are independent, so they are rebuilt in parallel, one transaction and
+one database connection per team. Needed once after deploying the rollup
+and whenever it may have drifted (e.g. after a manual data fix in SQL).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from encomendas import vendas
+from encomendas.models import Equipe
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói as vendas mensais (VendaMensal) a partir dos itens das encomendas, em paralelo por equipe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--equipe', action='append', default=[], help='ID da equipe (pode repetir). Padrão: todas.')
+        parser.add_argument('--workers', type=int, default=4, help='Equipes reconstruídas ao mesmo tempo.')
+
+    def handle(self, *args, **options):
+        equipes = Equipe.objects.order_by('nome')
+        if options['equipe']:
+            equipes = equipes.filter(id__in=options['equipe'])
+        equipes = list(equipes.values_list('id', 'nome'))
+
+        def reconstruir(equipe):
+            try:
+                return equipe, vendas.reconstruir_equipe(equipe[0])
+            finally:
+                if options['workers'] > 1:
+                    connections.close_all() # Each worker thread opened its own connection
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as executor:
+                resultados = list(executor.map(reconstruir, equipes))
+        else:
+            resultados = [reconstruir(equipe) for equipe in equipes]
+
+        for (equipe_id, nome), linhas in resultados:
+            self.stdout.write(f'{nome}: {linhas} linha(s).')
+        self.stdout.write(self.style.SUCCESS(f'Vendas de {len(resultados)} equipe(s) reconstruídas.'))
@@ -0,0 +1,215 @@
+# encomendas/manifesto.py
+
+"""
+Daily delivery manifest of a team: the day's entregas (plus overdue ones)
+grouped by the client's bairro, with the bairros in a suggested route order.
+
+There are no coordinates, so the distance between two bairros is learned
+from the team's own history: the median time between consecutive completed
+deliveries in those bairros on the same day. Pairs never seen cost
+CUSTO_DESCONHECIDO. The route is a nearest-neighbour tour improved with
+2-opt, which is instant for the few dozen bairros a day has; it starts at
+the bairro routes usually start at, when known.
+
+Manifests are cached under a version of what they are built from: the
+count and latest updated_at of the entregas in the day's window, their
+orders and clients (one aggregate query). Changes elsewhere in the team,
+new orders, catalog edits, leave them alone, so the `gerar_manifestos`
+command can build the day's manifests each morning and the page stays warm
+until a delivery that is on them actually changes.
+"""
+import statistics
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Entrega
+
+ATRASO_MAX_DIAS = 7 # Undelivered entregas this many days late still show up
+DIAS_HISTORICO = 90
+INTERVALO_MAX = 120 # Minutes; longer gaps between deliveries are a new trip, not travel time
+CUSTO_DESCONHECIDO = 60 # Minutes assumed between bairros never delivered in sequence
+CUSTOS_CACHE = 'default'
+CUSTOS_TIMEOUT = 60 * 60 * 24 # History barely moves within a day
+MANIFESTO_CACHE = 'team'
+MANIFESTO_TIMEOUT = 60 * 60 * 24 # Built in the morning, kept for the day unless its entregas change
+
+ItemManifesto = namedtuple('ItemManifesto', [
+    'numero', 'cliente', 'endereco', 'telefone', 'data_prevista', 'a_receber',
+    'realizada', 'observacoes',
+])
+Parada = namedtuple('Parada', ['ordem', 'bairro', 'itens'])
+Manifesto = namedtuple('Manifesto', ['dia', 'paradas', 'total_entregas', 'total_a_receber', 'gerado_em'])
+
+
+def chave_bairro(bairro):
+    """'  centro ' and 'Centro' are the same stop."""
+    return ' '.join((bairro or '').split()).casefold()
+
+
+# --- Distances between bairros ---
+
+def _custos_da_historia(equipe_id):
+    """(costs, starts): median minutes per bairro pair and how often each bairro opened a route."""
+    realizadas = Entrega.objects.filter(
+        encomenda__equipe_id=equipe_id,
+        data_realizada__gte=timezone.now() - timedelta(days=DIAS_HISTORICO),
+        data_realizada__isnull=False,
+    ).order_by('data_realizada').values_list('data_realizada', 'encomenda__cliente__bairro')
+
+    intervalos = defaultdict(list)
+    inicios = Counter()
+    anterior_dia = anterior_bairro = anterior_hora = None
+    for data_realizada, bairro in realizadas.iterator():
+        dia = timezone.localdate(data_realizada)
+        bairro = chave_bairro(bairro)
+        if dia != anterior_dia:
+            inicios[bairro] += 1
+        elif bairro != anterior_bairro:
+            minutos = (data_realizada - anterior_hora).total_seconds() / 60
+            if minutos <= INTERVALO_MAX:
+                intervalos[frozenset((anterior_bairro, bairro))].append(minutos)
+        anterior_dia, anterior_bairro, anterior_hora = dia, bairro, data_realizada
+
+    custos = {par: statistics.median(minutos) for par, minutos in intervalos.items()}
+    return custos, inicios
+
+
+def custos_entre_bairros(equipe_id, hoje=None):
+    """Learned bairro distances of a team, cached for the day."""
+    hoje = hoje or timezone.localdate()
+    key = f'team:{equipe_id}:rotas:{hoje.isoformat()}'
+    cache = caches[CUSTOS_CACHE]
+    resultado = cache.get(key)
+    if resultado is None:
+        resultado = _custos_da_historia(equipe_id)
+        cache.set(key, resultado, CUSTOS_TIMEOUT)
+    return resultado
+
+
+# --- Route heuristic ---
+
+def _custo(custos, a, b):
+    return custos.get(frozenset((a, b)), CUSTO_DESCONHECIDO)
+
+
+def _comprimento(custos, rota):
+    return sum(_custo(custos, a, b) for a, b in zip(rota, rota[1:]))
+
+
+def _vizinho_mais_proximo(custos, bairros, inicio):
+    rota, restantes = [inicio], set(bairros) - {inicio}
+    while restantes:
+        # Ties by name, so the same input always gives the same route
+        proximo = min(restantes, key=lambda bairro: (_custo(custos, rota[-1], bairro), bairro))
+        rota.append(proximo)
+        restantes.remove(proximo)
+    return rota
+
+
+def _dois_opt(custos, rota):
+    """Reverses segments while that shortens the (open) route. The start stays put."""
+    melhorou = True
+    while melhorou:
+        melhorou = False
+        for i in range(1, len(rota) - 1):
+            for j in range(i + 1, len(rota)):
+                antes = _custo(custos, rota[i - 1], rota[i])
+                depois = _custo(custos, rota[i - 1], rota[j])
+                if j + 1 < len(rota):
+                    antes += _custo(custos, rota[j], rota[j + 1])
+                    depois += _custo(custos, rota[i], rota[j + 1])
+                if depois < antes:
+                    rota[i:j + 1] = reversed(rota[i:j + 1])
+                    melhorou = True
+    return rota
+
+
+def ordenar_bairros(bairros, custos, inicios=None):
+    """Suggested visiting order of `bairros` (normalised keys)."""
+    bairros = sorted(set(bairros))
+    if len(bairros) <= 1:
+        return bairros
+    conhecidos = [bairro for bairro in bairros if inicios and inicios[bairro]]
+    if conhecidos:
+        candidatos = [max(conhecidos, key=lambda bairro: (inicios[bairro], bairro))]
+    else:
+        candidatos = bairros # No history: best tour from any start
+    rota = min(
+        (_vizinho_mais_proximo(custos, bairros, inicio) for inicio in candidatos),
+        key=lambda rota: _comprimento(custos, rota),
+    )
+    return _dois_opt(custos, rota)
+
+
+# --- Manifest ---
+
+def janela(dia):
+    """data_prevista range covered by the manifest of `dia`."""
+    return dia - timedelta(days=ATRASO_MAX_DIAS), dia
+
+
+def _entregas(equipe_id, dia):
+    return Entrega.objects.filter(
+        encomenda__equipe_id=equipe_id,
+        # Indexed range: the day itself plus what is still pending from the days before
+        data_prevista__range=janela(dia),
+    )
+
+
+def _versao(equipe_id, dia):
+    """Changes whenever an entrega in the window, its order or its client changes (or one is removed)."""
+    versao = _entregas(equipe_id, dia).aggregate(
+        total=Count('pk'),
+        entregas_em=Max('updated_at'),
+        encomendas_em=Max('encomenda__updated_at'),
+        clientes_em=Max('encomenda__cliente__updated_at'),
+    )
+    return ':'.join(
+        str(round(valor.timestamp() * 1_000_000)) if hasattr(valor, 'timestamp') else str(valor)
+        for valor in versao.values()
+    )
+
+
+def _construir(equipe_id, dia):
+    entregas = _entregas(equipe_id, dia).exclude(
+        encomenda__status='cancelada',
+    ).select_related('encomenda__cliente').order_by('encomenda__cliente__endereco', 'encomenda_id')
+
+    por_bairro, nomes = defaultdict(list), {}
+    total_a_receber = Decimal('0.00')
+    for entrega in entregas:
+        if entrega.data_prevista < dia and entrega.data_realizada:
+            continue # Delivered on an earlier day
+        encomenda, cliente = entrega.encomenda, entrega.encomenda.cliente
+        a_receber = max(encomenda.valor_total - entrega.valor_pago_adiantamento, Decimal('0.00'))
+        if not entrega.data_realizada:
+            total_a_receber += a_receber
+        bairro = chave_bairro(cliente.bairro)
+        nomes.setdefault(bairro, ' '.join(cliente.bairro.split()) or 'Sem bairro')
+        por_bairro[bairro].append(ItemManifesto(
+            encomenda.numero_encomenda, cliente.nome, cliente.endereco, cliente.telefone,
+            entrega.data_prevista, a_receber, entrega.data_realizada is not None,
+            entrega.observacoes_entrega,
+        ))
+
+    custos, inicios = custos_entre_bairros(equipe_id)
+    rota = ordenar_bairros(por_bairro, custos, inicios)
+    paradas = [Parada(ordem, nomes[bairro], por_bairro[bairro]) for ordem, bairro in enumerate(rota, 1)]
+    total_entregas = sum(len(parada.itens) for parada in paradas)
+    return Manifesto(dia, paradas, total_entregas, total_a_receber, timezone.now())
+
+
+def get_manifesto(equipe_id, dia):
+    """Manifest of a team for `dia`, cached until the entregas it shows change."""
+    cache = caches[MANIFESTO_CACHE]
+    key = f'manifesto:{equipe_id}:{dia.isoformat()}:{_versao(equipe_id, dia)}'
+    roteiro = cache.get(key)
+    if roteiro is None:
+        roteiro = _construir(equipe_id, dia)
+        cache.set(key, roteiro, MANIFESTO_TIMEOUT)
+    return roteiro
@@ -0,0 +1,62 @@
+# encomendas/membership.py
+
+"""
+Per-user membership cache: the user's teams (with their role in each) and
+the number of pending invitations, as shown in the navigation.
+
+Entries live in the shared cache under `user:<id>:membership` and are
+deleted on commit whenever a MembroEquipe, an Equipe or a ConviteEquipe for
+the user changes (see `signals.py`). Deletion only works because the shared
+cache is the single copy: do not move this to the two-tier 'team' cache.
+"""
+from collections import namedtuple
+from functools import partial
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import ConviteEquipe, MembroEquipe
+
+MEMBERSHIP_CACHE = 'default'
+MEMBERSHIP_TIMEOUT = 60 * 60
+
+EquipeMenu = namedtuple('EquipeMenu', ['id', 'nome', 'papel'])
+Membership = namedtuple('Membership', ['equipes', 'convites_pendentes'])
+
+
+def _membership_key(usuario_id):
+    return f'user:{usuario_id}:membership'
+
+
+def _load(usuario):
+    equipes = tuple(
+        EquipeMenu(str(equipe_id), nome, papel)
+        for equipe_id, nome, papel in MembroEquipe.objects.filter(usuario=usuario)
+        .order_by('equipe__nome')
+        .values_list('equipe_id', 'equipe__nome', 'papel')
+    )
+    convites_pendentes = ConviteEquipe.objects.filter(
+        email=usuario.email, status='pendente'
+    ).count()
+    return Membership(equipes, convites_pendentes)
+
+
+def get_membership(usuario):
+    """Teams, roles and pending invite count of a user (cached)."""
+    cache = caches[MEMBERSHIP_CACHE]
+    key = _membership_key(usuario.pk)
+    membership = cache.get(key)
+    if membership is None:
+        membership = _load(usuario)
+        cache.set(key, membership, MEMBERSHIP_TIMEOUT)
+    return membership
+
+
+def invalidate(*usuario_ids):
+    caches[MEMBERSHIP_CACHE].delete_many([_membership_key(pk) for pk in usuario_ids if pk is not None])
+
+
+def invalidate_on_commit(*usuario_ids):
+    """Invalidates once the current transaction commits (see team_cache.bump_generation_on_commit)."""
+    if usuario_ids:
+        transaction.on_commit(partial(invalidate, *usuario_ids))
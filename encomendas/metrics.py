@@ -0,0 +1,66 @@
+# encomendas/metrics.py
+
+"""
+In-process metrics registry.
+
+Counters, timings and collectors live in module-level dictionaries so any
+subsystem (connection pool, caches, middleware...) can record values without
+extra dependencies. `snapshot()` returns everything as a JSON-friendly dict,
+which is what the staff-only `api_metrics` view exposes.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_collectors = {}
+
+
+def incr(name, amount=1):
+    """Increments a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, value):
+    """Records one observation (e.g. a duration in ms) for a timing summary."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            _timings[name] = {'count': 1, 'total': value, 'max': value}
+        else:
+            timing['count'] += 1
+            timing['total'] += value
+            if value > timing['max']:
+                timing['max'] = value
+
+
+def register_collector(name, func):
+    """Registers a callable evaluated lazily on every snapshot (gauges)."""
+    with _lock:
+        _collectors[name] = func
+
+
+def snapshot():
+    """Returns a copy of all metrics."""
+    with _lock:
+        counters = dict(_counters)
+        timings = {
+            name: dict(timing, avg=timing['total'] / timing['count'])
+            for name, timing in _timings.items()
+        }
+        collectors = dict(_collectors)
+    gauges = {}
+    for name, func in collectors.items():
+        try:
+            gauges[name] = func()
+        except Exception as e: # A broken collector must not break the endpoint
+            gauges[name] = {'error': str(e)}
+    return {'counters': counters, 'timings': timings, 'gauges': gauges}
+
+
+def reset():
+    """Clears counters and timings (collectors stay registered). Used by tests."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
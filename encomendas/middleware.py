@@ -0,0 +1,281 @@
+# encomendas/middleware.py
+
+"""
+Project middleware (registered in settings.MIDDLEWARE).
+"""
+import secrets
+import struct
+import time
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import historico, metrics
+
+try:
+    import brotli
+except ImportError: # Optional: without it only gzip is offered
+    brotli = None
+
+re_accepts_br = _lazy_re_compile(r'\bbr\b')
+re_accepts_gzip = _lazy_re_compile(r'\bgzip\b')
+
+# Types whose bodies are already compressed (PDF streams, images, archives)
+INCOMPRESSIBLE_PREFIXES = (
+    'application/pdf', 'application/zip', 'application/gzip', 'application/octet-stream',
+    'image/', 'audio/', 'video/', 'font/woff',
+)
+
+
+def _gzip_header(padding):
+    """gzip member header; with padding, a random-length FNAME like GZipMiddleware's."""
+    flags = 0x08 if padding is not None else 0  # FNAME
+    header = struct.pack('<4BIBB', 0x1f, 0x8b, zlib.DEFLATED, flags, 0, 0, 0xff)
+    if padding is not None:
+        header += b'a' * padding + b'\x00'
+    return header
+
+
+def _brotli_padding(padding):
+    """Brotli metadata meta-block of `padding` bytes (RFC 7932 section 9.2).
+
+    Brotli has no header field to pad, but decoders skip metadata blocks, and
+    the encoder output is byte-aligned after a flush, so the block can be
+    spliced in there.
+    """
+    if not padding:
+        return b''
+    # ISLAST=0, MNIBBLES=0 (bits 11), reserved 0, MSKIPBYTES=1, then MSKIPLEN-1 in 8 bits
+    skip = padding - 1
+    return bytes([0x16 | (skip & 0x03) << 6, skip >> 2]) + bytes(padding)
+
+
+class _Compressor:
+    """Incremental brotli/gzip compressor that keeps track of sizes and CPU time.
+
+    With `padding` (0 up to 256 bytes) the compressed body carries that many
+    throwaway bytes, so its length no longer tracks the plaintext exactly
+    (the BREACH mitigation of GZipMiddleware.max_random_bytes).
+    """
+
+    def __init__(self, encoding, padding=None):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+            self._compress = self._compressor.process
+            self._pending = self._compressor.flush() + _brotli_padding(padding) if padding else b''
+        else:
+            # Raw deflate with our own gzip header and trailer, so the header can be padded
+            self._compressor = zlib.compressobj(
+                getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), zlib.DEFLATED, -zlib.MAX_WBITS,
+            )
+            self._compress = self._compressor.compress
+            self._pending = _gzip_header(padding)
+            self._crc = 0
+        self.size_in = 0
+        self.size_out = 0
+        self.cpu_time = 0.0
+
+    def _timed(self, func, *args):
+        start = time.thread_time()
+        data = self._pending + func(*args)
+        self._pending = b''
+        self.cpu_time += time.thread_time() - start
+        self.size_out += len(data)
+        return data
+
+    def compress(self, data):
+        self.size_in += len(data)
+        if self.encoding == 'gzip':
+            self._crc = zlib.crc32(data, self._crc)
+        return self._timed(self._compress, data)
+
+    def flush(self):
+        # Emits what has been buffered so far, so streamed chunks reach the client.
+        if self.encoding == 'br':
+            return self._timed(self._compressor.flush)
+        return self._timed(self._compressor.flush, zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            data = self._timed(self._compressor.finish)
+        else:
+            data = self._timed(self._compressor.flush) + struct.pack('<2I', self._crc, self.size_in & 0xffffffff)
+            self.size_out += 8
+        self.record()
+        return data
+
+    def record(self):
+        metrics.incr(f'compression.{self.encoding}.responses')
+        metrics.incr(f'compression.{self.encoding}.bytes_in', self.size_in)
+        metrics.incr(f'compression.{self.encoding}.bytes_out', self.size_out)
+        if self.size_in:
+            metrics.observe(f'compression.{self.encoding}.ratio', self.size_out / self.size_in)
+        metrics.observe(f'compression.{self.encoding}.cpu_ms', self.cpu_time * 1000)
+
+
+class CompressionMiddleware:
+    """Brotli/gzip compression for HTML and JSON responses, streamed ones included.
+
+    Like django.middleware.gzip.GZipMiddleware, but negotiates brotli when the
+    client accepts it, skips bodies smaller than COMPRESSION_MIN_SIZE or of an
+    already-compressed type, and compresses StreamingHttpResponse chunk by
+    chunk so memory use does not grow with the body. Static files never get
+    here: WhiteNoise (above in MIDDLEWARE) serves its precompressed copies.
+
+    HTML pages carry CSRF tokens next to user input, so like GZipMiddleware
+    they get up to COMPRESSION_MAX_RANDOM_BYTES of random padding (BREACH).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 512)
+        self.max_random_bytes = min(getattr(settings, 'COMPRESSION_MAX_RANDOM_BYTES', 100), 256)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        # process_response only touches memory, no need to leave the event loop
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def _encoding(self, request):
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_br.search(accept_encoding):
+            return 'br'
+        if re_accepts_gzip.search(accept_encoding):
+            return 'gzip'
+        return None
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code == 304:
+            return response
+        content_type = response.get('Content-Type', '')
+        if content_type.startswith(INCOMPRESSIBLE_PREFIXES):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        # The response depends on Accept-Encoding from here on, compressed or not.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self._encoding(request)
+        if encoding is None:
+            return response
+
+        padding = None
+        if self.max_random_bytes and content_type.startswith('text/html'):
+            padding = secrets.randbelow(self.max_random_bytes)
+        compressor = _Compressor(encoding, padding)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async(compressor, response.streaming_content)
+            else:
+                response.streaming_content = self._compress_stream(compressor, response.streaming_content)
+            # Length is unknown until the last chunk has been compressed.
+            del response['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # The body bytes changed, so a strong ETag no longer identifies them.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def _compress_stream(compressor, chunks):
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def _compress_async(compressor, chunks):
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class HistoricoMiddleware:
+    """Attributes the changes made while handling a request to its user (historico.py).
+
+    Goes after AuthenticationMiddleware. request.user stays lazy: it is only
+    resolved when a change is recorded, always in sync code. It is reached
+    through a context variable, which sync_to_async copies into the worker thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = historico.definir_usuario(lambda: request.user)
+        try:
+            return self.get_response(request)
+        finally:
+            historico.restaurar(token)
+
+    async def __acall__(self, request):
+        token = historico.definir_usuario(lambda: request.user)
+        try:
+            return await self.get_response(request)
+        finally:
+            historico.restaurar(token)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoiseMiddleware that also runs natively under ASGI.
+
+    WhiteNoise 6.6 is sync-only, and Django runs a sync middleware (and so
+    every async view below it) through a single thread-sensitive executor,
+    serializing requests. Here only the static file lookup in autorefresh
+    mode (DEBUG) leaves the event loop; other requests go straight through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
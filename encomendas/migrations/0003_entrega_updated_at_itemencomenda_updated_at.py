@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0002_cliente_equipe_fornecedor_equipe_produto_equipe_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entrega',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='itemencomenda',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:27
+
+import encomendas.models
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import Lower, Trim
+
+BATCH_SIZE = 500
+
+
+def _lotes(queryset):
+    """Rows in primary key order, BATCH_SIZE at a time, without OFFSET."""
+    ultimo_pk = None
+    while True:
+        lote = queryset.order_by('pk')
+        if ultimo_pk is not None:
+            lote = lote.filter(pk__gt=ultimo_pk)
+        lote = list(lote.only('pk', 'email')[:BATCH_SIZE])
+        if not lote:
+            return
+        yield lote
+        ultimo_pk = lote[-1].pk
+
+
+def _donos_de_emails_repetidos(Usuario):
+    """{normalized e-mail: pk that gets it} for e-mails shared by several accounts.
+
+    Accounts differing only by case would break the unique index, so only one
+    per group is normalized: the one already stored normalized, else the
+    oldest. The others keep their e-mail (UsuarioManager.get_by_natural_key
+    still finds them by exact match) and must be merged by hand.
+    """
+    normalizado = Lower(Trim('email'))
+    repetidos = (
+        Usuario.objects.annotate(normalizado=normalizado).values('normalizado')
+        .annotate(total=Count('pk'), primeiro=Min('pk')).filter(total__gt=1)
+        .values_list('normalizado', 'primeiro')
+    )
+    donos = dict(repetidos)
+    if donos:
+        for pk, email in Usuario.objects.filter(email__in=list(donos)).values_list('pk', 'email'):
+            if email in donos:
+                donos[email] = pk
+    return donos
+
+
+def normalizar_emails(apps, schema_editor):
+    Usuario = apps.get_model('encomendas', 'Usuario')
+    ConviteEquipe = apps.get_model('encomendas', 'ConviteEquipe')
+
+    donos = _donos_de_emails_repetidos(Usuario)
+    for lote in _lotes(Usuario.objects.all()):
+        alterados = []
+        for usuario in lote:
+            email = (usuario.email or '').strip().lower()
+            if email == usuario.email or donos.get(email, usuario.pk) != usuario.pk:
+                continue
+            usuario.email = email
+            alterados.append(usuario)
+        Usuario.objects.bulk_update(alterados, ['email'])
+
+    for lote in _lotes(ConviteEquipe.objects.all()):
+        alterados = []
+        for convite in lote:
+            email = (convite.email or '').strip().lower()
+            if email != convite.email:
+                convite.email = email
+                alterados.append(convite)
+        ConviteEquipe.objects.bulk_update(alterados, ['email'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0003_entrega_updated_at_itemencomenda_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='usuario',
+            managers=[
+                ('objects', encomendas.models.UsuarioManager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='conviteequipe',
+            index=models.Index(fields=['email', 'status'], name='convite_email_status_idx'),
+        ),
+        migrations.RunPython(normalizar_emails, migrations.RunPython.noop),
+    ]
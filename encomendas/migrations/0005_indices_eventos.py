@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0004_normalizar_emails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='encomenda',
+            index=models.Index(fields=['equipe', 'updated_at'], name='encomenda_equipe_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entrega',
+            index=models.Index(fields=['updated_at'], name='entrega_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0005_indices_eventos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entrega',
+            index=models.Index(fields=['data_prevista'], name='entrega_data_prevista_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0006_entrega_data_prevista_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encomenda',
+            name='reservada_ate',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Reservada até'),
+        ),
+        migrations.AddField(
+            model_name='encomenda',
+            name='reservada_por',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Reservada por'),
+        ),
+        migrations.AddField(
+            model_name='entrega',
+            name='reservada_ate',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Reservada até'),
+        ),
+        migrations.AddField(
+            model_name='entrega',
+            name='reservada_por',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Reservada por'),
+        ),
+        migrations.AddIndex(
+            model_name='encomenda',
+            index=models.Index(fields=['equipe', 'status', 'reservada_ate'], name='encomenda_fila_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:43
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0007_fila_de_trabalho'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('status', models.CharField(choices=[('criada', 'Criada'), ('cotacao', 'Em Cotação'), ('aprovada', 'Aprovada'), ('em_andamento', 'Em Andamento'), ('pronta', 'Pronta para Entrega'), ('entregue', 'Entregue'), ('cancelada', 'Cancelada')], max_length=20, verbose_name='Status da Encomenda')),
+                ('quantidade', models.PositiveBigIntegerField(default=0, verbose_name='Quantidade')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Valor Total')),
+                ('itens', models.PositiveIntegerField(default=0, verbose_name='Itens')),
+            ],
+            options={
+                'verbose_name': 'Venda Mensal',
+                'verbose_name_plural': 'Vendas Mensais',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='encomenda',
+            index=models.Index(fields=['equipe', 'data_encomenda'], name='encomenda_equipe_data_idx'),
+        ),
+        migrations.AddField(
+            model_name='vendamensal',
+            name='equipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.equipe', verbose_name='Equipe'),
+        ),
+        migrations.AddField(
+            model_name='vendamensal',
+            name='fornecedor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.fornecedor', verbose_name='Fornecedor'),
+        ),
+        migrations.AddField(
+            model_name='vendamensal',
+            name='produto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.produto', verbose_name='Produto'),
+        ),
+        migrations.AddConstraint(
+            model_name='vendamensal',
+            constraint=models.UniqueConstraint(fields=('equipe', 'mes', 'produto', 'fornecedor', 'status'), name='venda_mensal_unica'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0008_vendas_mensais'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecoFornecedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultimo_preco', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Último Preço')),
+                ('ultima_cotacao', models.DateField(verbose_name='Última Cotação')),
+                ('amostras', models.PositiveSmallIntegerField(verbose_name='Cotações Consideradas')),
+                ('minimo', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Mínimo')),
+                ('maximo', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Máximo')),
+                ('media', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Média')),
+                ('p25', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='1º Quartil')),
+                ('mediana', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Mediana')),
+                ('p75', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='3º Quartil')),
+                ('ultimo_atipico', models.BooleanField(default=False, verbose_name='Último Preço Atípico')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.fornecedor', verbose_name='Fornecedor')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precos_fornecedores', to='encomendas.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Preço por Fornecedor',
+                'verbose_name_plural': 'Preços por Fornecedor',
+                'constraints': [models.UniqueConstraint(fields=('produto', 'fornecedor'), name='preco_fornecedor_unico')],
+            },
+        ),
+    ]
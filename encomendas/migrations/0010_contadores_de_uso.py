@@ -0,0 +1,77 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:50
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _por_linha(queryset, campo, agregado):
+    return Subquery(queryset.filter(**{campo: OuterRef('pk')}).values(campo).annotate(valor=agregado).values('valor'))
+
+
+def preencher_contadores(apps, schema_editor):
+    # Same set-based UPDATEs as contadores.reconstruir_equipe, for all teams at once
+    Encomenda = apps.get_model('encomendas', 'Encomenda')
+    ItemEncomenda = apps.get_model('encomendas', 'ItemEncomenda')
+    apps.get_model('encomendas', 'Cliente').objects.update(
+        encomendas_count=Coalesce(_por_linha(Encomenda.objects, 'cliente', Count('pk')), 0),
+        ultima_encomenda=_por_linha(Encomenda.objects, 'cliente', Max('data_encomenda')),
+    )
+    for model, campo in (('Produto', 'produto'), ('Fornecedor', 'fornecedor')):
+        apps.get_model('encomendas', model).objects.update(
+            uso_count=Coalesce(_por_linha(ItemEncomenda.objects, campo, Count('pk')), 0),
+            ultimo_uso=_por_linha(ItemEncomenda.objects, campo, Max('encomenda__data_encomenda')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0009_precos_fornecedores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='encomendas_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Encomendas'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='ultima_encomenda',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Última Encomenda'),
+        ),
+        migrations.AddField(
+            model_name='fornecedor',
+            name='ultimo_uso',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Último Uso'),
+        ),
+        migrations.AddField(
+            model_name='fornecedor',
+            name='uso_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Itens em Encomendas'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='ultimo_uso',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Último Uso'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='uso_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Itens em Encomendas'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['equipe', '-encomendas_count'], name='cliente_equipe_uso_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(fields=['equipe', '-uso_count'], name='fornecedor_equipe_uso_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['equipe', '-uso_count'], name='produto_equipe_uso_idx'),
+        ),
+        migrations.RunPython(preencher_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:55
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+# Columns each model's search copy is built from (models.CAMPOS_BUSCA at the time)
+CAMPOS_BUSCA = {
+    'Cliente': ('nome', 'codigo', 'endereco', 'bairro', 'telefone'),
+    'Fornecedor': ('nome', 'codigo', 'contato', 'email', 'telefone'),
+    'Produto': ('nome', 'codigo', 'categoria', 'descricao'),
+}
+
+
+def _normalizar(texto):
+    # Copy of models.normalizar_busca, frozen for this migration
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere))
+    return ' '.join(re.sub(r'[\W_]+', ' ', sem_acentos.casefold()).split())
+
+
+def preencher_busca(apps, schema_editor):
+    for nome_model, campos in CAMPOS_BUSCA.items():
+        model = apps.get_model('encomendas', nome_model)
+        ultimo_pk = 0
+        while True:
+            lote = list(model.objects.filter(pk__gt=ultimo_pk).order_by('pk').only('pk', *campos)[:BATCH_SIZE])
+            if not lote:
+                break
+            for obj in lote:
+                obj.nome_busca = _normalizar(obj.nome)[:200]
+                partes = (_normalizar(getattr(obj, campo)) for campo in campos)
+                obj.busca = ' ' + ' '.join(parte for parte in partes if parte)
+            model.objects.bulk_update(lote, ['nome_busca', 'busca'])
+            ultimo_pk = lote[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0010_contadores_de_uso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='busca',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='nome_busca',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='fornecedor',
+            name='busca',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fornecedor',
+            name='nome_busca',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='busca',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='nome_busca',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.RunPython(preencher_busca, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['equipe', 'nome_busca'], name='cliente_equipe_busca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(fields=['equipe', 'nome_busca'], name='fornecedor_equipe_busca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['equipe', 'nome_busca'], name='produto_equipe_busca_idx'),
+        ),
+    ]
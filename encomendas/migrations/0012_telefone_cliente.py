@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:57
+
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def _telefone_reverso(telefone):
+    # Copy of models.normalizar_telefone (reversed), frozen for this migration
+    digitos = re.sub(r'\D', '', telefone or '')
+    if digitos.startswith('55') and len(digitos) >= 12:
+        digitos = digitos[2:]
+    return digitos.lstrip('0')[::-1][:20]
+
+
+def preencher_telefones(apps, schema_editor):
+    Cliente = apps.get_model('encomendas', 'Cliente')
+    ultimo_pk = 0
+    while True:
+        lote = list(Cliente.objects.filter(pk__gt=ultimo_pk).order_by('pk').only('pk', 'telefone')[:BATCH_SIZE])
+        if not lote:
+            break
+        for cliente in lote:
+            cliente.telefone_reverso = _telefone_reverso(cliente.telefone)
+        Cliente.objects.bulk_update(lote, ['telefone_reverso'])
+        ultimo_pk = lote[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0011_busca_normalizada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_reverso',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(preencher_telefones, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['equipe', 'telefone_reverso'], name='cliente_equipe_telefone_idx'),
+        ),
+    ]
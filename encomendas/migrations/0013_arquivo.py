@@ -0,0 +1,80 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:07
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0012_telefone_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncomendaArquivada',
+            fields=[
+                ('numero_encomenda', models.IntegerField(primary_key=True, serialize=False, verbose_name='Número da Encomenda')),
+                ('data_criacao', models.DateTimeField(verbose_name='Data de Criação (sistema)')),
+                ('data_encomenda', models.DateField(verbose_name='Data')),
+                ('responsavel_criacao', models.CharField(max_length=100, verbose_name='Responsável')),
+                ('status', models.CharField(choices=[('criada', 'Criada'), ('cotacao', 'Em Cotação'), ('aprovada', 'Aprovada'), ('em_andamento', 'Em Andamento'), ('pronta', 'Pronta para Entrega'), ('entregue', 'Entregue'), ('cancelada', 'Cancelada')], max_length=20, verbose_name='Status')),
+                ('observacoes', models.TextField(blank=True, verbose_name='Observação')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10, verbose_name='Valor do Produto')),
+                ('updated_at', models.DateTimeField()),
+                ('arquivada_em', models.DateTimeField(auto_now_add=True, verbose_name='Arquivada em')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.cliente', verbose_name='Cliente')),
+                ('equipe', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='encomendas.equipe', verbose_name='Equipe Responsável')),
+            ],
+            options={
+                'verbose_name': 'Encomenda Arquivada',
+                'verbose_name_plural': 'Encomendas Arquivadas',
+                'ordering': ['-numero_encomenda'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntregaArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data_entrega', models.DateField(verbose_name='Data Entrega')),
+                ('responsavel_entrega', models.CharField(max_length=100, verbose_name='Responsável Entrega')),
+                ('valor_pago_adiantamento', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor Pago Adiantamento')),
+                ('data_entrega_realizada', models.DateField(blank=True, null=True, verbose_name='Data (Realizada)')),
+                ('hora_entrega', models.TimeField(blank=True, null=True, verbose_name='Hora (Realizada)')),
+                ('entregue_por', models.CharField(blank=True, max_length=100, verbose_name='Entregue por')),
+                ('assinatura_cliente', models.BooleanField(default=False, verbose_name='Ass. do Cliente')),
+                ('data_prevista', models.DateField(blank=True, null=True, verbose_name='Data Prevista (Controle Interno)')),
+                ('data_realizada', models.DateTimeField(blank=True, null=True, verbose_name='Data/Hora Realizada (Controle Interno)')),
+                ('observacoes_entrega', models.TextField(blank=True, verbose_name='Observações da Entrega')),
+                ('updated_at', models.DateTimeField()),
+                ('encomenda', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='entrega', to='encomendas.encomendaarquivada')),
+            ],
+            options={
+                'verbose_name': 'Entrega Arquivada',
+                'verbose_name_plural': 'Entregas Arquivadas',
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemEncomendaArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantidade', models.PositiveIntegerField(verbose_name='Quantidade')),
+                ('preco_cotado', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Preço Cotado')),
+                ('valor_total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor Total')),
+                ('observacoes', models.TextField(blank=True, verbose_name='Observações')),
+                ('updated_at', models.DateTimeField()),
+                ('encomenda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='encomendas.encomendaarquivada')),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.fornecedor', verbose_name='Fornecedor')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Item de Encomenda Arquivada',
+                'verbose_name_plural': 'Itens de Encomendas Arquivadas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='encomendaarquivada',
+            index=models.Index(fields=['equipe', 'data_encomenda'], name='arquivada_equipe_data_idx'),
+        ),
+    ]
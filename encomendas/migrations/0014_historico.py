@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:16
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0013_arquivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoEncomenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encomenda_numero', models.IntegerField(verbose_name='Número da Encomenda')),
+                ('modelo', models.CharField(choices=[('encomenda', 'Encomenda'), ('item', 'Item'), ('entrega', 'Entrega')], max_length=10, verbose_name='Registro')),
+                ('objeto_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID do Registro')),
+                ('acao', models.CharField(choices=[('criacao', 'Criação'), ('alteracao', 'Alteração'), ('exclusao', 'Exclusão')], max_length=10, verbose_name='Ação')),
+                ('alteracoes', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Alterações')),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data/Hora')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Alteração de Encomenda',
+                'verbose_name_plural': 'Alterações de Encomendas',
+                'indexes': [models.Index(fields=['encomenda_numero', 'id'], name='alteracao_encomenda_idx')],
+            },
+        ),
+    ]
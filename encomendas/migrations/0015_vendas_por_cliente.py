@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:57
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def preencher(apps, schema_editor):
+    """Same totals as vendas.reconstruir_equipe, for every team at once."""
+    VendaClienteMensal = apps.get_model('encomendas', 'VendaClienteMensal')
+    chaves = ('encomenda__equipe_id', 'mes_encomenda', 'encomenda__cliente_id', 'encomenda__status')
+    grupos = {}
+    for nome in ('ItemEncomenda', 'ItemEncomendaArquivado'):
+        itens = apps.get_model('encomendas', nome).objects.annotate(
+            mes_encomenda=TruncMonth('encomenda__data_encomenda'),
+        ).values(*chaves).annotate(
+            soma_quantidade=Sum('quantidade'), soma_valor=Sum('valor_total'), contagem=Count('pk'),
+        ).order_by()
+        for grupo in itens:
+            total = grupos.setdefault(tuple(grupo[chave] for chave in chaves), [0, Decimal('0.00'), 0])
+            total[0] += grupo['soma_quantidade'] or 0
+            total[1] += grupo['soma_valor'] or Decimal('0.00')
+            total[2] += grupo['contagem']
+    VendaClienteMensal.objects.bulk_create([
+        VendaClienteMensal(
+            equipe_id=equipe_id, mes=mes, cliente_id=cliente_id, status=status,
+            quantidade=quantidade, valor_total=valor_total, itens=itens,
+        )
+        for (equipe_id, mes, cliente_id, status), (quantidade, valor_total, itens) in grupos.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0014_historico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaClienteMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('status', models.CharField(choices=[('criada', 'Criada'), ('cotacao', 'Em Cotação'), ('aprovada', 'Aprovada'), ('em_andamento', 'Em Andamento'), ('pronta', 'Pronta para Entrega'), ('entregue', 'Entregue'), ('cancelada', 'Cancelada')], max_length=20, verbose_name='Status da Encomenda')),
+                ('quantidade', models.PositiveBigIntegerField(default=0, verbose_name='Quantidade')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Valor Total')),
+                ('itens', models.PositiveIntegerField(default=0, verbose_name='Itens')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.cliente', verbose_name='Cliente')),
+                ('equipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.equipe', verbose_name='Equipe')),
+            ],
+            options={
+                'verbose_name': 'Venda Mensal por Cliente',
+                'verbose_name_plural': 'Vendas Mensais por Cliente',
+                'constraints': [models.UniqueConstraint(fields=('equipe', 'mes', 'cliente', 'status'), name='venda_cliente_mensal_unica')],
+            },
+        ),
+        migrations.RunPython(preencher, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+PALAVRA_MAX = 40 # models.PALAVRA_MAX at the time
+
+
+def preencher_palavras(apps, schema_editor):
+    for nome_model in ('Cliente', 'Fornecedor', 'Produto'):
+        model = apps.get_model('encomendas', nome_model)
+        palavras = apps.get_model('encomendas', f'Palavra{nome_model}')
+        ultimo_pk = 0
+        while True:
+            lote = list(
+                model.objects.filter(pk__gt=ultimo_pk).order_by('pk').values_list('pk', 'equipe_id', 'busca')[:BATCH_SIZE]
+            )
+            if not lote:
+                break
+            palavras.objects.bulk_create([
+                palavras(objeto_id=pk, equipe_id=equipe_id, palavra=palavra)
+                for pk, equipe_id, busca in lote if equipe_id
+                for palavra in {palavra[:PALAVRA_MAX] for palavra in busca.split()}
+            ], batch_size=1000)
+            ultimo_pk = lote[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0015_vendas_por_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PalavraCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('palavra', models.CharField(max_length=40, verbose_name='Palavra')),
+                ('equipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.equipe', verbose_name='Equipe')),
+                ('objeto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='palavras', to='encomendas.cliente', verbose_name='Cliente')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['equipe', 'palavra', 'objeto'], name='palavracliente_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PalavraFornecedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('palavra', models.CharField(max_length=40, verbose_name='Palavra')),
+                ('equipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.equipe', verbose_name='Equipe')),
+                ('objeto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='palavras', to='encomendas.fornecedor', verbose_name='Fornecedor')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['equipe', 'palavra', 'objeto'], name='palavrafornecedor_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PalavraProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('palavra', models.CharField(max_length=40, verbose_name='Palavra')),
+                ('equipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.equipe', verbose_name='Equipe')),
+                ('objeto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='palavras', to='encomendas.produto', verbose_name='Produto')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['equipe', 'palavra', 'objeto'], name='palavraproduto_idx')],
+            },
+        ),
+        migrations.RunPython(preencher_palavras, migrations.RunPython.noop),
+    ]
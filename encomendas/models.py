@@ -1,14 +1,104 @@
 # encomendas/models.py
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from decimal import Decimal
 from django.conf import settings # Import settings if needed later, e.g. for AUTH_USER_MODEL
 
 # Imports moved from models_auth.py
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
+import re
+import unicodedata
 import uuid
 
+
+def normalizar_email(email):
+    """E-mails are stored lowercased, so lookups are exact matches on the indexed column."""
+    return (email or '').strip().lower()
+
+
+def normalizar_busca(texto):
+    """
+    'São José - Centro' -> 'sao jose centro': lowercased, accents and
+    punctuation removed, single spaces. Searches compare normalized input
+    against columns stored this way, so they need no case or accent folding.
+    """
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere))
+    return ' '.join(re.sub(r'[\W_]+', ' ', sem_acentos.casefold()).split())
+
+
+def normalizar_telefone(telefone):
+    """
+    Digits of a phone number without the +55 country code or a leading
+    trunk 0: '+55 (11) 98765-4321' and '011 98765 4321' -> '11987654321'.
+    """
+    digitos = re.sub(r'\D', '', telefone or '')
+    if digitos.startswith('55') and len(digitos) >= 12:
+        digitos = digitos[2:]
+    return digitos.lstrip('0')
+
+
+def atualizar_busca(instance, kwargs):
+    """
+    Fills `nome_busca` and `busca` from the model's CAMPOS_BUSCA before a
+    save. `busca` starts with a space, so " termo" matches the start of any
+    word; saves with update_fields also write the columns derived from them.
+    """
+    instance.nome_busca = normalizar_busca(instance.nome)[:200]
+    partes = (normalizar_busca(str(getattr(instance, campo) or '')) for campo in instance.CAMPOS_BUSCA)
+    instance.busca = ' ' + ' '.join(parte for parte in partes if parte)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and set(update_fields) & set(instance.CAMPOS_BUSCA):
+        kwargs['update_fields'] = set(update_fields) | {'nome_busca', 'busca'}
+
+
+PALAVRA_MAX = 40 # Longer words are indexed (and searched) by their first PALAVRA_MAX characters
+
+
+def palavras_busca(busca):
+    """Distinct words of a search copy, as stored in the word index."""
+    return {palavra[:PALAVRA_MAX] for palavra in busca.split()}
+
+
+def indexar_palavras(instance, update_fields=None):
+    """
+    Rewrites the instance's rows in its word index (PalavraBusca) after a
+    save that wrote `busca` or moved it to another team. Teamless rows are
+    not indexed: every search is scoped to teams.
+    """
+    if update_fields is not None and not {'busca', 'equipe', 'equipe_id'} & set(update_fields):
+        return
+    atuais = {
+        (equipe_id, palavra): pk for pk, equipe_id, palavra in instance.palavras.values_list('pk', 'equipe_id', 'palavra')
+    }
+    novas = {(instance.equipe_id, palavra) for palavra in palavras_busca(instance.busca)} if instance.equipe_id else set()
+    obsoletas = [pk for chave, pk in atuais.items() if chave not in novas]
+    if obsoletas:
+        instance.palavras.filter(pk__in=obsoletas).delete()
+    modelo = instance.palavras.model
+    modelo.objects.bulk_create([
+        modelo(objeto=instance, equipe_id=equipe_id, palavra=palavra) for equipe_id, palavra in novas - atuais.keys()
+    ])
+
+
+CAMPOS_RESERVA = ('reservada_por', 'reservada_ate')
+
+
+def preservar_reserva(instance, kwargs):
+    """
+    A full save() of a loaded row writes every column but the work queue
+    claim: fila.py sets it with QuerySet.update(), possibly after the row
+    was read, and an edit form saving its stale copy must not undo it.
+    """
+    if instance._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return
+    kwargs['update_fields'] = [
+        campo.name for campo in instance._meta.concrete_fields
+        if not campo.primary_key and campo.name not in CAMPOS_RESERVA
+    ]
+
 # --- Equipe Model (needed before Cliente, Fornecedor, Produto if FK is mandatory) ---
 # Assuming Equipe model exists as previously defined
 class Equipe(models.Model):
@@ -117,6 +207,15 @@ class Cliente(models.Model):
     bairro = models.CharField(max_length=100, verbose_name="Bairro")
     referencia = models.CharField(max_length=200, blank=True, verbose_name="Referência")
     telefone = models.CharField(max_length=20, blank=True, verbose_name="Telefone")
+    # Usage counters, maintained by contadores.py
+    encomendas_count = models.IntegerField(default=0, editable=False, verbose_name="Encomendas")
+    ultima_encomenda = models.DateField(null=True, blank=True, editable=False, verbose_name="Última Encomenda")
+    # Normalized copies for searching (normalizar_busca), filled on save
+    nome_busca = models.CharField(max_length=200, blank=True, editable=False)
+    busca = models.TextField(blank=True, editable=False)
+    # normalizar_telefone() reversed: a number typed without its area code is
+    # a prefix of this column, so the lookup stays an index range scan
+    telefone_reverso = models.CharField(max_length=20, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -124,8 +223,24 @@ class Cliente(models.Model):
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['equipe', 'nome_busca'], name='cliente_equipe_busca_idx'),
+            models.Index(fields=['equipe', '-encomendas_count'], name='cliente_equipe_uso_idx'),
+            models.Index(fields=['equipe', 'telefone_reverso'], name='cliente_equipe_telefone_idx'),
+        ]
         # unique_together = ('equipe', 'codigo') # Enforce code uniqueness per team if needed
 
+    CAMPOS_BUSCA = ('nome', 'codigo', 'endereco', 'bairro', 'telefone')
+
+    def save(self, *args, **kwargs):
+        atualizar_busca(self, kwargs)
+        self.telefone_reverso = normalizar_telefone(self.telefone)[::-1][:20]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'telefone' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'telefone_reverso'}
+        super().save(*args, **kwargs)
+        indexar_palavras(self, kwargs.get('update_fields'))
+
     def __str__(self):
         team_name = f" ({self.equipe.nome})" if self.equipe else ""
         return f"{self.codigo} - {self.nome}{team_name}"
@@ -146,6 +261,12 @@ class Fornecedor(models.Model):
     contato = models.CharField(max_length=200, blank=True, verbose_name="Contato")
     telefone = models.CharField(max_length=20, blank=True, verbose_name="Telefone")
     email = models.EmailField(blank=True, verbose_name="E-mail")
+    # Usage counters, maintained by contadores.py
+    uso_count = models.IntegerField(default=0, editable=False, verbose_name="Itens em Encomendas")
+    ultimo_uso = models.DateField(null=True, blank=True, editable=False, verbose_name="Último Uso")
+    # Normalized copies for searching (normalizar_busca), filled on save
+    nome_busca = models.CharField(max_length=200, blank=True, editable=False)
+    busca = models.TextField(blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -153,8 +274,19 @@ class Fornecedor(models.Model):
         verbose_name = "Fornecedor"
         verbose_name_plural = "Fornecedores"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['equipe', 'nome_busca'], name='fornecedor_equipe_busca_idx'),
+            models.Index(fields=['equipe', '-uso_count'], name='fornecedor_equipe_uso_idx'),
+        ]
         # unique_together = ('equipe', 'codigo') # Enforce code uniqueness per team if needed
 
+    CAMPOS_BUSCA = ('nome', 'codigo', 'contato', 'email', 'telefone')
+
+    def save(self, *args, **kwargs):
+        atualizar_busca(self, kwargs)
+        super().save(*args, **kwargs)
+        indexar_palavras(self, kwargs.get('update_fields'))
+
     def __str__(self):
         team_name = f" ({self.equipe.nome})" if self.equipe else ""
         return f"{self.codigo} - {self.nome}{team_name}"
@@ -180,6 +312,12 @@ class Produto(models.Model):
         verbose_name="Preço Base"
     )
     categoria = models.CharField(max_length=100, blank=True, verbose_name="Categoria")
+    # Usage counters, maintained by contadores.py
+    uso_count = models.IntegerField(default=0, editable=False, verbose_name="Itens em Encomendas")
+    ultimo_uso = models.DateField(null=True, blank=True, editable=False, verbose_name="Último Uso")
+    # Normalized copies for searching (normalizar_busca), filled on save
+    nome_busca = models.CharField(max_length=200, blank=True, editable=False)
+    busca = models.TextField(blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -187,12 +325,47 @@ class Produto(models.Model):
         verbose_name = "Produto"
         verbose_name_plural = "Produtos"
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['equipe', 'nome_busca'], name='produto_equipe_busca_idx'),
+            models.Index(fields=['equipe', '-uso_count'], name='produto_equipe_uso_idx'),
+        ]
         # unique_together = ('equipe', 'codigo') # Enforce code uniqueness per team if needed
 
+    CAMPOS_BUSCA = ('nome', 'codigo', 'categoria', 'descricao')
+
+    def save(self, *args, **kwargs):
+        atualizar_busca(self, kwargs)
+        super().save(*args, **kwargs)
+        indexar_palavras(self, kwargs.get('update_fields'))
+
     def __str__(self):
         team_name = f" ({self.equipe.nome})" if self.equipe else ""
         return f"{self.codigo} - {self.nome}{team_name}"
 
+# --- Word index of the search copies (see indexar_palavras) ---
+class PalavraBusca(models.Model):
+    """One distinct word of a row's `busca`, so each searched word is an index range, not a scan."""
+    equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name='+', verbose_name="Equipe")
+    palavra = models.CharField(max_length=PALAVRA_MAX, verbose_name="Palavra")
+
+    class Meta:
+        abstract = True
+        # Covering: a search reads objeto_id straight from the index
+        indexes = [models.Index(fields=['equipe', 'palavra', 'objeto'], name='%(class)s_idx')]
+
+
+class PalavraCliente(PalavraBusca):
+    objeto = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='palavras', verbose_name="Cliente")
+
+
+class PalavraFornecedor(PalavraBusca):
+    objeto = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name='palavras', verbose_name="Fornecedor")
+
+
+class PalavraProduto(PalavraBusca):
+    objeto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='palavras', verbose_name="Produto")
+
+
 # --- Encomenda Model ---
 class Encomenda(models.Model):
     STATUS_CHOICES = [
@@ -233,11 +406,29 @@ class Encomenda(models.Model):
         help_text="Valor total dos produtos da encomenda"
     )
     updated_at = models.DateTimeField(auto_now=True)
+    # Work queue claim (see fila.py); free when reservada_ate is null or past
+    reservada_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='+', verbose_name="Reservada por"
+    )
+    reservada_ate = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Reservada até")
 
     class Meta:
         verbose_name = "Encomenda"
         verbose_name_plural = "Encomendas"
         ordering = ['-numero_encomenda']
+        indexes = [
+            # Change feed of a team (views.api_eventos_equipe)
+            models.Index(fields=['equipe', 'updated_at'], name='encomenda_equipe_updated_idx'),
+            # Work queues by status (fila.py)
+            models.Index(fields=['equipe', 'status', 'reservada_ate'], name='encomenda_fila_idx'),
+            # Month slices of the sales rollup (vendas.py)
+            models.Index(fields=['equipe', 'data_encomenda'], name='encomenda_equipe_data_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        preservar_reserva(self, kwargs)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Encomenda {self.numero_encomenda} - {self.cliente.nome}"
@@ -265,6 +456,7 @@ class ItemEncomenda(models.Model):
         verbose_name="Valor Total"
     )
     observacoes = models.TextField(blank=True, verbose_name="Observações")
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Item da Encomenda"
@@ -301,15 +493,210 @@ class Entrega(models.Model):
     data_prevista = models.DateField(null=True, blank=True, verbose_name="Data Prevista (Controle Interno)")
     data_realizada = models.DateTimeField(null=True, blank=True, verbose_name="Data/Hora Realizada (Controle Interno)")
     observacoes_entrega = models.TextField(blank=True, verbose_name="Observações da Entrega")
+    updated_at = models.DateTimeField(auto_now=True)
+    # Work queue claim (see fila.py)
+    reservada_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='+', verbose_name="Reservada por"
+    )
+    reservada_ate = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Reservada até")
 
     class Meta:
         verbose_name = "Entrega"
         verbose_name_plural = "Entregas"
+        indexes = [
+            models.Index(fields=['updated_at'], name='entrega_updated_idx'),
+            models.Index(fields=['data_prevista'], name='entrega_data_prevista_idx'), # Delivery manifest
+        ]
+
+    def save(self, *args, **kwargs):
+        preservar_reserva(self, kwargs)
+        super().save(*args, **kwargs)
 
     # __str__, valor_restante, valor_adiantamento methods remain the same
 
 
+# --- Archive of closed orders (see arquivo.py) ---
+# Same field names and relation names as Encomenda/ItemEncomenda/Entrega, so
+# lookups like itens__produto__nome work on both. Primary keys are copied.
+
+class EncomendaArquivada(models.Model):
+    arquivada = True # Lets templates tell archived orders apart
+
+    numero_encomenda = models.IntegerField(primary_key=True, verbose_name="Número da Encomenda")
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+', verbose_name="Cliente")
+    equipe = models.ForeignKey(
+        Equipe, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name="Equipe Responsável"
+    )
+    data_criacao = models.DateTimeField(verbose_name="Data de Criação (sistema)")
+    data_encomenda = models.DateField(verbose_name="Data")
+    responsavel_criacao = models.CharField(max_length=100, verbose_name="Responsável")
+    status = models.CharField(max_length=20, choices=Encomenda.STATUS_CHOICES, verbose_name="Status")
+    observacoes = models.TextField(blank=True, verbose_name="Observação")
+    valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Valor do Produto")
+    updated_at = models.DateTimeField()
+    arquivada_em = models.DateTimeField(auto_now_add=True, verbose_name="Arquivada em")
+
+    class Meta:
+        verbose_name = "Encomenda Arquivada"
+        verbose_name_plural = "Encomendas Arquivadas"
+        ordering = ['-numero_encomenda']
+        indexes = [
+            models.Index(fields=['equipe', 'data_encomenda'], name='arquivada_equipe_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"Encomenda {self.numero_encomenda} (arquivada)"
+
+
+class ItemEncomendaArquivado(models.Model):
+    id = models.BigIntegerField(primary_key=True) # Same type as ItemEncomenda.id
+    encomenda = models.ForeignKey(EncomendaArquivada, related_name='itens', on_delete=models.CASCADE)
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='+', verbose_name="Produto")
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name='+', verbose_name="Fornecedor")
+    quantidade = models.PositiveIntegerField(verbose_name="Quantidade")
+    preco_cotado = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Preço Cotado")
+    valor_total = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Valor Total")
+    observacoes = models.TextField(blank=True, verbose_name="Observações")
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Item de Encomenda Arquivada"
+        verbose_name_plural = "Itens de Encomendas Arquivadas"
+
+
+class EntregaArquivada(models.Model):
+    id = models.BigIntegerField(primary_key=True) # Same type as Entrega.id
+    encomenda = models.OneToOneField(EncomendaArquivada, on_delete=models.CASCADE, related_name='entrega')
+    data_entrega = models.DateField(verbose_name="Data Entrega")
+    responsavel_entrega = models.CharField(max_length=100, verbose_name="Responsável Entrega")
+    valor_pago_adiantamento = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Valor Pago Adiantamento")
+    data_entrega_realizada = models.DateField(null=True, blank=True, verbose_name="Data (Realizada)")
+    hora_entrega = models.TimeField(null=True, blank=True, verbose_name="Hora (Realizada)")
+    entregue_por = models.CharField(max_length=100, blank=True, verbose_name="Entregue por")
+    assinatura_cliente = models.BooleanField(default=False, verbose_name="Ass. do Cliente")
+    data_prevista = models.DateField(null=True, blank=True, verbose_name="Data Prevista (Controle Interno)")
+    data_realizada = models.DateTimeField(null=True, blank=True, verbose_name="Data/Hora Realizada (Controle Interno)")
+    observacoes_entrega = models.TextField(blank=True, verbose_name="Observações da Entrega")
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Entrega Arquivada"
+        verbose_name_plural = "Entregas Arquivadas"
+
+
+class VendaMensal(models.Model):
+    """Sales rollup: ItemEncomenda totals per team, month, produto, fornecedor and order status (see vendas.py)."""
+    equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name='+', verbose_name="Equipe")
+    mes = models.DateField(verbose_name="Mês") # First day of the month of data_encomenda
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='+', verbose_name="Produto")
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name='+', verbose_name="Fornecedor")
+    status = models.CharField(max_length=20, choices=Encomenda.STATUS_CHOICES, verbose_name="Status da Encomenda")
+    quantidade = models.PositiveBigIntegerField(default=0, verbose_name="Quantidade")
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Valor Total")
+    itens = models.PositiveIntegerField(default=0, verbose_name="Itens")
+
+    class Meta:
+        verbose_name = "Venda Mensal"
+        verbose_name_plural = "Vendas Mensais"
+        constraints = [
+            models.UniqueConstraint(fields=['equipe', 'mes', 'produto', 'fornecedor', 'status'], name='venda_mensal_unica'),
+        ]
+
+
+class VendaClienteMensal(models.Model):
+    """Sales rollup per cliente: ItemEncomenda totals per team, month, cliente and order status (see vendas.py)."""
+    equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name='+', verbose_name="Equipe")
+    mes = models.DateField(verbose_name="Mês") # First day of the month of data_encomenda
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+', verbose_name="Cliente")
+    status = models.CharField(max_length=20, choices=Encomenda.STATUS_CHOICES, verbose_name="Status da Encomenda")
+    quantidade = models.PositiveBigIntegerField(default=0, verbose_name="Quantidade")
+    valor_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Valor Total")
+    itens = models.PositiveIntegerField(default=0, verbose_name="Itens")
+
+    class Meta:
+        verbose_name = "Venda Mensal por Cliente"
+        verbose_name_plural = "Vendas Mensais por Cliente"
+        constraints = [
+            models.UniqueConstraint(fields=['equipe', 'mes', 'cliente', 'status'], name='venda_cliente_mensal_unica'),
+        ]
+
+
+class PrecoFornecedor(models.Model):
+    """Statistics of the recent quoted prices of a produto at a fornecedor (see precos.py)."""
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='precos_fornecedores', verbose_name="Produto")
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name='+', verbose_name="Fornecedor")
+    ultimo_preco = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Último Preço")
+    ultima_cotacao = models.DateField(verbose_name="Última Cotação")
+    amostras = models.PositiveSmallIntegerField(verbose_name="Cotações Consideradas")
+    minimo = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Mínimo")
+    maximo = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Máximo")
+    media = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Média")
+    p25 = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="1º Quartil")
+    mediana = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Mediana")
+    p75 = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="3º Quartil")
+    ultimo_atipico = models.BooleanField(default=False, verbose_name="Último Preço Atípico")
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Preço por Fornecedor"
+        verbose_name_plural = "Preços por Fornecedor"
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'fornecedor'], name='preco_fornecedor_unico'),
+        ]
+
+
+class AlteracaoEncomenda(models.Model):
+    """Append-only change log of orders, their items and deliveries (see historico.py)."""
+    MODELO_CHOICES = [
+        ('encomenda', 'Encomenda'),
+        ('item', 'Item'),
+        ('entrega', 'Entrega'),
+    ]
+    ACAO_CHOICES = [
+        ('criacao', 'Criação'),
+        ('alteracao', 'Alteração'),
+        ('exclusao', 'Exclusão'),
+    ]
+
+    # Not a ForeignKey: the history outlives the order and follows it to the archive
+    encomenda_numero = models.IntegerField(verbose_name="Número da Encomenda")
+    modelo = models.CharField(max_length=10, choices=MODELO_CHOICES, verbose_name="Registro")
+    # None for items created with bulk_create on MySQL, which returns no ids
+    objeto_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID do Registro")
+    acao = models.CharField(max_length=10, choices=ACAO_CHOICES, verbose_name="Ação")
+    alteracoes = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="Alterações") # {campo: [antes, depois]}
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name="Usuário"
+    )
+    criado_em = models.DateTimeField(default=timezone.now, verbose_name="Data/Hora")
+
+    class Meta:
+        verbose_name = "Alteração de Encomenda"
+        verbose_name_plural = "Alterações de Encomendas"
+        indexes = [
+            # History of an order, newest first, paged by id (views.encomenda_detail)
+            models.Index(fields=['encomenda_numero', 'id'], name='alteracao_encomenda_idx'),
+        ]
+
+
 # --- Auth Models (Usuario, MembroEquipe, ConviteEquipe) remain the same ---
+class UsuarioManager(UserManager):
+
+    def get_by_natural_key(self, username):
+        # USERNAME_FIELD is the e-mail: log in regardless of the case typed.
+        # Accounts that differed only by case when e-mails were normalized
+        # (migration 0004) kept theirs, so an exact match comes first.
+        exato = (username or '').strip()
+        normalizado = normalizar_email(username)
+        usuarios = {u.email: u for u in self.filter(email__in={exato, normalizado})}
+        usuario = usuarios.get(exato) or usuarios.get(normalizado)
+        if usuario is None:
+            raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+        return usuario
+
+
 class Usuario(AbstractUser):
     email = models.EmailField(unique=True, verbose_name="Email")
     nome_completo = models.CharField(max_length=255, verbose_name="Nome Completo")
@@ -325,6 +712,8 @@ class Usuario(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'nome_completo', 'identificacao', 'cargo']
 
+    objects = UsuarioManager()
+
     class Meta:
         verbose_name = "Usuário"
         verbose_name_plural = "Usuários"
@@ -333,6 +722,18 @@ class Usuario(AbstractUser):
     def __str__(self):
         return f"{self.nome_completo} ({self.email})"
 
+    def save(self, *args, **kwargs):
+        self.email = normalizar_email(self.email)
+        super().save(*args, **kwargs)
+
+    def get_session_auth_hash(self):
+        # Users rebuilt by CachedModelBackend carry the hash instead of the
+        # password, which stays deferred until something (set_password,
+        # check_password) actually needs it.
+        if 'password' in self.get_deferred_fields() and hasattr(self, '_session_auth_hash'):
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
+
     # gerar_token_reset, token_reset_valido, limpar_token_reset methods remain the same
 
 class MembroEquipe(models.Model):
@@ -377,8 +778,16 @@ class ConviteEquipe(models.Model):
         verbose_name = "Convite de Equipe"
         verbose_name_plural = "Convites de Equipe"
         ordering = ['-data_criacao']
+        indexes = [
+            # Pending invitations of an e-mail (listar_equipes, navigation menu)
+            models.Index(fields=['email', 'status'], name='convite_email_status_idx'),
+        ]
 
     def __str__(self):
         return f"Convite para {self.email} - {self.equipe.nome}"
 
+    def save(self, *args, **kwargs):
+        self.email = normalizar_email(self.email)
+        super().save(*args, **kwargs)
+
     # eh_valido, aceitar, rejeitar methods remain the same
\ No newline at end of file
@@ -0,0 +1,126 @@
+# encomendas/paginacao.py
+
+"""
+Pagination that does not count large result sets.
+
+`COUNT(*)` over an InnoDB table reads a whole index, so on tables with
+millions of rows it dominates the cost of a list page. When the queryset
+is a whole table (no WHERE, DISTINCT or GROUP BY), PaginatorEstimado takes
+the number of rows from the statistics the database already keeps:
+information_schema.TABLES.TABLE_ROWS on MySQL, pg_class.reltuples on
+PostgreSQL. Below CONTAGEM_EXATA_MAX rows, or on backends without
+statistics (SQLite), it counts as usual: small counts are cheap and the
+estimate would be visibly off.
+
+Lists that are always scoped (e.g. orders of the user's teams) are never a
+whole table; for those, with `estimar_filtrados`, the estimate is the row
+count the query planner expects (EXPLAIN). Callers should only ask for it
+when no user filter is applied: the planner is close for an indexed scope
+and can be far off for LIKE searches.
+
+MySQL refreshes TABLE_ROWS as InnoDB resamples the table (and caches it for
+information_schema_stats_expiry seconds), so the estimate can be off by a
+few percent; pages near the estimated end may come out empty. Templates
+show estimated counts as "~N" (PaginatorEstimado.estimada).
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+
+def contagem_exata_max():
+    return getattr(settings, 'PAGINACAO_CONTAGEM_EXATA_MAX', 10_000)
+
+
+def estimativa_tabela(model, using='default'):
+    """Row estimate of the model's table from the database statistics, or None."""
+    connection = connections[using]
+    tabela = model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tabela])
+        linha = cursor.fetchone()
+    if not linha or linha[0] is None or linha[0] < 0: # reltuples is -1 before the first ANALYZE
+        return None
+    return int(linha[0])
+
+
+def _linhas_do_plano(plano, tabela):
+    """Rows MySQL expects from `tabela` in an EXPLAIN FORMAT=JSON plan (searched at any depth)."""
+    if isinstance(plano, dict):
+        if plano.get('table_name') == tabela and 'rows_produced_per_join' in plano:
+            return plano['rows_produced_per_join']
+        plano = list(plano.values())
+    if isinstance(plano, list):
+        for parte in plano:
+            linhas = _linhas_do_plano(parte, tabela)
+            if linhas is not None:
+                return linhas
+    return None
+
+
+def estimativa_consulta(queryset):
+    """Rows the query planner expects `queryset` to return, or None."""
+    vendor = connections[queryset.db].vendor
+    if vendor not in ('mysql', 'postgresql'):
+        return None
+    plano = json.loads(queryset.order_by().explain(format='json'))
+    if vendor == 'postgresql':
+        linhas = plano[0]['Plan']['Plan Rows']
+    else:
+        linhas = _linhas_do_plano(plano, queryset.model._meta.db_table)
+    return int(linhas) if linhas is not None else None
+
+
+def sem_filtros(queryset):
+    """True if `queryset` returns every row of its table."""
+    query = queryset.query
+    return not (query.where or query.distinct or query.group_by or query.combinator
+                or query.low_mark or query.high_mark is not None)
+
+
+class PaginatorEstimado(Paginator):
+    """
+    Paginator that takes the count of a large unfiltered table from the
+    database statistics and, with `estimar_filtrados`, of a large scoped
+    queryset from the query plan. `contagem` is a count the caller already
+    has (e.g. from an aggregate), used instead of a COUNT query.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 estimar_filtrados=False, contagem=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.estimar_filtrados = estimar_filtrados
+        self.contagem = contagem
+
+    @cached_property
+    def estimada(self):
+        """The estimate used as count, or None when the count is exact."""
+        if self.contagem is not None or not isinstance(self.object_list, QuerySet):
+            return None
+        if sem_filtros(self.object_list):
+            estimativa = estimativa_tabela(self.object_list.model, self.object_list.db)
+        elif self.estimar_filtrados:
+            estimativa = estimativa_consulta(self.object_list)
+        else:
+            return None
+        if estimativa is None or estimativa <= contagem_exata_max():
+            return None
+        return estimativa
+
+    @cached_property
+    def count(self):
+        if self.contagem is not None:
+            return self.contagem
+        if self.estimada is not None:
+            return self.estimada
+        return super().count
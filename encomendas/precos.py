@@ -0,0 +1,173 @@
+# encomendas/precos.py
+
+"""
+Supplier price index: for each (produto, fornecedor) pair, statistics of
+the prices quoted in its last AMOSTRAS_MAX order items, kept in
+PrecoFornecedor so the item form can suggest a price with one query.
+
+Maintenance works by pairs: saving or deleting an item marks its pair (and
+the pair it moved out of) and, after the commit, the pair is recomputed from its latest quotes, archived ones included. Recomputing is idempotent,
+so writes that skip signals only have to call `marcar_on_commit`, and the
+`reconstruir_precos` command rebuilds the whole index.
+
+The statistics are computed with the `statistics` module: a pair never has
+more than AMOSTRAS_MAX samples. The last price is flagged as atypical when
+it falls outside the interquartile fence of the quotes before it.
+"""
+import statistics
+import threading
+from collections import Counter
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+
+from .models import ItemEncomenda, ItemEncomendaArquivado, PrecoFornecedor
+
+AMOSTRAS_MAX = 20 # Older quotes no longer say much about today's price
+AMOSTRAS_MIN_ATIPICO = 4 # Fewer previous quotes than this and nothing is atypical
+FATOR_IQR = Decimal('1.5')
+
+CENTAVO = Decimal('0.01')
+
+
+def _centavos(valor):
+    return Decimal(valor).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def _quartis(precos):
+    if len(precos) == 1:
+        return precos[0], precos[0], precos[0]
+    return statistics.quantiles(precos, n=4, method='inclusive')
+
+
+def atipico(preco, anteriores):
+    """True if `preco` is outside the 1.5 IQR fence of `anteriores`."""
+    if len(anteriores) < AMOSTRAS_MIN_ATIPICO:
+        return False
+    q1, _, q3 = _quartis(anteriores)
+    margem = (q3 - q1) * FATOR_IQR
+    return preco < q1 - margem or preco > q3 + margem
+
+
+def estatisticas(precos):
+    """Field values of a PrecoFornecedor from prices ordered from the newest."""
+    ordenados = sorted(precos)
+    q1, mediana, q3 = _quartis(ordenados)
+    return {
+        'ultimo_preco': precos[0],
+        'amostras': len(precos),
+        'minimo': ordenados[0],
+        'maximo': ordenados[-1],
+        'media': _centavos(statistics.fmean(ordenados)),
+        'p25': _centavos(q1),
+        'mediana': _centavos(mediana),
+        'p75': _centavos(q3),
+        'ultimo_atipico': atipico(precos[0], precos[1:]),
+    }
+
+
+# --- Maintenance ---
+
+# Quotes are (date, item pk, price) tuples: sorting them in reverse puts the newest first
+COLUNAS_COTACAO = ('encomenda__data_encomenda', 'pk', 'preco_cotado')
+
+
+def _mais_recentes(cotacoes):
+    return sorted(cotacoes, reverse=True)[:AMOSTRAS_MAX]
+
+
+def _cotacoes(produto_id, fornecedor_id):
+    """The newest AMOSTRAS_MAX quotes of a pair, from the hot and the archived items."""
+    cotacoes = []
+    for modelo in (ItemEncomenda, ItemEncomendaArquivado):
+        cotacoes += modelo.objects.filter(
+            produto_id=produto_id, fornecedor_id=fornecedor_id,
+        ).order_by('-encomenda__data_encomenda', '-pk').values_list(*COLUNAS_COTACAO)[:AMOSTRAS_MAX]
+    return _mais_recentes(cotacoes)
+
+
+def _linha(cotacoes):
+    return {**estatisticas([preco for _, _, preco in cotacoes]), 'ultima_cotacao': cotacoes[0][0]}
+
+
+def recalcular(produto_id, fornecedor_id):
+    """Recomputes the index row of one pair from its latest quotes."""
+    cotacoes = _cotacoes(produto_id, fornecedor_id)
+    if not cotacoes:
+        PrecoFornecedor.objects.filter(produto_id=produto_id, fornecedor_id=fornecedor_id).delete()
+        return
+    PrecoFornecedor.objects.update_or_create(
+        produto_id=produto_id, fornecedor_id=fornecedor_id, defaults=_linha(cotacoes),
+    )
+
+
+def reconstruir(produto_ids=None):
+    """Rebuilds the index (of the given produtos, or all). Returns the number of rows written."""
+    ultimas = {}
+    for modelo in (ItemEncomenda, ItemEncomendaArquivado):
+        itens = modelo.objects.all()
+        if produto_ids is not None:
+            itens = itens.filter(produto_id__in=produto_ids)
+        lidas = Counter()
+        # One ordered pass per table; each pair keeps only its newest AMOSTRAS_MAX quotes of each
+        for produto_id, fornecedor_id, *cotacao in itens.order_by(
+            'produto_id', 'fornecedor_id', '-encomenda__data_encomenda', '-pk',
+        ).values_list('produto_id', 'fornecedor_id', *COLUNAS_COTACAO).iterator():
+            par = (produto_id, fornecedor_id)
+            if lidas[par] < AMOSTRAS_MAX:
+                lidas[par] += 1
+                ultimas.setdefault(par, []).append(tuple(cotacao))
+
+    linhas = [
+        PrecoFornecedor(produto_id=produto_id, fornecedor_id=fornecedor_id, **_linha(_mais_recentes(cotacoes)))
+        for (produto_id, fornecedor_id), cotacoes in ultimas.items()
+    ]
+    existentes = PrecoFornecedor.objects.all()
+    if produto_ids is not None:
+        existentes = existentes.filter(produto_id__in=produto_ids)
+    with transaction.atomic():
+        existentes.delete()
+        PrecoFornecedor.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+_local = threading.local()
+
+
+def _pendentes():
+    if not hasattr(_local, 'pares'):
+        _local.pares = set()
+    return _local.pares
+
+
+def _recalcular_pendentes():
+    # One callback is queued per mark; the first one after a commit drains the set.
+    pares = _pendentes()
+    while pares:
+        recalcular(*pares.pop())
+
+
+def marcar_on_commit(produto_id, fornecedor_id):
+    """Recomputes the pair after the current transaction commits."""
+    if produto_id is None or fornecedor_id is None:
+        return
+    _pendentes().add((produto_id, fornecedor_id))
+    transaction.on_commit(_recalcular_pendentes)
+
+
+def marcar_itens_on_commit(itens):
+    """Marks the pair of each item and, for items loaded from the database, the pair it was loaded with."""
+    for item in itens:
+        marcar_on_commit(item.produto_id, item.fornecedor_id)
+        anterior = getattr(item, '_par_precos', (None, None))
+        if anterior != (item.produto_id, item.fornecedor_id):
+            marcar_on_commit(*anterior)
+
+
+# --- Lookup ---
+
+def sugestoes(produto_id):
+    """Index rows of a produto, cheapest last price first."""
+    return PrecoFornecedor.objects.filter(produto_id=produto_id).select_related('fornecedor').order_by(
+        'ultimo_preco', 'fornecedor__nome',
+    )
@@ -0,0 +1,215 @@
+# encomendas/signals.py
+
+"""
+Signal handlers. Connected in EncomendasConfig.ready().
+"""
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    Encomenda, ItemEncomenda, Entrega, Cliente, Produto, Fornecedor,
+    Equipe, MembroEquipe, ConviteEquipe, Usuario
+)
+from . import auth_backends, contadores, eventos, historico, membership, precos, team_cache, vendas
+
+
+def _equipe_id_via_encomenda(instance):
+    """Team of an ItemEncomenda/Entrega, avoiding a query when the order is loaded."""
+    encomenda = instance._state.fields_cache.get('encomenda')
+    if encomenda is not None:
+        return encomenda.equipe_id
+    return Encomenda.objects.filter(pk=instance.encomenda_id).values_list('equipe_id', flat=True).first()
+
+
+# --- Team generation bumps (team_cache) ---
+
+@receiver([post_save, post_delete], sender=Encomenda)
+@receiver([post_save, post_delete], sender=Cliente)
+@receiver([post_save, post_delete], sender=Produto)
+@receiver([post_save, post_delete], sender=Fornecedor)
+@receiver([post_save, post_delete], sender=MembroEquipe)
+def bump_team_generation(sender, instance, **kwargs):
+    team_cache.bump_generation_on_commit(instance.equipe_id)
+
+
+@receiver([post_save, post_delete], sender=ItemEncomenda)
+@receiver([post_save, post_delete], sender=Entrega)
+def bump_team_generation_via_encomenda(sender, instance, **kwargs):
+    team_cache.bump_generation_on_commit(_equipe_id_via_encomenda(instance))
+
+
+@receiver([post_save, post_delete], sender=Equipe)
+def bump_equipe_generation(sender, instance, **kwargs):
+    team_cache.bump_generation_on_commit(instance.pk)
+
+
+# --- Live order updates (eventos) ---
+
+@receiver(post_save, sender=Encomenda)
+def publish_encomenda_change(sender, instance, **kwargs):
+    eventos.publicar_on_commit(instance.equipe_id)
+
+
+@receiver(post_save, sender=Entrega)
+def publish_entrega_change(sender, instance, **kwargs):
+    eventos.publicar_on_commit(_equipe_id_via_encomenda(instance))
+
+
+# --- Sales rollup (vendas) ---
+
+def _escreve(update_fields, campos):
+    return update_fields is None or bool(set(update_fields) & campos)
+
+
+_CAMPOS_VENDAS_ENCOMENDA = {'equipe', 'equipe_id', 'data_encomenda', 'status', 'cliente', 'cliente_id'}
+_CAMPOS_VENDAS_ITEM = {
+    'encomenda', 'encomenda_id', 'produto', 'produto_id', 'fornecedor', 'fornecedor_id', 'quantidade', 'valor_total',
+}
+
+
+@receiver(pre_save, sender=Encomenda)
+def move_encomenda_sales(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or not _escreve(update_fields, _CAMPOS_VENDAS_ENCOMENDA):
+        return
+    vendas.mover_encomendas([instance.pk], **{campo: getattr(instance, campo) for campo in vendas.CAMPOS_ENCOMENDA})
+
+
+@receiver(pre_save, sender=ItemEncomenda)
+def take_out_item_sales(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._vendas = None
+    if raw or not _escreve(update_fields, _CAMPOS_VENDAS_ITEM):
+        return
+    instance._vendas = vendas.retirar_itens([] if instance._state.adding else [instance])
+
+
+@receiver(post_save, sender=ItemEncomenda)
+def add_item_sales(sender, instance, **kwargs):
+    if getattr(instance, '_vendas', None) is not None:
+        vendas.registrar_itens([instance], instance._vendas)
+        instance._vendas = None
+
+
+@receiver(pre_delete, sender=ItemEncomenda)
+def take_out_deleted_item_sales(sender, instance, **kwargs):
+    # Before the DELETE: the contribution is read from the stored row (and its order)
+    vendas.registrar_itens([], vendas.retirar_itens([instance]))
+
+
+# --- Supplier price index (precos) ---
+
+@receiver(post_init, sender=ItemEncomenda)
+def remember_item_price_pair(sender, instance, **kwargs):
+    instance._par_precos = (instance.__dict__.get('produto_id'), instance.__dict__.get('fornecedor_id'))
+
+
+@receiver([post_save, post_delete], sender=ItemEncomenda)
+def mark_item_price_pairs(sender, instance, **kwargs):
+    precos.marcar_itens_on_commit([instance])
+    instance._par_precos = (instance.produto_id, instance.fornecedor_id)
+
+
+@receiver(post_init, sender=Encomenda)
+def remember_encomenda_date(sender, instance, **kwargs):
+    instance._data_precos = instance.__dict__.get('data_encomenda')
+
+
+@receiver(post_save, sender=Encomenda)
+def mark_price_pairs_on_date_change(sender, instance, created, **kwargs):
+    # The order date decides which quotes are the latest ones
+    anterior = getattr(instance, '_data_precos', None)
+    if not created and anterior is not None and anterior != instance.data_encomenda:
+        for par in instance.itens.values_list('produto_id', 'fornecedor_id').distinct():
+            precos.marcar_on_commit(*par)
+    instance._data_precos = instance.data_encomenda
+
+
+# --- Usage counters (contadores) ---
+
+@receiver(post_init, sender=Encomenda)
+def remember_encomenda_cliente(sender, instance, **kwargs):
+    instance._cliente_contadores = instance.__dict__.get('cliente_id')
+
+
+@receiver(post_save, sender=Encomenda)
+def count_encomenda(sender, instance, created, **kwargs):
+    contadores.registrar_encomenda(instance, created)
+    instance._cliente_contadores = instance.cliente_id
+
+
+@receiver(post_delete, sender=Encomenda)
+def uncount_encomenda(sender, instance, **kwargs):
+    contadores.remover_encomenda(instance)
+
+
+@receiver(post_init, sender=ItemEncomenda)
+def remember_item_usage(sender, instance, **kwargs):
+    instance._uso_contadores = (instance.__dict__.get('produto_id'), instance.__dict__.get('fornecedor_id'))
+
+
+@receiver(post_save, sender=ItemEncomenda)
+def count_item(sender, instance, created, **kwargs):
+    if contadores.itens_alterados([instance], novos=created):
+        encomenda = instance._state.fields_cache.get('encomenda')
+        if encomenda is not None:
+            dia = encomenda.data_encomenda
+        else:
+            dia = Encomenda.objects.filter(pk=instance.encomenda_id).values_list('data_encomenda', flat=True).first()
+        contadores.registrar_itens([instance], dia, novos=created)
+    contadores.lembrar_itens([instance])
+
+
+@receiver(post_delete, sender=ItemEncomenda)
+def uncount_item(sender, instance, **kwargs):
+    contadores.remover_itens([instance])
+
+
+# --- Change log (historico) ---
+
+@receiver(post_init, sender=Encomenda)
+@receiver(post_init, sender=ItemEncomenda)
+@receiver(post_init, sender=Entrega)
+def remember_tracked_values(sender, instance, **kwargs):
+    historico.lembrar(instance)
+
+
+@receiver(post_save, sender=Encomenda)
+@receiver(post_save, sender=ItemEncomenda)
+@receiver(post_save, sender=Entrega)
+def record_change(sender, instance, created, raw=False, **kwargs):
+    if not raw: # Fixtures are not changes
+        historico.registrar(instance, historico.CRIACAO if created else historico.ALTERACAO)
+
+
+@receiver(post_delete, sender=Encomenda)
+@receiver(post_delete, sender=ItemEncomenda)
+@receiver(post_delete, sender=Entrega)
+def record_deletion(sender, instance, **kwargs):
+    historico.registrar(instance, historico.EXCLUSAO)
+
+
+# --- Membership cache invalidation (membership) ---
+
+@receiver([post_save, post_delete], sender=MembroEquipe)
+def invalidate_member_membership(sender, instance, **kwargs):
+    membership.invalidate_on_commit(instance.usuario_id)
+
+
+@receiver(post_save, sender=Equipe)
+def invalidate_team_members_membership(sender, instance, created, **kwargs):
+    # Team name/ordering shown in every member's menu
+    if not created:
+        membership.invalidate_on_commit(*instance.membros.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=ConviteEquipe)
+def invalidate_invitee_membership(sender, instance, **kwargs):
+    membership.invalidate_on_commit(*Usuario.objects.filter(email=instance.email).values_list('id', flat=True))
+
+
+# --- Cached Usuario rows (auth_backends.CachedModelBackend) ---
+
+@receiver([post_save, post_delete], sender=Usuario)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Profile edits, password changes (alterar_senha) and last_login updates
+    auth_backends.invalidate_user_on_commit(instance.pk)
+    membership.invalidate_on_commit(instance.pk) # Pending invites are matched by email
@@ -0,0 +1,62 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Theme Toggler Logic
+    const themeToggle = document.getElementById('theme-toggle');
+    if (themeToggle) {
+        themeToggle.addEventListener('click', function() {
+            document.body.classList.toggle('dark-mode');
+            const theme = document.body.classList.contains('dark-mode') ? 'dark' : 'light';
+            localStorage.setItem('theme', theme);
+        });
+    }
+
+    // Sidebar toggle for mobile
+    const sidebarToggle = document.getElementById('sidebarToggle');
+    const sidebar = document.getElementById('sidebar');
+    if (sidebarToggle && sidebar) {
+        sidebarToggle.addEventListener('click', function() {
+            sidebar.classList.toggle('show');
+        });
+         document.addEventListener('click', function(event) {
+            if (sidebar.classList.contains('show') &&
+                !sidebar.contains(event.target) &&
+                !sidebarToggle.contains(event.target)) {
+                sidebar.classList.remove('show');
+            }
+        });
+    }
+
+    // --- REMOVED JAVASCRIPT BLOCK FOR SIDEBAR URLS ---
+
+    // Auto-hide alerts after 5 seconds
+    setTimeout(function() {
+        const alerts = document.querySelectorAll('.alert');
+        alerts.forEach(alert => {
+            const bsAlert = bootstrap.Alert.getOrCreateInstance(alert);
+            if (bsAlert) {
+                bsAlert.close();
+            }
+        });
+    }, 5000);
+
+    // Form submission feedback
+    const forms = document.querySelectorAll('form');
+    forms.forEach(form => {
+        form.addEventListener('submit', function(e) {
+            if (form.id === 'logout-form' || form.hasAttribute('data-no-disable')) {
+                return;
+            }
+            const submitBtns = form.querySelectorAll('button[type="submit"]');
+            submitBtns.forEach(submitBtn => {
+                 if (form.checkValidity && !form.checkValidity()) {
+                      return;
+                 }
+                submitBtn.disabled = true;
+                submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Processando...';
+            });
+        });
+    });
+
+     // Initialize Select2 if needed
+     // Example: $('.select2-field').select2({ theme: "bootstrap-5" });
+
+}); // End DOMContentLoaded
@@ -0,0 +1,58 @@
+// Live order updates (views.api_eventos_equipe): one EventSource per team.
+// Markup: an element with data-eventos-urls (space-separated stream URLs) and
+// data-eventos-desde (page render time, seconds since epoch); order rows as
+// <tr data-encomenda-id="..."> with a .status-badge; optionally #eventos-aviso
+// with a .eventos-contagem inside, shown when orders not on the page appear.
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.querySelector('[data-eventos-urls]');
+    if (!container || !window.EventSource) {
+        return;
+    }
+    const desde = String(Number(container.dataset.eventosDesde) * 1000000);
+    const aviso = document.getElementById('eventos-aviso');
+    const novas = new Set();
+
+    function linha(numero) {
+        return container.querySelector('tr[data-encomenda-id="' + numero + '"]');
+    }
+
+    function destacar(tr) {
+        tr.classList.remove('linha-atualizada');
+        void tr.offsetWidth; // Restart the animation
+        tr.classList.add('linha-atualizada');
+    }
+
+    function onEncomenda(event) {
+        const dados = JSON.parse(event.data);
+        const tr = linha(dados.numero);
+        if (tr) {
+            const badge = tr.querySelector('.status-badge');
+            // Events may be repeated after a reconnection: only react to real changes
+            if (badge && !badge.classList.contains('status-' + dados.status)) {
+                badge.className = 'status-badge status-' + dados.status;
+                badge.textContent = dados.status_display;
+                destacar(tr);
+            }
+        } else if (dados.nova && aviso) {
+            novas.add(dados.numero);
+            aviso.querySelector('.eventos-contagem').textContent = novas.size;
+            aviso.classList.remove('d-none');
+        }
+    }
+
+    function onEntrega(event) {
+        const dados = JSON.parse(event.data);
+        const tr = linha(dados.encomenda);
+        if (tr && dados.realizada && !tr.dataset.entregaRealizada) {
+            tr.dataset.entregaRealizada = '1';
+            destacar(tr);
+        }
+    }
+
+    container.dataset.eventosUrls.split(' ').filter(Boolean).forEach(function(url) {
+        // On reconnection the browser sends Last-Event-ID, which takes precedence over ?desde=
+        const fonte = new EventSource(url + '?desde=' + desde);
+        fonte.addEventListener('encomenda', onEncomenda);
+        fonte.addEventListener('entrega', onEntrega);
+    });
+});
@@ -0,0 +1,115 @@
+# encomendas/team_cache.py
+
+"""
+Team-scoped caching keyed on a per-team "generation" counter.
+
+Every write to a team-owned model bumps the team's generation (see
+`signals.py`), so anything cached under `team:<id>:gen:<n>:...` becomes
+unreachable as soon as the team's data changes; no hand-written invalidation.
+Stale generations simply age out of the caches.
+
+The generation counter lives only in the shared cache ('default'), so every
+process sees a bump immediately. A bump writes a fresh, clock-based
+generation rather than incrementing: cache.incr() is a non-atomic get+set
+on several backends, and two concurrent increments could both write the
+same value, which a reader may already have used. Two racing bumps here
+can only overwrite each other with two values that nobody cached under yet,
+so no invalidation is lost whatever the backend. Values are stored in the two-tier 'team'
+cache: generation keys are immutable, which is what makes the per-process LRU
+safe to use. In templates, vary `{% cache %}` on the generation:
+
+    {% load team_cache %}
+    {% cache 600 resumo_equipe equipe.id equipe.id|team_generation using="team" %}
+"""
+import time
+from functools import partial
+
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_CACHE = 'default'
+VALUE_CACHE = 'team'
+
+
+def _generation_key(equipe_id):
+    return f'team:{equipe_id}:gen'
+
+
+def _new_generation():
+    # A cold or evicted counter restarts from the clock instead of 1, so it
+    # never reuses a generation that may still have entries cached.
+    return time.time_ns() // 1000
+
+
+def get_generation(equipe_id):
+    """Current generation of a team (initialised on first use)."""
+    cache = caches[GENERATION_CACHE]
+    key = _generation_key(equipe_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_generations(equipe_ids):
+    """Generations of several teams with a single cache round trip."""
+    cache = caches[GENERATION_CACHE]
+    keys = {_generation_key(equipe_id): equipe_id for equipe_id in equipe_ids}
+    found = cache.get_many(keys)
+    generations = {keys[key]: generation for key, generation in found.items()}
+    for key, equipe_id in keys.items():
+        if key not in found:
+            generations[equipe_id] = get_generation(equipe_id)
+    return generations
+
+
+def bump_generation(equipe_id):
+    """Moves a team to a new generation, invalidating everything cached for it."""
+    if equipe_id is None:
+        return
+    cache = caches[GENERATION_CACHE]
+    key = _generation_key(equipe_id)
+    # Past the current one even if this server's clock is behind
+    generation = max(_new_generation(), (cache.get(key) or 0) + 1)
+    cache.set(key, generation, None)
+    return generation
+
+
+def bump_generation_on_commit(equipe_id):
+    """Bumps once the current transaction commits (immediately in autocommit).
+
+    Bumping before the commit would let a concurrent reader cache the old rows
+    under the new generation.
+    """
+    if equipe_id is not None:
+        transaction.on_commit(partial(bump_generation, equipe_id))
+
+
+def team_key(equipe_id, name, *parts, generation=None):
+    """Builds `team:<id>:gen:<n>:<name>[:<part>...]`."""
+    if generation is None:
+        generation = get_generation(equipe_id)
+    return ':'.join(str(p) for p in ('team', equipe_id, 'gen', generation, name, *parts))
+
+
+def get_value(equipe_id, name, *parts, default=None):
+    return caches[VALUE_CACHE].get(team_key(equipe_id, name, *parts), default)
+
+
+def set_value(equipe_id, name, value, *parts, timeout=None):
+    kwargs = {} if timeout is None else {'timeout': timeout}
+    caches[VALUE_CACHE].set(team_key(equipe_id, name, *parts), value, **kwargs)
+
+
+def get_or_set(equipe_id, name, compute, *parts, timeout=None):
+    """Returns the cached value for the current generation, computing it on a miss."""
+    cache = caches[VALUE_CACHE]
+    key = team_key(equipe_id, name, *parts)
+    sentinel = object()
+    value = cache.get(key, sentinel)
+    if value is sentinel:
+        value = compute()
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        cache.set(key, value, **kwargs)
+    return value
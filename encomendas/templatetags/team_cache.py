@@ -0,0 +1,22 @@
+# encomendas/templatetags/team_cache.py
+from django import template
+from django.urls import reverse
+
+from encomendas import team_cache
+
+register = template.Library()
+
+
+@register.filter
+def team_generation(equipe_id):
+    """Current cache generation of a team, to vary {% cache %} fragments on."""
+    if not equipe_id:
+        return ''
+    return team_cache.get_generation(equipe_id)
+
+
+@register.simple_tag
+def catalogo_url(equipe):
+    """URL of the team's catalog snapshot, pinned to its current version."""
+    versao = team_cache.get_generation(equipe.id)
+    return f"{reverse('api_catalogo_equipe', args=[equipe.id])}?v={versao}"
@@ -1,3 +1,1912 @@
-from django.test import TestCase
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import gzip
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock, skipIf
+import threading
+import time
+from pathlib import Path
+import re
+import uuid
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+import asyncio
+import json
+import brotli
+from django.contrib.staticfiles import finders
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from encomendas import arquivo, auth_backends, eventos, exportacao, fila, historico, manifesto, membership, metrics, team_cache, vendas, vendor, views
+from encomendas.db.mysql_pool import base as pool_base
+from encomendas.db.mysql_pool.pool import ConnectionPool, PoolTimeout
+from encomendas.middleware import CompressionMiddleware
+from encomendas.models import (
+    Usuario, Equipe, Cliente, Produto, Fornecedor, Encomenda, ItemEncomenda, Entrega, ConviteEquipe, PrecoFornecedor, VendaClienteMensal, VendaMensal,
+    AlteracaoEncomenda, EncomendaArquivada, EntregaArquivada, ItemEncomendaArquivado, normalizar_busca, normalizar_telefone,
+    palavras_busca,
+)
+from encomendas.paginacao import PaginatorEstimado
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'},
+    'team': {
+        'BACKEND': 'encomendas.cache_backends.TwoTierCache',
+        'OPTIONS': {'SHARED_ALIAS': 'default', 'LOCAL_MAX_ENTRIES': 100},
+    },
+}
+
+# The manifest storage needs collectstatic output; tests render unhashed URLs.
+PLAIN_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class CachesLimposMixin:
+    """Every test starts with empty caches, the team tier's local copies included."""
+
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        caches['team'].clear()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STORAGES=PLAIN_STORAGES)
+class EncomendasTestCase(CachesLimposMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STORAGES=PLAIN_STORAGES)
+class EncomendasTransactionTestCase(CachesLimposMixin, TransactionTestCase):
+    pass
+
+
+def criar_equipe_com_dados(sufixo='1'):
+    """Creates a user, a team and one cliente/produto/fornecedor for it."""
+    usuario = Usuario.objects.create_user(
+        username=f'user{sufixo}', email=f'user{sufixo}@exemplo.com', password='senha-forte-123',
+        nome_completo=f'Usuário {sufixo}', identificacao=f'000{sufixo}', cargo='Atendente',
+    )
+    equipe = Equipe.objects.create(nome=f'Equipe {sufixo}', administrador=usuario)
+    equipe.adicionar_membro(usuario, papel='administrador')
+    cliente = Cliente.objects.create(
+        equipe=equipe, nome='João da Silva', codigo=f'C{sufixo}', endereco='Rua A, 1',
+        bairro='Centro', telefone='(32) 99999-0000',
+    )
+    produto = Produto.objects.create(equipe=equipe, nome='Dipirona Sódica', codigo=f'P{sufixo}', preco_base=Decimal('10.00'))
+    fornecedor = Fornecedor.objects.create(equipe=equipe, nome='Distribuidora', codigo=f'F{sufixo}')
+    return usuario, equipe, cliente, produto, fornecedor
+
+
+# --- Simulated MySQL driver ---
+
+class FakeConnection:
+    """Stands in for a pymysql connection; counts what the pool does with it."""
+
+    def __init__(self, init_command=None, **kwargs):
+        self.kwargs = kwargs
+        self.encoders = {}
+        self.alive = True
+        self.closed = False
+        self.pings = 0
+        self.rollbacks = 0
+        self._autocommit = False
+        # The real driver runs init_command while connecting
+        self.init_commands_run = 1 if init_command else 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if not self.alive:
+            raise ConnectionError('MySQL server has gone away')
+
+    def close(self):
+        self.closed = True
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def autocommit(self, value):
+        self._autocommit = value
+
+    def get_autocommit(self):
+        return self._autocommit
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_pool(self, **kwargs):
+        self.created = []
+
+        def connect():
+            conn = FakeConnection(init_command="SET sql_mode='STRICT_TRANS_TABLES'")
+            self.created.append(conn)
+            return conn
+
+        return ConnectionPool(connect, **kwargs)
+
+    def test_reuses_physical_connection(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+        self.assertIs(first.raw, second.raw)
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(second.raw.init_commands_run, 1)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['reused'], stats['in_use']), (1, 1, 1))
+
+    def test_bounded_size_times_out(self):
+        pool = self.make_pool(max_size=2, timeout=0.05)
+        pool.acquire()
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(len(self.created), 2)
+
+    def test_waiter_gets_released_connection(self):
+        pool = self.make_pool(max_size=1, timeout=2)
+        held = pool.acquire()
+        threading.Timer(0.05, pool.release, args=[held]).start()
+        got = pool.acquire()
+        self.assertIs(got.raw, held.raw)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_dead_connection_is_replaced_after_ping(self):
+        pool = self.make_pool(ping_interval=0)
+        pooled = pool.acquire()
+        pooled.raw.alive = False
+        pool.release(pooled)
+        fresh = pool.acquire()
+        self.assertIsNot(fresh.raw, pooled.raw)
+        self.assertTrue(pooled.raw.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['ping_failures'], stats['size']), (1, 1))
+
+    def test_recent_connection_skips_ping(self):
+        pool = self.make_pool(ping_interval=60)
+        pooled = pool.acquire()
+        pool.release(pooled)
+        pool.acquire()
+        self.assertEqual(pooled.raw.pings, 0)
+
+    def test_expired_connection_is_recycled(self):
+        pool = self.make_pool(max_lifetime=0.01)
+        pooled = pool.acquire()
+        time.sleep(0.02)
+        pool.release(pooled)
+        self.assertTrue(pooled.raw.closed)
+        self.assertIsNot(pool.acquire().raw, pooled.raw)
+
+    def test_discard_frees_slot(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.release(pool.acquire(), discard=True)
+        pool.acquire()
+        self.assertEqual(len(self.created), 2)
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+    settings_dict = {
+        'ENGINE': 'encomendas.db.mysql_pool',
+        'NAME': 'teste', 'USER': 'root', 'PASSWORD': '', 'HOST': 'localhost', 'PORT': '',
+        'OPTIONS': {'init_command': "SET sql_mode='STRICT_TRANS_TABLES'"},
+        'POOL': {'MAX_SIZE': 2},
+        'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False, 'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False, 'TIME_ZONE': None, 'TEST': {},
+    }
+
+    def setUp(self):
+        patcher = mock.patch.object(pool_base.Database, 'connect', side_effect=FakeConnection, create=True)
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.drop_pools)
+
+    def drop_pools(self):
+        for chave in [chave for chave in pool_base._pools if chave[0] == 'pool-test']:
+            del pool_base._pools[chave]
+
+    def open(self, wrapper):
+        wrapper.connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        return wrapper.connection
+
+    def test_close_returns_connection_to_pool(self):
+        first = pool_base.DatabaseWrapper(self.settings_dict, alias='pool-test')
+        raw = self.open(first)
+        first.close()
+        second = pool_base.DatabaseWrapper(self.settings_dict, alias='pool-test')
+        self.assertIs(self.open(second), raw)
+        self.assertFalse(raw.closed)
+        self.assertEqual(self.connect.call_count, 1)
+        self.assertEqual(raw.init_commands_run, 1)
+        self.assertIn('pool-test:teste', pool_base.pool_stats())
+
+    def test_new_database_name_gets_its_own_pool(self):
+        wrapper = pool_base.DatabaseWrapper(self.settings_dict, alias='pool-test')
+        antigo = self.open(wrapper)
+        wrapper.close()
+        # As test database creation and parallel clones do
+        wrapper.settings_dict = {**self.settings_dict, 'NAME': 'test_teste'}
+        novo = self.open(wrapper)
+        self.assertIsNot(novo, antigo)
+        self.assertEqual(novo.kwargs['database'], 'test_teste')
+        self.assertTrue(antigo.closed) # Idle in the old pool: closed, never handed out again
+        wrapper.close()
+        self.assertIs(self.open(wrapper), novo)
+        self.assertEqual(set(pool_base.pool_stats()) & {'pool-test:teste', 'pool-test:test_teste'}, {
+            'pool-test:teste', 'pool-test:test_teste',
+        })
+
+    def test_init_connection_state_runs_once_per_physical_connection(self):
+        wrapper = pool_base.DatabaseWrapper(self.settings_dict, alias='pool-test')
+        with mock.patch('django.db.backends.mysql.base.DatabaseWrapper.init_connection_state') as init:
+            self.open(wrapper)
+            wrapper.init_connection_state()
+            wrapper.close()
+            self.open(wrapper)
+            wrapper.init_connection_state()
+        self.assertEqual(init.call_count, 1)
+
+    def test_pending_transaction_is_rolled_back_before_reuse(self):
+        wrapper = pool_base.DatabaseWrapper(self.settings_dict, alias='pool-test')
+        raw = self.open(wrapper)
+        wrapper.autocommit = False
+        wrapper.close()
+        self.assertEqual(raw.rollbacks, 1)
+        self.assertFalse(raw.closed)
+
+
+class TeamCacheTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+
+    def test_key_embeds_generation(self):
+        generation = team_cache.get_generation(self.equipe.id)
+        self.assertEqual(
+            team_cache.team_key(self.equipe.id, 'resumo', 'p1'),
+            f'team:{self.equipe.id}:gen:{generation}:resumo:p1',
+        )
+
+    def test_save_bumps_generation_after_commit(self):
+        before = team_cache.get_generation(self.equipe.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente.nome = 'João Souza'
+            self.cliente.save()
+            # Not visible before the commit
+            self.assertEqual(team_cache.get_generation(self.equipe.id), before)
+        self.assertGreater(team_cache.get_generation(self.equipe.id), before)
+
+    def test_item_change_invalidates_cached_value(self):
+        encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(team_cache.get_or_set(self.equipe.id, 'contagem', compute), 1)
+        self.assertEqual(team_cache.get_or_set(self.equipe.id, 'contagem', compute), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemEncomenda.objects.create(
+                encomenda=Encomenda.objects.get(pk=encomenda.pk), produto=self.produto,
+                fornecedor=self.fornecedor, preco_cotado=Decimal('9.50'),
+            )
+        self.assertEqual(team_cache.get_or_set(self.equipe.id, 'contagem', compute), 2)
+
+    def test_other_team_is_not_invalidated(self):
+        _, outra_equipe, *_ = criar_equipe_com_dados('2')
+        before = team_cache.get_generation(outra_equipe.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.save()
+        self.assertEqual(team_cache.get_generation(outra_equipe.id), before)
+
+    def test_bump_never_relies_on_incr(self):
+        before = team_cache.get_generation(self.equipe.id)
+        # incr() is a non-atomic get+set on some backends: bumps do not use it,
+        # and stay past the current generation with a clock behind it
+        with mock.patch.object(caches['default'], 'incr', side_effect=AssertionError), \
+                mock.patch('encomendas.team_cache._new_generation', return_value=0):
+            self.assertEqual(team_cache.bump_generation(self.equipe.id), before + 1)
+            self.assertEqual(team_cache.bump_generation(self.equipe.id), before + 2)
+
+    def test_two_tier_serves_from_local_lru(self):
+        team = caches['team']
+        team.set('chave', 'valor')
+        caches['default'].clear() # Shared tier lost it; the local copy survives
+        self.assertEqual(team.get('chave'), 'valor')
+
+
+class ConditionalGetTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+        self.client.force_login(self.usuario)
+
+    def revalidate(self, url):
+        self.client.get(url) # Sets the CSRF cookie, which is part of the ETag
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('ETag', first.headers)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag'])
+
+    def test_detail_returns_304_when_unchanged(self):
+        url = reverse('encomenda_detail', args=[self.encomenda.pk])
+        first, second = self.revalidate(url)
+        self.assertIn('Last-Modified', first.headers)
+        self.assertEqual(second.status_code, 304)
+        with self.assertNumQueries(1):
+            # Session and user come from the cache: only the version query
+            self.client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag'])
+
+    def test_detail_etag_changes_with_entrega(self):
+        url = reverse('encomenda_detail', args=[self.encomenda.pk])
+        first, _ = self.revalidate(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Entrega.objects.create(encomenda=self.encomenda)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag']).status_code, 200)
+
+    def test_search_api_revalidates_on_team_generation(self):
+        url = reverse('search_produtos') + '?q=Dip'
+        first, second = self.revalidate(url)
+        self.assertEqual(second.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Produto.objects.create(equipe=self.equipe, nome='Dipirona Gotas', codigo='P9', preco_base=Decimal('5.00'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag']).status_code, 200)
+
+    def test_produto_info_not_found_is_not_conditional(self):
+        response = self.client.get(reverse('api_produto_info', args=[999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response.headers)
+
+
+class CatalogoSnapshotTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.client.force_login(self.usuario)
+        self.url = reverse('api_catalogo_equipe', args=[self.equipe.id])
+
+    def test_columnar_snapshot(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['produtos'], {
+            'id': [self.produto.id], 'codigo': ['P1'], 'nome': ['Dipirona Sódica'], 'preco_base': ['10.00'],
+        })
+        self.assertEqual(data['fornecedores']['id'], [self.fornecedor.id])
+        self.assertEqual(data['clientes']['nome'], ['João da Silva'])
+
+    def test_current_version_is_immutable(self):
+        versao = team_cache.get_generation(self.equipe.id)
+        response = self.client.get(self.url, {'v': versao})
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response.headers['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.preco_base = Decimal('12.00')
+            self.produto.save()
+        stale = self.client.get(self.url, {'v': versao}, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(stale.status_code, 200)
+        self.assertIn('no-cache', stale.headers['Cache-Control'])
+        self.assertEqual(stale.json()['produtos']['preco_base'], ['12.00'])
+
+    def test_other_team_is_forbidden(self):
+        outro_usuario, *_ = criar_equipe_com_dados('2')
+        self.client.force_login(outro_usuario)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_form_does_not_render_full_option_lists(self):
+        Produto.objects.create(equipe=self.equipe, nome='Outro Produto', codigo='P2', preco_base=Decimal('1.00'))
+        response = self.client.get(reverse('encomenda_create_equipe', args=[self.equipe.id]))
+        self.assertNotContains(response, 'Outro Produto')
+        self.assertContains(response, 'data-catalogo="produtos"')
+
+    def test_create_validates_items_against_team_catalog(self):
+        response = self.client.post(reverse('encomenda_create_equipe', args=[self.equipe.id]), {
+            'cliente': self.cliente.id, 'data_encomenda': '2026-01-10', 'responsavel_criacao': 'Teste',
+            'status': 'criada', 'observacoes': '',
+            'itens-TOTAL_FORMS': '1', 'itens-INITIAL_FORMS': '0', 'itens-MIN_NUM_FORMS': '1', 'itens-MAX_NUM_FORMS': '1000',
+            'itens-0-produto': self.produto.id, 'itens-0-fornecedor': self.fornecedor.id,
+            'itens-0-quantidade': '2', 'itens-0-preco_cotado': '10.00', 'itens-0-observacoes': '',
+        })
+        encomenda = Encomenda.objects.get()
+        self.assertRedirects(response, reverse('encomenda_detail', args=[encomenda.pk]))
+        self.assertEqual(encomenda.valor_total, Decimal('20.00'))
+
+
+class StaticAssetsTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, *_ = criar_equipe_com_dados()
+        self.client.force_login(self.usuario)
+
+    def test_pages_load_no_asset_from_a_cdn(self):
+        content = self.client.get(reverse('encomenda_list')).content.decode()
+        self.assertIn('/static/encomendas/css/base.css', content)
+        self.assertIn('/static/vendor/jquery/jquery-3.7.1.min.js', content)
+        self.assertIn('/static/vendor/select2/select2.min.js', content)
+        self.assertNotRegex(content, r'(src|href)="https?://')
+
+    def test_every_static_path_in_base_is_committed_or_pinned(self):
+        source = (Path(vendor.__file__).parent / 'templates' / 'encomendas' / 'base.html').read_text()
+        static_paths = re.findall(r"\{% static '([^']+)' %\}", source)
+        self.assertTrue(static_paths)
+        pinned = {f'vendor/{path}' for _, path in vendor.VENDOR_FILES}
+        for path in static_paths:
+            if path in pinned:
+                self.assertEqual(finders.find(path) is None, path[len('vendor/'):] in vendor.ausentes(), path)
+            else:
+                self.assertIsNotNone(finders.find(path), path)
+
+    def test_deploy_check_lists_missing_pinned_files(self):
+        with mock.patch.object(vendor, 'VENDOR_DIR', Path(self.enterContext(TemporaryDirectory()))):
+            erros = vendor.check_vendor_files(None)
+        self.assertEqual([erro.id for erro in erros], ['encomendas.E001'])
+        self.assertIn('bootstrap/bootstrap.min.css', erros[0].msg)
+        with mock.patch.object(vendor, 'ausentes', return_value=[]):
+            self.assertEqual(vendor.check_vendor_files(None), [])
+
+    @skipIf(vendor.ausentes(), 'static/vendor incompleto: rode manage.py baixar_assets')
+    def test_pages_render_with_manifest_storage(self):
+        storages = {**PLAIN_STORAGES, 'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+        }}
+        with TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            response = self.client.get(reverse('encomenda_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.content.decode(), r'/static/vendor/jquery/jquery-3\.7\.1\.min\.[0-9a-f]{12}\.js')
+
+
+class NavegacaoTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, *_ = criar_equipe_com_dados()
+        self.outra = Equipe.objects.create(nome='Outra Equipe', administrador=self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outra.adicionar_membro(self.usuario, papel='gerente')
+        self.client.force_login(self.usuario)
+        self.url = reverse('dashboard_equipe', args=[self.equipe.id])
+
+    def test_team_switcher_uses_cached_membership(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Outra Equipe')
+        self.assertEqual(
+            [(e.nome, e.papel) for e in response.context['navegacao'].equipes],
+            [('Equipe 1', 'administrador'), ('Outra Equipe', 'gerente')],
+        )
+        self.assertEqual(response.context['navegacao'].equipe_atual.id, str(self.equipe.id))
+        with mock.patch.object(membership, '_load', side_effect=AssertionError('not cached')):
+            self.assertContains(self.client.get(self.url), 'Outra Equipe')
+
+    def test_membership_invalidated_on_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outra.remover_membro(self.usuario)
+            ConviteEquipe.objects.create(
+                equipe=self.outra, email='USER1@exemplo.com', criado_por=self.usuario,
+                data_expiracao=timezone.now() + timedelta(days=7),
+            )
+        navegacao = self.client.get(self.url).context['navegacao']
+        self.assertEqual([e.nome for e in navegacao.equipes], ['Equipe 1'])
+        self.assertEqual(navegacao.convites_pendentes, 1)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = ('<tr><td>Dipirona Sódica 500mg</td><td>R$ 10,00</td></tr>' * 200).encode()
+
+    def process(self, response, accept_encoding='gzip, deflate, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_prefers_brotli_and_weakens_etag(self):
+        response = HttpResponse(self.body, headers={'ETag': '"abc"'})
+        response = self.process(response)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(brotli.decompress(response.content), self.body)
+
+    def test_gzip_when_brotli_not_accepted(self):
+        response = self.process(HttpResponse(self.body), accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_skips_small_and_precompressed_bodies(self):
+        small = self.process(HttpResponse(b'{"ok": true}', content_type='application/json'))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        pdf = self.process(HttpResponse(self.body, content_type='application/pdf'))
+        self.assertFalse(pdf.has_header('Content-Encoding'))
+        self.assertEqual(pdf.content, self.body)
+
+    def test_streaming_is_compressed_chunk_by_chunk(self):
+        metrics.reset()
+        consumed = []
+
+        def linhas():
+            for i in range(50):
+                consumed.append(i)
+                yield f'{i};Dipirona Sódica;10,00\n'.encode() * 20
+
+        response = self.process(StreamingHttpResponse(linhas(), content_type='text/csv'), accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        chunks = iter(response.streaming_content)
+        first = next(chunks)
+        self.assertEqual(consumed, [0]) # Output is flushed before the rest is generated
+        body = gzip.decompress(first + b''.join(chunks))
+        self.assertEqual(body, b''.join(f'{i};Dipirona Sódica;10,00\n'.encode() * 20 for i in range(50)))
+        self.assertIn('compression.gzip.ratio', metrics.snapshot()['timings'])
+
+    def test_html_gets_random_padding(self):
+        for encoding, decompress in (('br', brotli.decompress), ('gzip', gzip.decompress)):
+            with self.subTest(encoding=encoding):
+                sizes = set()
+                for _ in range(20):
+                    response = self.process(HttpResponse(self.body), accept_encoding=encoding)
+                    self.assertEqual(response['Content-Encoding'], encoding)
+                    self.assertEqual(decompress(response.content), self.body)
+                    sizes.add(len(response.content))
+                self.assertGreater(len(sizes), 1)
+
+        response = self.process(HttpResponse(self.body), accept_encoding='gzip')
+        self.assertTrue(response.content[3] & 0x08) # FNAME, as GZipMiddleware pads
+
+    def test_json_is_not_padded(self):
+        for encoding in ('br', 'gzip'):
+            with self.subTest(encoding=encoding):
+                sizes = {
+                    len(self.process(HttpResponse(self.body, content_type='application/json'), accept_encoding=encoding).content)
+                    for _ in range(5)
+                }
+                self.assertEqual(len(sizes), 1)
+
+    def test_streamed_html_is_padded(self):
+        def comprimido(padding):
+            with mock.patch('encomendas.middleware.secrets.randbelow', return_value=padding):
+                response = self.process(StreamingHttpResponse(iter([self.body] * 3)), accept_encoding='br')
+                return b''.join(response.streaming_content)
+
+        sem, com = comprimido(0), comprimido(99)
+        self.assertEqual(brotli.decompress(com), self.body * 3)
+        self.assertGreaterEqual(len(com), len(sem) + 99)
+
+
+class CachedAuthTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, *_ = criar_equipe_com_dados()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('login'), {'email': self.usuario.email, 'password': 'senha-forte-123'})
+
+    def test_page_does_no_session_or_user_queries(self):
+        url = reverse('listar_equipes')
+        self.client.get(url) # Warms the user and membership caches
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch('django.contrib.auth.backends.ModelBackend.get_user', side_effect=AssertionError('not cached')):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'django_session' in q['sql']])
+
+    def test_cache_holds_no_password_hash(self):
+        self.client.get(reverse('listar_equipes'))
+        cached = caches['default'].get(auth_backends._user_key(self.usuario.pk))
+        self.assertNotIn('password', cached['fields'])
+        self.assertNotIn('token_reset_senha', cached['fields'])
+        self.assertNotIn(self.usuario.password, repr(cached))
+        self.assertEqual(cached['fields']['email'], self.usuario.email)
+        user = auth_backends.CachedModelBackend().get_user(self.usuario.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.get_session_auth_hash(), self.usuario.get_session_auth_hash())
+        with self.assertNumQueries(1): # Deferred, loaded only when needed
+            self.assertTrue(user.check_password('senha-forte-123'))
+
+    def test_password_change_invalidates_cached_user(self):
+        self.client.get(reverse('listar_equipes'))
+        outro_cliente = self.client_class()
+        outro_cliente.force_login(self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('alterar_senha'), {
+                'senha_atual': 'senha-forte-123', 'nova_senha': 'outra-senha-456', 'confirmar_senha': 'outra-senha-456',
+            })
+        self.assertRedirects(response, reverse('perfil'), fetch_redirect_response=False)
+        # This session was rehashed; others are logged out with the new password.
+        self.assertEqual(self.client.get(reverse('listar_equipes')).status_code, 200)
+        self.assertRedirects(outro_cliente.get(reverse('listar_equipes')), reverse('login') + '?next=' + reverse('listar_equipes'))
+
+    def test_messages_use_cookie_storage(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('criar_equipe'), {'nome': 'Nova Equipe', 'descricao': ''})
+        self.assertIn('messages', response.cookies)
+
+
+@override_settings(AUTH_THROTTLE={
+    'login': {'ip': (10, 60), 'conta': (3, 300)},
+})
+class LoginThrottleTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.usuario, *_ = criar_equipe_com_dados()
+        self.url = reverse('login')
+
+    def tentar(self, email, ip='10.0.0.1', password='errada'):
+        return self.client.post(self.url, {'email': email, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_burst_is_rejected_before_hashing(self):
+        with mock.patch.object(Usuario, 'check_password', autospec=True, return_value=False) as check_password:
+            statuses = [self.tentar(f'ataque{i}@exemplo.com').status_code for i in range(25)]
+        self.assertEqual(statuses[:10], [200] * 10)
+        self.assertEqual(set(statuses[10:]), {429})
+        # Unknown e-mails still cost one hash each inside ModelBackend; rejected ones none.
+        self.assertLessEqual(check_password.call_count, 10)
+        self.assertEqual(metrics.snapshot()['counters']['throttle.login.rejected.ip'], 15)
+
+    def test_account_bucket_spans_ips(self):
+        for i in range(3):
+            self.assertEqual(self.tentar(self.usuario.email.upper(), ip=f'10.0.1.{i}').status_code, 200)
+        response = self.tentar(self.usuario.email, ip='10.0.2.1', password='senha-forte-123')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        # Other accounts from a fresh IP are unaffected
+        self.assertEqual(self.tentar('outro@exemplo.com', ip='10.0.3.1').status_code, 200)
+
+    def test_bucket_refills_over_time(self):
+        with mock.patch('encomendas.throttle.time.time', return_value=1000.0):
+            for _ in range(3):
+                self.tentar(self.usuario.email)
+            self.assertEqual(self.tentar(self.usuario.email).status_code, 429)
+        with mock.patch('encomendas.throttle.time.time', return_value=1100.0): # 300s / 3 tokens
+            self.tentar(self.usuario.email, password='senha-forte-123')
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.usuario.pk))
+
+
+class EmailNormalizadoTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, *_ = criar_equipe_com_dados()
+
+    def test_emails_stored_lowercase_and_login_ignores_case(self):
+        usuario = Usuario.objects.create_user(
+            username='maria', email='  Maria.Souza@Exemplo.COM ', password='senha-forte-123',
+            nome_completo='Maria', identificacao='999', cargo='Gerente',
+        )
+        self.assertEqual(usuario.email, 'maria.souza@exemplo.com')
+        self.client.post(reverse('login'), {'email': 'MARIA.SOUZA@exemplo.com', 'password': 'senha-forte-123'})
+        self.assertEqual(self.client.session['_auth_user_id'], str(usuario.pk))
+
+    def test_pending_invites_use_exact_lookup(self):
+        convite = ConviteEquipe.objects.create(
+            equipe=self.equipe, email='User1@Exemplo.com', criado_por=self.usuario,
+            data_expiracao=timezone.now() + timedelta(days=7),
+        )
+        self.assertEqual(convite.email, 'user1@exemplo.com')
+        self.client.force_login(self.usuario)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('listar_equipes'))
+        self.assertEqual(list(response.context['convites_pendentes']), [convite])
+        self.assertFalse([q['sql'] for q in queries if 'LIKE' in q['sql'] or 'UPPER(' in q['sql']])
+
+    def test_backfill_migration_lowercases_in_batches(self):
+        from importlib import import_module
+        from django.apps import apps
+        migracao = import_module('encomendas.migrations.0004_normalizar_emails')
+        Usuario.objects.filter(pk=self.usuario.pk).update(email='USER1@Exemplo.com')
+        duplicado = Usuario.objects.create_user(
+            username='dup', email='dup@exemplo.com', password='x', nome_completo='Dup', identificacao='998', cargo='-',
+        )
+        Usuario.objects.filter(pk=duplicado.pk).update(email='User1@exemplo.com') # Differs only by case
+        outros = [
+            Usuario(username=f'u{i}', email=f'Outro{i}@Exemplo.com', nome_completo='-', identificacao=f'9{i}', cargo='-')
+            for i in range(5)
+        ]
+        Usuario.objects.bulk_create(outros) # bulk_create skips save(), so these keep their case
+        with mock.patch.object(migracao, 'BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            migracao.normalizar_emails(apps, None)
+        self.assertEqual(Usuario.objects.get(pk=self.usuario.pk).email, 'user1@exemplo.com')
+        self.assertEqual(Usuario.objects.get(pk=duplicado.pk).email, 'User1@exemplo.com')
+        self.assertEqual(Usuario.objects.filter(email__startswith='outro').count(), 5)
+        # One GROUP BY for the collisions instead of one lookup per row
+        self.assertEqual(sum('GROUP BY' in q['sql'] for q in queries), 1)
+        self.assertLess(len(queries), 15)
+
+    def test_accounts_kept_by_backfill_still_log_in(self):
+        duplicado = Usuario.objects.create_user(
+            username='dup', email='dup@exemplo.com', password='outra-senha-456',
+            nome_completo='Dup', identificacao='998', cargo='-',
+        )
+        Usuario.objects.filter(pk=duplicado.pk).update(email='User1@Exemplo.com') # Kept by migration 0004
+        self.client.post(reverse('login'), {'email': 'User1@Exemplo.com', 'password': 'outra-senha-456'})
+        self.assertEqual(self.client.session['_auth_user_id'], str(duplicado.pk))
+        self.client.logout()
+        self.client.post(reverse('login'), {'email': 'USER1@exemplo.com', 'password': 'senha-forte-123'})
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.usuario.pk))
+
+
+class AsyncApiTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+        outro, self.outra_equipe, *_ = criar_equipe_com_dados('2')
+
+    async def test_search_views_are_async_and_team_scoped(self):
+        self.assertTrue(iscoroutinefunction(views.search_clientes))
+        await self.async_client.aforce_login(self.usuario)
+        response = await self.async_client.get(reverse('search_clientes'), {'q': '99999'}) # Matches telefone
+        self.assertEqual(response.json()['results'], [{'id': self.cliente.id, 'text': 'C1 - João da Silva (Equipe 1)'}])
+        response = await self.async_client.get(reverse('search_produtos'), {'q': 'Dip', 'equipe_id': self.outra_equipe.id})
+        self.assertEqual(response.json()['results'], [])
+
+    async def test_update_status_and_produto_info(self):
+        await self.async_client.aforce_login(self.usuario)
+        response = await self.async_client.post(
+            reverse('api_update_status', args=[self.encomenda.pk]), {'status': 'pronta'}
+        )
+        self.assertEqual(response.json()['status_code'], 'pronta')
+        await self.encomenda.arefresh_from_db()
+        self.assertEqual(self.encomenda.status, 'pronta')
+        response = await self.async_client.get(reverse('api_produto_info', args=[self.produto.id]))
+        self.assertEqual(response.json()['preco_base'], '10.00')
+        self.assertIn('ETag', response.headers)
+
+    async def test_anonymous_is_redirected_to_login(self):
+        response = await self.async_client.get(reverse('search_produtos'))
+        self.assertEqual(response.status_code, 302)
+
+
+def _eventos_sse(chunk):
+    """(event, data) pairs of a chunk of a text/event-stream body."""
+    mensagens = []
+    for bloco in chunk.decode().split('\n\n'):
+        campos = dict(linha.split(': ', 1) for linha in bloco.splitlines() if ': ' in linha and not linha.startswith(':'))
+        if 'event' in campos:
+            mensagens.append((campos['event'], json.loads(campos['data'])))
+    return mensagens
+
+
+class EventosEquipeTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, *_ = criar_equipe_com_dados()
+        self.desde = round((timezone.now() - timedelta(seconds=1)).timestamp() * 1_000_000)
+        self.encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+        outro, self.outra_equipe, *_ = criar_equipe_com_dados('2')
+
+    async def test_hub_wakes_subscribers_from_other_threads(self):
+        with eventos.Assinatura(self.equipe.id) as assinatura:
+            self.assertEqual(eventos.assinantes(self.equipe.id), 1)
+            self.assertFalse(await assinatura.esperar(0.01))
+            threading.Thread(target=eventos.publicar, args=[self.equipe.id]).start()
+            self.assertTrue(await assinatura.esperar(1))
+        self.assertEqual(eventos.assinantes(self.equipe.id), 0)
+
+    async def test_stream_pushes_new_orders_and_status_changes(self):
+        await self.async_client.aforce_login(self.usuario)
+        response = await self.async_client.get(
+            reverse('api_eventos_equipe', args=[self.equipe.id]), {'desde': self.desde}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+            evento, dados = _eventos_sse(await anext(stream))[0]
+            self.assertEqual((evento, dados['numero'], dados['status'], dados['nova']), ('encomenda', self.encomenda.pk, 'criada', True))
+
+            self.encomenda.status = 'pronta'
+            await self.encomenda.asave(update_fields=['status', 'updated_at'])
+            eventos.publicar(self.equipe.id) # On commit, in production
+            evento, dados = _eventos_sse(await asyncio.wait_for(anext(stream), 2))[0]
+            self.assertEqual((dados['status'], dados['status_display']), ('pronta', 'Pronta para Entrega'))
+        finally:
+            await stream.aclose()
+
+    def test_wsgi_returns_changes_once_and_checks_team(self):
+        self.client.force_login(self.usuario)
+        with self.assertWarns(Warning): # WSGI consumes the async stream in one go
+            response = self.client.get(reverse('api_eventos_equipe', args=[self.equipe.id]), {'desde': self.desde})
+            corpo = b''.join(response)
+        self.assertEqual([evento for evento, _ in _eventos_sse(corpo)], ['encomenda'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        response = self.client.get(reverse('api_eventos_equipe', args=[self.outra_equipe.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+@skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    'An in-memory SQLite database is never really closed',
+)
+class EventosConexoesTests(EncomendasTransactionTestCase):
+    """Outside TestCase's transaction, as in production, so connections really are given back."""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, *_ = criar_equipe_com_dados()
+        self.encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+
+    async def test_idle_streams_hold_no_connection(self):
+        total = pool_base.POOL_DEFAULTS['MAX_SIZE'] + 2
+        url = reverse('api_eventos_equipe', args=[self.equipe.id])
+        desde = round((timezone.now() - timedelta(seconds=5)).timestamp() * 1_000_000)
+        await self.async_client.aforce_login(self.usuario)
+        # In the thread the streams' queries run in (thread-sensitive sync_to_async)
+        conectado = sync_to_async(
+            lambda: connection.connection is not None or any(stats['in_use'] for stats in pool_base.pool_stats().values())
+        )
+        streams = []
+        try:
+            for _ in range(total):
+                response = await self.async_client.get(url, {'desde': desde})
+                self.assertTrue(await conectado()) # The view's own team check
+                streams.append(aiter(response.streaming_content))
+                await anext(streams[-1]) # retry:
+                await anext(streams[-1]) # First batch, then the stream waits
+                self.assertFalse(await conectado())
+
+            self.encomenda.status = 'pronta'
+            await self.encomenda.asave(update_fields=['status', 'updated_at'])
+            eventos.publicar(self.equipe.id)
+            for stream in streams:
+                evento, dados = _eventos_sse(await asyncio.wait_for(anext(stream), 2))[0]
+                self.assertEqual(dados['status'], 'pronta')
+                # Polled again and gave the connection back before waiting
+                self.assertFalse(await conectado())
+        finally:
+            for stream in streams:
+                await stream.aclose()
+
+
+class ManifestoEntregasTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, *_ = criar_equipe_com_dados()
+        self.hoje = timezone.localdate()
+
+    def entrega(self, bairro, data_prevista, status='pronta', **kwargs):
+        cliente = Cliente.objects.create(
+            equipe=self.equipe, nome=f'Cliente {bairro}', codigo=f'C-{bairro}-{Encomenda.objects.count()}',
+            endereco='Rua B, 2', bairro=bairro,
+        )
+        encomenda = Encomenda.objects.create(
+            cliente=cliente, equipe=self.equipe, responsavel_criacao='Teste', status=status, valor_total=Decimal('50.00'),
+        )
+        return Entrega.objects.create(encomenda=encomenda, data_prevista=data_prevista, **kwargs)
+
+    def test_route_follows_learned_distances(self):
+        custos = {frozenset(par): minutos for par, minutos in [
+            (('a', 'c'), 5), (('c', 'b'), 5), (('b', 'd'), 5), (('a', 'b'), 50), (('a', 'd'), 50),
+        ]}
+        self.assertEqual(manifesto.ordenar_bairros(['d', 'b', 'c', 'a'], custos), ['a', 'c', 'b', 'd'])
+        self.assertEqual(manifesto.ordenar_bairros(['d', 'b', 'c', 'a'], custos, Counter(d=3))[0], 'd')
+
+    def test_manifest_groups_by_bairro_in_route_order(self):
+        # Mid-morning, so the history never straddles local midnight
+        ontem = timezone.make_aware(datetime.combine(self.hoje - timedelta(days=1), datetime.min.time()) + timedelta(hours=10))
+        # History: yesterday's route went Centro -> Funcionários -> Benfica
+        for minutos, bairro in [(0, 'Centro'), (10, 'Funcionários'), (20, 'Benfica')]:
+            self.entrega(bairro, ontem.date() - timedelta(days=3), data_realizada=ontem + timedelta(minutes=minutos))
+        hoje = [self.entrega(bairro, self.hoje) for bairro in ['Benfica', ' Centro ', 'Funcionários']]
+        atrasada = self.entrega('Benfica', self.hoje - timedelta(days=2))
+        self.entrega('Centro', self.hoje, status='cancelada')
+        self.entrega('Centro', self.hoje + timedelta(days=1))
+
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('manifesto_entregas', args=[self.equipe.id]))
+        roteiro = response.context['manifesto']
+        self.assertEqual([parada.bairro for parada in roteiro.paradas], ['Centro', 'Funcionários', 'Benfica'])
+        self.assertEqual(
+            sorted(item.numero for item in roteiro.paradas[2].itens), [hoje[0].encomenda_id, atrasada.encomenda_id]
+        )
+        self.assertEqual((roteiro.total_entregas, roteiro.total_a_receber), (4, Decimal('200.00')))
+        self.assertContains(response, 'Atrasada')
+
+        # Warmed by the morning command: the view only checks the entregas' version
+        amanha = self.hoje + timedelta(days=1)
+        call_command('gerar_manifestos', '--dia', amanha.isoformat(), stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            manifesto.get_manifesto(self.equipe.id, amanha)
+        self.assertEqual(len(queries), 1)
+
+    def test_cache_survives_unrelated_team_writes(self):
+        entrega = self.entrega('Centro', self.hoje)
+        gerado_em = manifesto.get_manifesto(self.equipe.id, self.hoje).gerado_em
+        with self.captureOnCommitCallbacks(execute=True):
+            Produto.objects.create(equipe=self.equipe, nome='Outro', codigo='P-outro', preco_base=Decimal('1.00'))
+            Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+        self.assertEqual(manifesto.get_manifesto(self.equipe.id, self.hoje).gerado_em, gerado_em)
+
+        entrega.observacoes_entrega = 'Portão azul'
+        entrega.save()
+        roteiro = manifesto.get_manifesto(self.equipe.id, self.hoje)
+        self.assertEqual(roteiro.paradas[0].itens[0].observacoes, 'Portão azul')
+        Entrega.objects.filter(pk=entrega.pk).delete()
+        self.assertEqual(manifesto.get_manifesto(self.equipe.id, self.hoje).total_entregas, 0)
+
+
+class FilaTrabalhoTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, *_ = criar_equipe_com_dados()
+        self.colega = Usuario.objects.create_user(
+            username='colega', email='colega@exemplo.com', password='senha-forte-123',
+            nome_completo='Colega', identificacao='0009', cargo='Atendente',
+        )
+        self.equipe.adicionar_membro(self.colega)
+        self.cotacoes = [
+            Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', status='cotacao')
+            for _ in range(3)
+        ]
+
+    def test_claims_are_exclusive_and_expire(self):
+        primeira = fila.reservar('cotacao', self.equipe.id, self.usuario, 2)
+        self.assertEqual(primeira, [encomenda.pk for encomenda in self.cotacoes[:2]])
+        self.assertEqual(fila.reservar('cotacao', self.equipe.id, self.colega, 5), [self.cotacoes[2].pk])
+        self.assertEqual(fila.reservar('cotacao', self.equipe.id, self.colega, 5), [])
+
+        with mock.patch('encomendas.fila.timezone.now', return_value=timezone.now() + fila.lease() + timedelta(seconds=1)):
+            # Every lease ran out, the colleague's own included
+            self.assertEqual(fila.reservar('cotacao', self.equipe.id, self.colega, 5), [e.pk for e in self.cotacoes])
+        self.assertEqual(fila.liberar('cotacao', self.equipe.id, self.usuario, primeira), 0) # Lost the lease
+
+    def test_saving_a_stale_copy_keeps_the_claim(self):
+        # Read by an edit form, then claimed by someone else before it is saved
+        encomenda = Encomenda.objects.get(pk=self.cotacoes[0].pk)
+        entrega = Entrega.objects.create(encomenda=encomenda, data_prevista=timezone.localdate())
+        entrega = Entrega.objects.get(pk=entrega.pk)
+        fila.reservar('cotacao', self.equipe.id, self.colega)
+        fila.reservar('entregas', self.equipe.id, self.colega)
+        encomenda.observacoes = 'Editada'
+        encomenda.save()
+        entrega.observacoes_entrega = 'Editada'
+        entrega.save()
+        for model in (Encomenda, Entrega):
+            with self.subTest(model=model.__name__):
+                self.assertEqual(model.objects.filter(reservada_por=self.colega, reservada_ate__isnull=False).count(), 1)
+        self.assertEqual(Encomenda.objects.get(pk=encomenda.pk).observacoes, 'Editada')
+        self.assertEqual(Entrega.objects.get(pk=entrega.pk).observacoes_entrega, 'Editada')
+
+    def test_api_claim_renew_release(self):
+        self.client.force_login(self.usuario)
+        url = lambda nome, acao='': reverse(f'api_fila{acao}', args=[self.equipe.id, nome])
+        response = self.client.post(url('cotacao', '_reservar'), {'quantidade': 2})
+        ids = [item['id'] for item in response.json()['itens']]
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(self.client.post(url('cotacao', '_renovar'), {'ids': ids}).json(), {'renovados': 2})
+        self.assertEqual(self.client.post(url('cotacao', '_liberar'), {'ids': ids[:1]}).json(), {'liberados': 1})
+        resumo = self.client.get(url('cotacao')).json()
+        self.assertEqual((resumo['livres'], [item['id'] for item in resumo['minhas']]), (2, ids[1:]))
+        self.assertEqual(self.client.get(url('inexistente')).status_code, 404)
+
+        # Claims do not count as edits of the order
+        originais = {encomenda.pk: encomenda.updated_at for encomenda in self.cotacoes}
+        self.assertEqual(Encomenda.objects.get(pk=ids[1]).updated_at, originais[ids[1]])
+
+        entrega = Entrega.objects.create(encomenda=self.cotacoes[0], data_prevista=timezone.localdate())
+        Entrega.objects.create(encomenda=self.cotacoes[1], data_prevista=timezone.localdate() + timedelta(days=1))
+        response = self.client.post(url('entregas', '_reservar'), {'quantidade': 5})
+        self.assertEqual([item['id'] for item in response.json()['itens']], [entrega.pk])
+
+
+class ConfirmarEntregasTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, *_ = criar_equipe_com_dados()
+        outro, outra_equipe, outro_cliente, *_ = criar_equipe_com_dados('2')
+        self.entregas = [
+            Entrega.objects.create(encomenda=Encomenda.objects.create(
+                cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', status='pronta'
+            ))
+            for _ in range(3)
+        ]
+        self.alheia = Entrega.objects.create(encomenda=Encomenda.objects.create(
+            cliente=outro_cliente, equipe=outra_equipe, responsavel_criacao='Teste'
+        ))
+
+    def confirmar(self, confirmacoes):
+        return self.client.post(
+            reverse('api_confirmar_entregas'), json.dumps({'confirmacoes': confirmacoes}), content_type='application/json'
+        )
+
+    def test_batch_is_applied_with_per_item_results(self):
+        self.client.force_login(self.usuario)
+        quando = timezone.now() - timedelta(hours=2)
+        itens = [
+            {'entrega': entrega.pk, 'data_realizada': quando.isoformat(), 'entregue_por': 'Carlos', 'assinatura_cliente': True}
+            for entrega in self.entregas[:2]
+        ]
+        itens += [
+            {'entrega': self.alheia.pk, 'data_realizada': quando.isoformat()},
+            {'entrega': self.entregas[2].pk, 'data_realizada': 'ontem'},
+        ]
+        geracao = team_cache.get_generation(self.equipe.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.confirmar(itens)
+        self.assertEqual(
+            [resultado['status'] for resultado in response.json()['resultados']],
+            ['ok', 'ok', 'nao_encontrada', 'invalida'],
+        )
+        self.assertNotEqual(team_cache.get_generation(self.equipe.id), geracao)
+
+        entrega = Entrega.objects.select_related('encomenda').get(pk=self.entregas[0].pk)
+        self.assertEqual((entrega.data_realizada, entrega.entregue_por, entrega.assinatura_cliente), (quando, 'Carlos', True))
+        self.assertEqual(entrega.encomenda.status, 'entregue')
+        self.assertEqual(Encomenda.objects.get(pk=self.entregas[2].encomenda_id).status, 'pronta')
+
+        # Resending the same batch (e.g. after a timeout) changes nothing
+        response = self.confirmar(itens[:2])
+        self.assertEqual(response.json()['confirmadas'], 0)
+        self.assertEqual({r['status'] for r in response.json()['resultados']}, {'ja_realizada'})
+
+    def test_rejects_malformed_body(self):
+        self.client.force_login(self.usuario)
+        response = self.client.post(reverse('api_confirmar_entregas'), 'não é json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class VendasRollupTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.produto.categoria = 'Analgésicos'
+        self.produto.save()
+        self.outro_produto = Produto.objects.create(
+            equipe=self.equipe, nome='Amoxicilina', codigo='P-AMOX', preco_base=Decimal('30.00'), categoria='Antibióticos',
+        )
+
+    def encomenda(self, data, itens, status='criada'):
+        with self.captureOnCommitCallbacks(execute=True):
+            encomenda = Encomenda.objects.create(
+                cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', data_encomenda=data, status=status,
+            )
+            for produto, quantidade, preco in itens:
+                ItemEncomenda.objects.create(
+                    encomenda=encomenda, produto=produto, fornecedor=self.fornecedor,
+                    quantidade=quantidade, preco_cotado=preco, valor_total=quantidade * preco,
+                )
+        return encomenda
+
+    def test_rollup_follows_changes_and_pivots(self):
+        janeiro = self.encomenda(date(2025, 1, 10), [(self.produto, 2, Decimal('10.00')), (self.outro_produto, 1, Decimal('30.00'))])
+        self.encomenda(date(2025, 2, 5), [(self.produto, 3, Decimal('10.00'))])
+        self.encomenda(date(2025, 2, 6), [(self.produto, 9, Decimal('10.00'))], status='cancelada')
+
+        relatorio = vendas.relatorio(self.equipe.id, 'produto', 'mes')
+        self.assertEqual(relatorio.linhas, ['Amoxicilina', 'Dipirona Sódica'])
+        self.assertEqual(relatorio.colunas, [date(2025, 1, 1), date(2025, 2, 1)])
+        self.assertEqual(relatorio.valores, [[Decimal('30.00'), 0], [Decimal('20.00'), Decimal('30.00')]])
+        self.assertEqual(relatorio.total, Decimal('80.00'))
+
+        # Moving an order to another month moves its sales out of the old slice
+        with self.captureOnCommitCallbacks(execute=True):
+            janeiro.data_encomenda = date(2025, 2, 20)
+            janeiro.save()
+        relatorio = vendas.relatorio(self.equipe.id, 'categoria', medida='quantidade', de=date(2025, 1, 1), ate=date(2025, 1, 1))
+        self.assertEqual(relatorio.total, 0)
+        relatorio = vendas.relatorio(self.equipe.id, 'categoria', medida='quantidade')
+        self.assertEqual(list(zip(relatorio.linhas, relatorio.totais_linhas)), [('Analgésicos', 5), ('Antibióticos', 1)])
+
+        # The rebuild command produces the same cube
+        antes = sorted(VendaMensal.objects.values_list('mes', 'produto_id', 'status', 'quantidade', 'valor_total'))
+        VendaMensal.objects.all().delete()
+        call_command('reconstruir_vendas', '--workers', '1', stdout=StringIO())
+        self.assertEqual(sorted(VendaMensal.objects.values_list('mes', 'produto_id', 'status', 'quantidade', 'valor_total')), antes)
+
+    def test_cliente_rollup(self):
+        outro_cliente = Cliente.objects.create(equipe=self.equipe, nome='Ana Souza', codigo='C-ANA', endereco='Rua C, 3', bairro='Centro')
+        fevereiro = self.encomenda(date(2025, 2, 5), [(self.produto, 3, Decimal('10.00')), (self.outro_produto, 1, Decimal('30.00'))])
+        self.encomenda(date(2025, 2, 6), [(self.produto, 1, Decimal('10.00'))])
+        with self.captureOnCommitCallbacks(execute=True):
+            fevereiro.cliente = outro_cliente
+            fevereiro.save()
+
+        relatorio = vendas.relatorio(self.equipe.id, 'cliente', 'status')
+        self.assertEqual(relatorio.linhas, ['Ana Souza', 'João da Silva'])
+        self.assertEqual(relatorio.totais_linhas, [Decimal('60.00'), Decimal('10.00')])
+        with self.assertRaises(ValueError):
+            vendas.relatorio(self.equipe.id, 'cliente', 'produto')
+
+        antes = sorted(VendaClienteMensal.objects.values_list('mes', 'cliente_id', 'status', 'quantidade', 'valor_total'))
+        VendaClienteMensal.objects.all().delete()
+        self.assertEqual(vendas.reconstruir_equipe(self.equipe.id), 4) # 2 produto rows, 2 cliente rows
+        self.assertEqual(sorted(VendaClienteMensal.objects.values_list('mes', 'cliente_id', 'status', 'quantidade', 'valor_total')), antes)
+
+    def cubos(self):
+        return (
+            sorted(VendaMensal.objects.values_list('mes', 'produto_id', 'fornecedor_id', 'status', 'quantidade', 'valor_total', 'itens')),
+            sorted(VendaClienteMensal.objects.values_list('mes', 'cliente_id', 'status', 'quantidade', 'valor_total', 'itens')),
+        )
+
+    def test_writes_apply_deltas_that_match_a_rebuild(self):
+        outro_cliente = Cliente.objects.create(equipe=self.equipe, nome='Ana Souza', codigo='C-ANA', endereco='Rua C, 3')
+        janeiro = self.encomenda(date(2025, 1, 10), [(self.produto, 2, Decimal('10.00')), (self.outro_produto, 1, Decimal('30.00'))])
+        fevereiro = self.encomenda(date(2025, 2, 5), [(self.produto, 3, Decimal('10.00'))])
+        # A write touches only its own rows: no aggregate over the month, no archive read
+        item = ItemEncomenda.objects.get(encomenda=janeiro, produto=self.produto)
+        item.quantidade, item.valor_total = 4, Decimal('40.00')
+        with CaptureQueriesContext(connection) as queries:
+            item.save()
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('GROUP BY', sql)
+        self.assertNotIn('itemencomendaarquivado', sql)
+
+        item.produto = self.outro_produto
+        item.save() # Merges into the other item's row
+        janeiro.status, janeiro.cliente = 'aprovada', outro_cliente
+        janeiro.save()
+        fevereiro.data_encomenda = date(2025, 3, 1)
+        fevereiro.save(update_fields=['data_encomenda'])
+        ItemEncomenda.objects.filter(encomenda=janeiro).first().delete()
+        fevereiro.delete()
+
+        # Order form and batch delivery confirmation (set-based writes)
+        self.client.force_login(self.usuario)
+        itens = list(janeiro.itens.all())
+        dados = {
+            'cliente': outro_cliente.pk, 'data_encomenda': '2025-01-10', 'status': 'pronta', 'observacoes': '',
+            'responsavel_criacao': 'Teste',
+            'itens-TOTAL_FORMS': len(itens) + 1, 'itens-INITIAL_FORMS': len(itens),
+            'itens-MIN_NUM_FORMS': 0, 'itens-MAX_NUM_FORMS': 1000,
+        }
+        for indice, item in enumerate(itens):
+            dados.update({
+                f'itens-{indice}-id': item.pk, f'itens-{indice}-produto': item.produto_id,
+                f'itens-{indice}-fornecedor': item.fornecedor_id, f'itens-{indice}-quantidade': 7,
+                f'itens-{indice}-preco_cotado': '10.00', f'itens-{indice}-observacoes': '',
+            })
+        indice = len(itens)
+        dados.update({
+            f'itens-{indice}-produto': self.produto.pk, f'itens-{indice}-fornecedor': self.fornecedor.pk,
+            f'itens-{indice}-quantidade': 1, f'itens-{indice}-preco_cotado': '5.00', f'itens-{indice}-observacoes': '',
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('encomenda_edit', args=[janeiro.pk]), dados)
+        self.assertEqual(response.status_code, 302)
+        entrega = Entrega.objects.create(encomenda=janeiro, data_prevista=date(2025, 1, 12))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('api_confirmar_entregas'),
+                json.dumps({'confirmacoes': [{'entrega': entrega.pk, 'data_realizada': timezone.now().isoformat()}]}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.json()['confirmadas'], 1)
+
+        incremental = self.cubos()
+        self.assertEqual(incremental[1], [(date(2025, 1, 1), outro_cliente.pk, 'entregue', 8, Decimal('75.00'), 2)])
+        vendas.reconstruir_equipe(self.equipe.id)
+        self.assertEqual(self.cubos(), incremental)
+
+    def test_report_api_is_for_managers(self):
+        self.encomenda(date(2025, 3, 1), [(self.produto, 1, Decimal('10.00'))])
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('api_relatorio_vendas', args=[self.equipe.id]), {'linhas': 'status'})
+        self.assertEqual(response.json()['linhas'], ['Criada'])
+        response = self.client.get(reverse('api_relatorio_vendas', args=[self.equipe.id]), {'linhas': 'cliente', 'colunas': 'mes'})
+        self.assertEqual(response.json()['linhas'], ['João da Silva'])
+        self.assertEqual(self.client.get(reverse('api_relatorio_vendas', args=[self.equipe.id]), {'linhas': 'dia'}).status_code, 400)
+        response = self.client.get(reverse('relatorio_vendas', args=[self.equipe.id]), {'linhas': 'mes', 'colunas': 'fornecedor'})
+        self.assertContains(response, '03/2025')
+
+        membro = Usuario.objects.create_user(
+            username='membro', email='membro@exemplo.com', password='senha-forte-123',
+            nome_completo='Membro', identificacao='0008', cargo='Atendente',
+        )
+        self.equipe.adicionar_membro(membro)
+        self.client.force_login(membro)
+        self.assertEqual(self.client.get(reverse('api_relatorio_vendas', args=[self.equipe.id])).status_code, 404)
+
+
+class PrecosFornecedorTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.outro_fornecedor = Fornecedor.objects.create(equipe=self.equipe, nome='Atacadão', codigo='F-ATA')
+
+    def cotar(self, data, preco, fornecedor=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            encomenda = Encomenda.objects.create(
+                cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', data_encomenda=data,
+            )
+            return ItemEncomenda.objects.create(
+                encomenda=encomenda, produto=self.produto, fornecedor=fornecedor or self.fornecedor,
+                quantidade=1, preco_cotado=preco, valor_total=preco,
+            )
+
+    def test_statistics_follow_quotes(self):
+        for dia, preco in enumerate(['10.00', '11.00', '10.50', '10.00', '11.50'], 1):
+            self.cotar(date(2025, 1, dia), Decimal(preco))
+        indice = PrecoFornecedor.objects.get(produto=self.produto, fornecedor=self.fornecedor)
+        self.assertEqual((indice.ultimo_preco, indice.ultima_cotacao, indice.amostras), (Decimal('11.50'), date(2025, 1, 5), 5))
+        self.assertEqual((indice.minimo, indice.mediana, indice.maximo), (Decimal('10.00'), Decimal('10.50'), Decimal('11.50')))
+        self.assertFalse(indice.ultimo_atipico)
+
+        # A price far outside the usual range is flagged
+        item = self.cotar(date(2025, 1, 6), Decimal('25.00'))
+        self.assertTrue(PrecoFornecedor.objects.get(produto=self.produto, fornecedor=self.fornecedor).ultimo_atipico)
+
+        # Moving the item to another supplier updates both pairs
+        with self.captureOnCommitCallbacks(execute=True):
+            item.fornecedor = self.outro_fornecedor
+            item.save()
+        self.assertEqual(PrecoFornecedor.objects.get(produto=self.produto, fornecedor=self.fornecedor).ultimo_preco, Decimal('11.50'))
+        self.assertEqual(PrecoFornecedor.objects.get(produto=self.produto, fornecedor=self.outro_fornecedor).amostras, 1)
+
+        # Deleting the last quote of a pair removes its row; the command rebuilds the same index
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertFalse(PrecoFornecedor.objects.filter(fornecedor=self.outro_fornecedor).exists())
+        antes = list(PrecoFornecedor.objects.values_list('produto_id', 'fornecedor_id', 'ultimo_preco', 'media', 'p25', 'p75'))
+        PrecoFornecedor.objects.all().delete()
+        call_command('reconstruir_precos', stdout=StringIO())
+        self.assertEqual(list(PrecoFornecedor.objects.values_list('produto_id', 'fornecedor_id', 'ultimo_preco', 'media', 'p25', 'p75')), antes)
+
+    def test_price_api_lists_suppliers_cheapest_first(self):
+        self.cotar(date(2025, 2, 1), Decimal('12.00'))
+        self.cotar(date(2025, 2, 2), Decimal('9.00'), fornecedor=self.outro_fornecedor)
+        self.client.force_login(self.usuario)
+        data = self.client.get(reverse('api_produto_precos', args=[self.produto.id])).json()
+        self.assertEqual([f['fornecedor'] for f in data['fornecedores']], ['Atacadão', self.fornecedor.nome])
+        self.assertEqual(data['fornecedores'][0]['ultimo_preco'], '9.00')
+
+        estranho = Usuario.objects.create_user(
+            username='estranho', email='estranho@exemplo.com', password='senha-forte-123',
+            nome_completo='Estranho', identificacao='0009', cargo='Atendente',
+        )
+        self.client.force_login(estranho)
+        self.assertEqual(self.client.get(reverse('api_produto_precos', args=[self.produto.id])).status_code, 404)
+
+
+class ContadoresUsoTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.outro_produto = Produto.objects.create(
+            equipe=self.equipe, nome='Amoxicilina', codigo='P-AMOX', preco_base=Decimal('30.00'),
+        )
+
+    def contadores(self):
+        self.cliente.refresh_from_db()
+        self.produto.refresh_from_db()
+        self.outro_produto.refresh_from_db()
+        self.fornecedor.refresh_from_db()
+        return (
+            (self.cliente.encomendas_count, self.cliente.ultima_encomenda),
+            (self.produto.uso_count, self.produto.ultimo_uso),
+            (self.outro_produto.uso_count, self.outro_produto.ultimo_uso),
+            (self.fornecedor.uso_count, self.fornecedor.ultimo_uso),
+        )
+
+    def test_counters_follow_orders_and_items(self):
+        encomenda = Encomenda.objects.create(
+            cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', data_encomenda=date(2025, 4, 2),
+        )
+        item = ItemEncomenda.objects.create(
+            encomenda=encomenda, produto=self.produto, fornecedor=self.fornecedor, quantidade=1, preco_cotado=Decimal('10.00'),
+        )
+        ItemEncomenda.objects.create(
+            encomenda=encomenda, produto=self.produto, fornecedor=self.fornecedor, quantidade=2, preco_cotado=Decimal('10.00'),
+        )
+        self.assertEqual(self.contadores(), (
+            (1, date(2025, 4, 2)), (2, date(2025, 4, 2)), (0, None), (2, date(2025, 4, 2)),
+        ))
+
+        # Editing without moving the item changes nothing; moving it moves the count
+        item = ItemEncomenda.objects.get(pk=item.pk)
+        item.quantidade = 5
+        item.save()
+        item.produto = self.outro_produto
+        item.save()
+        self.assertEqual(self.contadores()[1:3], ((1, date(2025, 4, 2)), (1, date(2025, 4, 2))))
+
+        # Deleting the order uncounts it and its items; the command rebuilds the same values
+        antes = self.contadores()
+        encomenda.delete()
+        self.assertEqual([contador for contador, _ in self.contadores()], [0, 0, 0, 0])
+        Encomenda.objects.create(
+            cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', data_encomenda=date(2025, 4, 2),
+        )
+        call_command('reconstruir_contadores', stdout=StringIO())
+        self.assertEqual(self.contadores()[0], antes[0])
+        self.assertEqual(self.contadores()[1], (0, None))
+
+    def test_lists_sort_and_filter_by_usage(self):
+        encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+        ItemEncomenda.objects.create(
+            encomenda=encomenda, produto=self.outro_produto, fornecedor=self.fornecedor, quantidade=1, preco_cotado=Decimal('30.00'),
+        )
+        self.client.force_login(self.usuario)
+        url = reverse('produto_list', args=[self.equipe.id])
+        nomes = lambda response: [produto.nome for produto in response.context['page_obj']]
+        self.assertEqual(nomes(self.client.get(url)), ['Amoxicilina', self.produto.nome])
+        self.assertEqual(nomes(self.client.get(url, {'ordem': 'uso'}))[0], 'Amoxicilina')
+        self.assertEqual(nomes(self.client.get(url, {'uso': 'sem_uso'})), [self.produto.nome])
+        with self.assertNumQueries(3): # No per-row counting
+            self.client.get(reverse('cliente_list', args=[self.equipe.id]), {'ordem': 'recentes'})
+
+
+class BuscaNormalizadaTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+
+    def test_search_columns_follow_saves(self):
+        self.assertEqual(normalizar_busca('  São  JOSÉ - Centro'), 'sao jose centro')
+        self.assertEqual((self.produto.nome_busca, self.produto.busca), ('dipirona sodica', ' dipirona sodica p1'))
+        self.cliente.bairro = 'São José'
+        self.cliente.save(update_fields=['bairro'])
+        self.assertIn(' sao jose', Cliente.objects.values_list('busca', flat=True).get(pk=self.cliente.pk))
+
+    def test_lists_and_autocomplete_ignore_accents(self):
+        Produto.objects.create(equipe=self.equipe, nome='Sódio Cloreto', codigo='P-SOD', preco_base=Decimal('5.00'))
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('produto_list', args=[self.equipe.id]), {'search': 'SODI'})
+        self.assertEqual([produto.nome for produto in response.context['page_obj']], ['Dipirona Sódica', 'Sódio Cloreto'])
+        response = self.client.get(reverse('cliente_list', args=[self.equipe.id]), {'search': 'joao silva'})
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+        # Name prefixes first, then word matches
+        response = self.client.get(reverse('search_produtos'), {'q': 'sod'})
+        self.assertEqual([resultado['id'] for resultado in response.json()['results']][1:], [self.produto.id])
+        response = self.client.get(reverse('search_fornecedores'), {'q': 'f1'})
+        self.assertEqual([resultado['id'] for resultado in response.json()['results']], [self.fornecedor.id])
+
+
+    def test_word_index_follows_saves(self):
+        self.assertEqual(
+            set(self.cliente.palavras.values_list('palavra', flat=True)), palavras_busca(self.cliente.busca),
+        )
+        self.cliente.nome = 'Maria Souza'
+        self.cliente.save(update_fields=['nome'])
+        palavras = set(self.cliente.palavras.values_list('palavra', flat=True))
+        self.assertIn('souza', palavras)
+        self.assertNotIn('joao', palavras)
+        outro, outra_equipe, *_ = criar_equipe_com_dados('2')
+        self.cliente.equipe = outra_equipe
+        self.cliente.save()
+        self.assertEqual(set(self.cliente.palavras.values_list('equipe_id', flat=True)), {outra_equipe.id})
+
+    def test_list_search_reads_the_word_index_not_the_rows(self):
+        self.client.force_login(self.usuario)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('cliente_list', args=[self.equipe.id]), {'search': 'silva jo'})
+        self.assertEqual([cliente.pk for cliente in response.context['page_obj']], [self.cliente.pk])
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotRegex(sql, r'"(nome_)?busca" LIKE')
+        self.assertIn('encomendas_palavracliente', sql)
+
+        busca = Cliente.objects.filter(equipe=self.equipe).filter(views._filtro_busca(Cliente, 'silva jo', [self.equipe.id]))
+        plano = busca.explain()
+        self.assertIn('palavracliente_idx', plano)
+        self.assertNotIn('SCAN encomendas_cliente', plano)
+
+class ClientePorTelefoneTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, *_ = criar_equipe_com_dados() # telefone '(32) 99999-0000'
+        self.url = reverse('api_cliente_por_telefone', args=[self.equipe.id])
+
+    def test_lookup_from_any_formatting_with_last_orders(self):
+        self.assertEqual(normalizar_telefone('+55 (11) 98765-4321'), '11987654321')
+        for dia in range(1, 8):
+            Encomenda.objects.create(
+                cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', data_encomenda=date(2025, 5, dia),
+            )
+        self.client.force_login(self.usuario)
+        with self.assertNumQueries(4): # Session user, team check, clients, their last orders
+            clientes = self.client.get(self.url, {'numero': '+55 32 99999 0000'}).json()['clientes']
+        self.assertEqual([cliente['id'] for cliente in clientes], [self.cliente.id])
+        self.assertEqual([encomenda['data'] for encomenda in clientes[0]['ultimas_encomendas']][:2], ['2025-05-07', '2025-05-06'])
+        self.assertEqual(len(clientes[0]['ultimas_encomendas']), views.TELEFONE_ULTIMAS_ENCOMENDAS)
+
+        # Without the area code; or saved without it and typed with it
+        self.assertEqual(len(self.client.get(self.url, {'numero': '99999-0000'}).json()['clientes']), 1)
+        self.cliente.telefone = '99999-0000'
+        self.cliente.save(update_fields=['telefone'])
+        self.assertEqual(len(self.client.get(self.url, {'numero': '(32) 99999-0000'}).json()['clientes']), 1)
+        self.assertEqual(self.client.get(self.url, {'numero': '9999'}).status_code, 400)
+
+        response = self.client.get(reverse('search_clientes'), {'q': '999990000'})
+        self.assertEqual([resultado['id'] for resultado in response.json()['results']], [self.cliente.id])
+
+
+class AdminChangelistTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.admin = Usuario.objects.create_superuser(
+            username='admin', email='admin@exemplo.com', password='senha-forte-123',
+            nome_completo='Admin', identificacao='0010', cargo='Gerente',
+        )
+        self.client.force_login(self.admin)
+
+    def criar_encomendas(self, quantidade):
+        for _ in range(quantidade):
+            encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste')
+            ItemEncomenda.objects.create(
+                encomenda=encomenda, produto=self.produto, fornecedor=self.fornecedor, quantidade=1, preco_cotado=Decimal('10.00'),
+            )
+            Entrega.objects.create(encomenda=encomenda, data_prevista=date(2025, 6, 1))
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(contexto)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [reverse(f'admin:encomendas_{modelo}_changelist') for modelo in ('encomenda', 'itemencomenda', 'entrega', 'equipe')]
+        self.criar_encomendas(2)
+        for url in urls:
+            self.consultas(url) # Fills the cached filter choices
+        antes = [self.consultas(url) for url in urls]
+        self.criar_encomendas(5)
+        criar_equipe_com_dados('2')
+        self.assertEqual([self.consultas(url) for url in urls], antes)
+
+    def test_estimated_count_only_for_unfiltered_large_tables(self):
+        self.criar_encomendas(3)
+        with mock.patch('encomendas.paginacao.estimativa_tabela', return_value=2_000_000):
+            paginator = PaginatorEstimado(Encomenda.objects.order_by('pk'), 20)
+            self.assertEqual((paginator.count, paginator.num_pages), (2_000_000, 100_000))
+            self.assertEqual(PaginatorEstimado(Encomenda.objects.filter(status='criada'), 20).count, 3)
+        with mock.patch('encomendas.paginacao.estimativa_tabela', return_value=500):
+            self.assertEqual(PaginatorEstimado(Encomenda.objects.all(), 20).count, 3) # Small: exact
+
+
+class EncomendaListTotaisTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.client.force_login(self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            for status, preco in (('criada', '10.00'), ('pronta', '20.00'), ('entregue', '30.00'), ('entregue', '40.00')):
+                encomenda = Encomenda.objects.create(cliente=self.cliente, equipe=self.equipe, status=status, responsavel_criacao='Teste')
+                ItemEncomenda.objects.create(
+                    encomenda=encomenda, produto=self.produto, fornecedor=self.fornecedor, quantidade=1,
+                    preco_cotado=Decimal(preco), valor_total=Decimal(preco),
+                )
+                Encomenda.objects.filter(pk=encomenda.pk).update(valor_total=Decimal(preco))
+
+    def totais(self, resposta):
+        return tuple(resposta.context[chave] for chave in (
+            'total_geral_filtrado', 'total_pendentes_filtrado', 'total_entregues_filtrado', 'valor_total_filtrado',
+        ))
+
+    def test_exact_totals_in_one_count_query(self):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('encomenda_list'))
+        self.assertEqual(self.totais(resposta), (4, 2, 2, Decimal('100.00')))
+        self.assertIsNone(resposta.context['page_obj'].paginator.estimada)
+        contagens = [q['sql'] for q in contexto.captured_queries if 'COUNT(' in q['sql'] and 'encomendas_encomenda' in q['sql']]
+        self.assertEqual(len(contagens), 1)
+
+        resposta = self.client.get(reverse('encomenda_list'), {'status': 'entregue'})
+        self.assertEqual(self.totais(resposta), (2, 0, 2, Decimal('70.00')))
+
+    def test_large_unfiltered_list_uses_estimates(self):
+        with mock.patch('encomendas.paginacao.estimativa_consulta', return_value=50_000), \
+                mock.patch('encomendas.views.estimativa_consulta', return_value=30_000):
+            resposta = self.client.get(reverse('encomenda_list'))
+            self.assertEqual(self.totais(resposta), (50_000, 2, 30_000, Decimal('100.00')))
+            self.assertEqual(resposta.context['page_obj'].paginator.estimada, 50_000)
+            self.assertContains(resposta, '~50000 encomendas')
+            self.assertEqual(len(resposta.context['page_obj']), 4)
+
+            # Any filter brings back the exact counts
+            resposta = self.client.get(reverse('encomenda_list'), {'status': 'criada'})
+            self.assertEqual(self.totais(resposta), (1, 1, 0, Decimal('10.00')))
+
+
+class ArquivoTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.client.force_login(self.usuario)
+        antigo = timezone.now() - timedelta(days=400)
+        self.encomendas = {}
+        with self.captureOnCommitCallbacks(execute=True):
+            for nome, status, updated_at in (
+                ('entregue_antiga', 'entregue', antigo), ('cancelada_antiga', 'cancelada', antigo),
+                ('entregue_recente', 'entregue', None), ('pronta_antiga', 'pronta', antigo),
+            ):
+                encomenda = Encomenda.objects.create(
+                    cliente=self.cliente, equipe=self.equipe, status=status, responsavel_criacao='Teste',
+                    data_encomenda=date(2024, 5, 10), valor_total=Decimal('20.00'),
+                )
+                ItemEncomenda.objects.create(
+                    encomenda=encomenda, produto=self.produto, fornecedor=self.fornecedor, quantidade=2,
+                    preco_cotado=Decimal('10.00'), valor_total=Decimal('20.00'),
+                )
+                Entrega.objects.create(encomenda=encomenda, data_prevista=date(2024, 5, 12))
+                if updated_at:
+                    Encomenda.objects.filter(pk=encomenda.pk).update(updated_at=updated_at)
+                self.encomendas[nome] = encomenda.pk
+
+    def derivados(self):
+        self.cliente.refresh_from_db()
+        self.produto.refresh_from_db()
+        return (
+            self.cliente.encomendas_count, self.produto.uso_count,
+            sorted(VendaMensal.objects.values_list('status', 'valor_total', 'itens')),
+            list(PrecoFornecedor.objects.values_list('amostras', 'ultima_cotacao')),
+        )
+
+    def test_moves_old_closed_orders_with_their_rows(self):
+        arquivadas = [self.encomendas['entregue_antiga'], self.encomendas['cancelada_antiga']]
+        itens = list(ItemEncomenda.objects.filter(encomenda_id__in=arquivadas).order_by('pk').values_list('pk', 'encomenda_id'))
+        entregas = list(Entrega.objects.filter(encomenda_id__in=arquivadas).order_by('pk').values_list('pk', 'encomenda_id'))
+        antes = self.derivados()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(arquivo.arquivar(lote=1), 2)
+
+        self.assertEqual(
+            sorted(Encomenda.objects.values_list('pk', flat=True)),
+            sorted([self.encomendas['entregue_recente'], self.encomendas['pronta_antiga']]),
+        )
+        self.assertEqual(sorted(EncomendaArquivada.objects.values_list('pk', flat=True)), sorted(arquivadas))
+        self.assertEqual(list(ItemEncomendaArquivado.objects.order_by('pk').values_list('pk', 'encomenda_id')), itens)
+        self.assertEqual(list(EntregaArquivada.objects.order_by('pk').values_list('pk', 'encomenda_id')), entregas)
+        self.assertFalse(ItemEncomenda.objects.filter(encomenda_id__in=arquivadas).exists())
+
+        # Archiving moves no total, and rebuilding everything gives the same numbers
+        self.assertEqual(self.derivados(), antes)
+        for comando in ('reconstruir_vendas', 'reconstruir_contadores', 'reconstruir_precos'):
+            call_command(comando, *(['--workers', '1'] if comando == 'reconstruir_vendas' else []), stdout=StringIO())
+        self.assertEqual(self.derivados(), antes)
+
+        self.assertEqual(arquivo.arquivar(), 0)
+
+    def test_list_and_detail_read_the_archive_on_request(self):
+        call_command('arquivar_encomendas', '--dias', '30', stdout=StringIO())
+        numero = self.encomendas['entregue_antiga']
+
+        resposta = self.client.get(reverse('encomenda_list'))
+        self.assertEqual(resposta.context['total_geral_filtrado'], 2)
+        self.assertNotIn(numero, [encomenda.pk for encomenda in resposta.context['page_obj']])
+
+        resposta = self.client.get(reverse('encomenda_list'), {'arquivo': '1'})
+        self.assertEqual(resposta.context['total_geral_filtrado'], 4)
+        self.assertEqual(resposta.context['valor_total_filtrado'], Decimal('80.00'))
+        self.assertEqual([encomenda.pk for encomenda in resposta.context['page_obj']], sorted(self.encomendas.values(), reverse=True))
+
+        resposta = self.client.get(reverse('encomenda_list'), {'arquivo': '1', 'search': str(numero), 'status': 'entregue'})
+        self.assertEqual(
+            [(encomenda.pk, getattr(encomenda, 'arquivada', False)) for encomenda in resposta.context['page_obj']],
+            [(self.encomendas['entregue_recente'], False), (numero, True)],
+        )
+        self.assertContains(resposta, 'Arquivada')
+
+        detalhe = reverse('encomenda_detail', args=[numero])
+        self.assertEqual(self.client.get(detalhe).status_code, 404)
+        resposta = self.client.get(detalhe, {'arquivo': '1'})
+        self.assertContains(resposta, 'Arquivada em')
+        self.assertNotContains(resposta, reverse('encomenda_edit', args=[numero]))
+
+        # Another team's archived order stays hidden
+        outro_usuario = criar_equipe_com_dados('2')[0]
+        self.client.force_login(outro_usuario)
+        self.assertEqual(self.client.get(detalhe, {'arquivo': '1'}).status_code, 404)
+
+    def test_estimated_list_value_leaves_the_archive_out(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            arquivo.arquivar()
+        with mock.patch('encomendas.paginacao.estimativa_consulta', return_value=50_000), \
+                mock.patch('encomendas.views.estimativa_consulta', return_value=30_000):
+            resposta = self.client.get(reverse('encomenda_list'))
+        self.assertEqual(resposta.context['valor_total_filtrado'], Decimal('40.00'))
+
+
+class HistoricoTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.encomenda = Encomenda.objects.create(
+                cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', status='criada',
+            )
+            self.item = ItemEncomenda.objects.create(
+                encomenda=self.encomenda, produto=self.produto, fornecedor=self.fornecedor, quantidade=2,
+                preco_cotado=Decimal('10.00'), valor_total=Decimal('20.00'),
+            )
+            self.entrega = Entrega.objects.create(encomenda=self.encomenda, data_prevista=date(2025, 5, 12))
+
+    def eventos(self):
+        return list(
+            AlteracaoEncomenda.objects.filter(encomenda_numero=self.encomenda.pk)
+            .order_by('id').values_list('modelo', 'acao', 'alteracoes')
+        )
+
+    def test_saves_in_a_transaction_are_merged_and_written_at_commit(self):
+        self.assertEqual([(modelo, acao) for modelo, acao, _ in self.eventos()], [
+            ('encomenda', 'criacao'), ('item', 'criacao'), ('entrega', 'criacao'),
+        ])
+        AlteracaoEncomenda.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.encomenda.status = 'cotacao'
+            self.encomenda.save()
+            self.encomenda.status = 'aprovada'
+            self.encomenda.observacoes = 'Urgente'
+            self.encomenda.save()
+            self.item.quantidade = 3
+            self.item.save()
+            self.encomenda.save() # Nothing changed
+            self.assertEqual(self.eventos(), []) # Buffered until commit
+        self.assertEqual(self.eventos(), [
+            ('encomenda', 'alteracao', {'status': ['criada', 'aprovada'], 'observacoes': ['', 'Urgente']}),
+            ('item', 'alteracao', {'quantidade': [2, 3]}),
+        ])
+        self.assertIn(('Status', 'Criada', 'Aprovada'), historico.descrever(AlteracaoEncomenda.objects.first()))
+
+        # Changed back within the transaction: no event at all
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.quantidade = 5
+            self.item.save()
+            self.item.quantidade = 3
+            self.item.save()
+        self.assertEqual(len(self.eventos()), 2)
+
+    def test_rolled_back_savepoint_takes_its_events_along(self):
+        AlteracaoEncomenda.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.quantidade = 4
+            self.item.save()
+            try:
+                with transaction.atomic():
+                    encomenda = Encomenda.objects.get(pk=self.encomenda.pk)
+                    encomenda.status = 'cancelada'
+                    encomenda.save()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.eventos(), [('item', 'alteracao', {'quantidade': [2, 4]})])
+
+    def test_buffer_opened_in_a_rolled_back_savepoint_or_transaction_is_not_reused(self):
+        AlteracaoEncomenda.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.encomenda.status = 'cancelada'
+                    self.encomenda.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            self.item.quantidade = 4
+            self.item.save()
+        self.assertEqual(self.eventos(), [('item', 'alteracao', {'quantidade': [2, 4]})])
+
+        try:
+            with transaction.atomic():
+                self.entrega.observacoes_entrega = 'Portaria'
+                self.entrega.save()
+                raise ValueError
+        except ValueError:
+            pass
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.quantidade = 5
+            self.item.save()
+        self.assertEqual([modelo for modelo, _, _ in self.eventos()], ['item', 'item'])
+
+    def test_order_form_opens_a_transaction_only_to_write(self):
+        self.client.force_login(self.usuario)
+        for url in (reverse('encomenda_create_equipe', args=[self.equipe.id]), reverse('encomenda_edit', args=[self.encomenda.pk])):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertFalse([query for query in queries if 'SAVEPOINT' in query['sql']], url)
+
+    def test_views_record_the_acting_user_and_detail_pages_the_history(self):
+        self.client.force_login(self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('api_confirmar_entregas'),
+                json.dumps({'confirmacoes': [{'entrega': self.entrega.pk, 'data_realizada': timezone.now().isoformat()}]}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.json()['confirmadas'], 1)
+        eventos = AlteracaoEncomenda.objects.filter(encomenda_numero=self.encomenda.pk, acao='alteracao')
+        self.assertEqual({(evento.modelo, evento.usuario_id) for evento in eventos}, {
+            ('encomenda', self.usuario.pk), ('entrega', self.usuario.pk),
+        })
+        self.assertEqual(eventos.get(modelo='encomenda').alteracoes, {'status': ['criada', 'entregue']})
+
+        detalhe = reverse('encomenda_detail', args=[self.encomenda.pk])
+        with mock.patch('encomendas.historico.POR_PAGINA', 2):
+            primeira = self.client.get(detalhe)
+            self.assertContains(primeira, 'Histórico')
+            self.assertEqual([evento.modelo for evento, _ in primeira.context['historico']], ['entrega', 'encomenda'])
+            cursor = primeira.context['historico_proximo']
+            self.assertContains(primeira, f'historico_antes={cursor}')
+
+            segunda = self.client.get(detalhe, {'historico_antes': cursor})
+            self.assertEqual(
+                [(evento.modelo, evento.acao) for evento, _ in segunda.context['historico']],
+                [('entrega', 'criacao'), ('item', 'criacao')],
+            )
+            terceira = self.client.get(detalhe, {'historico_antes': segunda.context['historico_proximo']})
+            self.assertEqual([evento.acao for evento, _ in terceira.context['historico']], ['criacao'])
+            self.assertIsNone(terceira.context['historico_proximo'])
+
+
+class ExportacaoEquipeTests(EncomendasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario, self.equipe, self.cliente, self.produto, self.fornecedor = criar_equipe_com_dados()
+        self.membro = Usuario.objects.create_user(
+            username='membro', email='membro@exemplo.com', password='senha-forte-123',
+            nome_completo='Membro', identificacao='0009', cargo='Entregador',
+        )
+        self.equipe.adicionar_membro(self.membro)
+        with self.captureOnCommitCallbacks(execute=True):
+            for status in ('pronta', 'entregue'):
+                encomenda = Encomenda.objects.create(
+                    cliente=self.cliente, equipe=self.equipe, responsavel_criacao='Teste', status=status,
+                    data_encomenda=date(2024, 5, 10), valor_total=Decimal('20.00'),
+                )
+                ItemEncomenda.objects.create(
+                    encomenda=encomenda, produto=self.produto, fornecedor=self.fornecedor, quantidade=2,
+                    preco_cotado=Decimal('10.00'), valor_total=Decimal('20.00'),
+                )
+                Entrega.objects.create(encomenda=encomenda, data_prevista=date(2024, 5, 12), reservada_por=self.membro)
+        Encomenda.objects.filter(status='entregue').update(updated_at=timezone.now() - timedelta(days=400))
+        with self.captureOnCommitCallbacks(execute=True):
+            arquivo.arquivar()
+        self.tmp = self.enterContext(TemporaryDirectory())
+        self.caminho = f'{self.tmp}/equipe.jsonl.gz'
+
+    def estado(self):
+        """The team's data, ids included, as plain values."""
+        return (
+            list(Encomenda.objects.filter(equipe=self.equipe).values_list('pk', 'cliente__codigo', 'status', 'updated_at')),
+            list(ItemEncomenda.objects.filter(encomenda__equipe=self.equipe).values_list('pk', 'encomenda_id', 'produto__codigo', 'valor_total')),
+            list(Entrega.objects.filter(encomenda__equipe=self.equipe).values_list('pk', 'encomenda_id', 'reservada_por__email')),
+            list(EncomendaArquivada.objects.filter(equipe=self.equipe).values_list('pk', 'arquivada_em')),
+            list(ItemEncomendaArquivado.objects.filter(encomenda__equipe=self.equipe).values_list('pk', 'encomenda_id')),
+            sorted(VendaMensal.objects.filter(equipe=self.equipe).values_list('mes', 'produto__codigo', 'status', 'valor_total')),
+            list(PrecoFornecedor.objects.filter(produto__equipe=self.equipe).values_list('produto__codigo', 'fornecedor__codigo', 'mediana')),
+            sorted(AlteracaoEncomenda.objects.values_list('encomenda_numero', 'modelo', 'objeto_id', 'acao')),
+            sorted(self.equipe.membros.values_list('email', flat=True)),
+            Cliente.objects.filter(equipe=self.equipe).values_list('codigo', 'encomendas_count', 'created_at').get(),
+        )
+
+    def exportar_e_apagar(self):
+        call_command('export_equipe', str(self.equipe.pk), self.caminho, '--lote', '1', stdout=StringIO())
+        antes = self.estado()
+        with self.captureOnCommitCallbacks(execute=True):
+            Equipe.objects.filter(pk=self.equipe.pk).delete()
+            EncomendaArquivada.objects.all().delete()
+        AlteracaoEncomenda.objects.all().delete() # With the deletions just logged
+        self.assertFalse(Encomenda.objects.exists())
+        return antes
+
+    def test_round_trip_keeps_ids_and_timestamps(self):
+        antes = self.exportar_e_apagar()
+        saida = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_equipe', self.caminho, '--lote', '1', stdout=saida)
+        self.assertIn('linhas/s', saida.getvalue())
+        self.assertEqual(self.estado(), antes)
+        # Members were matched by e-mail, not duplicated
+        self.assertEqual(Usuario.objects.filter(email='membro@exemplo.com').count(), 1)
+
+    def test_taken_ids_are_remapped_by_offset(self):
+        antes = self.exportar_e_apagar()
+        numeros = [pk for pk, *_ in antes[0]]
+        # Another team took the order numbers and an item id meanwhile
+        outro, outra_equipe, outro_cliente, outro_produto, outro_fornecedor = criar_equipe_com_dados('2')
+        with self.captureOnCommitCallbacks(execute=True):
+            intrusa = Encomenda.objects.create(
+                numero_encomenda=numeros[0], cliente=outro_cliente, equipe=outra_equipe, responsavel_criacao='Outro',
+            )
+            ItemEncomenda.objects.create(
+                pk=antes[1][0][0], encomenda=intrusa, produto=outro_produto, fornecedor=outro_fornecedor, quantidade=1,
+                preco_cotado=Decimal('5.00'), valor_total=Decimal('5.00'),
+            )
+        AlteracaoEncomenda.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_equipe', self.caminho, stdout=StringIO())
+        depois = self.estado()
+        novos = [pk for pk, *_ in depois[0]]
+        self.assertTrue(all(numero > intrusa.pk for numero in novos))
+        deslocamento = novos[0] - numeros[0]
+        # Same rows, all pointing at the shifted orders (archive and history included)
+        self.assertEqual([linha[1:] for linha in depois[0]], [linha[1:] for linha in antes[0]])
+        self.assertEqual([encomenda_id for _, encomenda_id, *_ in depois[1]], [n + deslocamento for _, n, *_ in antes[1]])
+        self.assertEqual([pk for pk, _ in depois[3]], [pk + deslocamento for pk, _ in antes[3]])
+        self.assertEqual(
+            {numero for numero, *_ in depois[7]}, {numero + deslocamento for numero, *_ in antes[7]},
+        )
+        self.assertEqual(depois[5:7], antes[5:7])
+        self.assertEqual(ItemEncomenda.objects.get(encomenda=intrusa).quantidade, 1)
+
+    def test_codes_taken_by_another_team_are_reported_before_writing(self):
+        antes = self.exportar_e_apagar()
+        Usuario.objects.filter(pk=self.membro.pk).delete()
+        # Another team here already uses the same códigos, and another user the member's username
+        outro, outra_equipe, *_ = criar_equipe_com_dados('2')
+        Cliente.objects.create(equipe=outra_equipe, nome='Outro', codigo=self.cliente.codigo, endereco='Rua B, 2')
+        Produto.objects.create(equipe=outra_equipe, nome='Outro', codigo=self.produto.codigo, preco_base=Decimal('1.00'))
+        Usuario.objects.create_user(
+            username='membro', email='outro-membro@exemplo.com', password='senha-forte-123',
+            nome_completo='Outro Membro', identificacao='0099', cargo='Atendente',
+        )
+        usuarios = Usuario.objects.count()
+
+        with self.assertRaises(CommandError) as erro:
+            call_command('import_equipe', self.caminho, stdout=StringIO())
+        mensagem = str(erro.exception)
+        self.assertIn(f'Clientes: código já usado por outra equipe ({self.cliente.codigo})', mensagem)
+        self.assertIn(f'Produtos: código já usado por outra equipe ({self.produto.codigo})', mensagem)
+        self.assertIn('já usado por outro usuário (membro)', mensagem)
+        self.assertNotIn('Fornecedores', mensagem)
+        self.assertIn('Nada foi importado', mensagem)
+        self.assertFalse(Equipe.objects.filter(pk=self.equipe.pk).exists())
+        self.assertEqual(Usuario.objects.count(), usuarios)
+
+        # With a prefix the códigos no longer clash; the member's username still does
+        Usuario.objects.filter(username='membro').update(username='outro-membro')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_equipe', self.caminho, '--prefixo', 'L2-', stdout=StringIO())
+        self.assertEqual(
+            sorted(Cliente.objects.filter(equipe=self.equipe).values_list('codigo', flat=True)), [f'L2-{self.cliente.codigo}'],
+        )
+        self.assertEqual(
+            [linha[1] for linha in ItemEncomenda.objects.filter(encomenda__equipe=self.equipe).values_list('pk', 'produto__codigo')],
+            [f'L2-{linha[2]}' for linha in antes[1]],
+        )
+        self.assertTrue(Usuario.objects.filter(email='membro@exemplo.com', username='membro').exists())
+        # The search copy and the word index follow the new códigos
+        cliente = Cliente.objects.get(equipe=self.equipe)
+        self.assertIn('l2', cliente.busca.split())
+        self.assertEqual(set(cliente.palavras.values_list('palavra', flat=True)), palavras_busca(cliente.busca))
+
+    def test_imported_users_never_get_staff_or_superuser(self):
+        Usuario.objects.filter(pk=self.membro.pk).update(is_staff=True, is_superuser=True, is_active=False)
+        # A file from before the flags were left out of exports
+        with mock.patch.dict(exportacao.COLUNAS_OCULTAS, {Usuario: ('token_reset_senha', 'data_expiracao_token')}):
+            self.exportar_e_apagar()
+        Usuario.objects.filter(pk=self.membro.pk).delete()
+        saida = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_equipe', self.caminho, stdout=saida)
+        membro = Usuario.objects.get(email='membro@exemplo.com')
+        self.assertEqual((membro.is_staff, membro.is_superuser, membro.is_active), (False, False, False))
+        self.assertIn('membro@exemplo.com: is_staff, is_superuser removido(s)', saida.getvalue())
+
+        # Current exports do not carry the flags at all
+        call_command('export_equipe', str(self.equipe.pk), self.caminho, stdout=StringIO())
+        with gzip.open(self.caminho, 'rt') as entrada:
+            cabecalho = next(json.loads(linha) for linha in entrada if '"tabela":"encomendas.usuario"' in linha)
+        self.assertNotIn('is_superuser', cabecalho['colunas'])
+        self.assertIn('is_active', cabecalho['colunas'])
+
+    def test_refuses_a_team_that_already_exists(self):
+        call_command('export_equipe', str(self.equipe.pk), self.caminho, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'já existe'):
+            call_command('import_equipe', self.caminho, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'não encontrada'):
+            call_command('export_equipe', str(uuid.uuid4()), self.caminho, stdout=StringIO())
@@ -0,0 +1,92 @@
+# encomendas/throttle.py
+
+"""
+Token-bucket throttling for the views that hash passwords.
+
+Each scope has one bucket per client IP and, optionally, one per account
+(the e-mail being tried, the logged-in user, the reset token). A bucket
+holds up to `capacity` attempts and refills at `capacity / period` per
+second; a POST that finds either bucket empty is answered with 429 before
+the view (and the password hasher) runs. Limits come from
+settings.AUTH_THROTTLE:
+
+    AUTH_THROTTLE = {
+        'login': {'ip': (30, 60), 'conta': (5, 300)},  # (capacity, period in s)
+    }
+
+Buckets live in the shared cache. The read-modify-write is not atomic, so
+concurrent requests can each take the last token; the bound is loose by at
+most the number of workers, which is fine for this purpose.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import render
+
+from . import metrics
+
+THROTTLE_CACHE = 'default'
+
+
+def _bucket_key(scope, kind, value):
+    return f'throttle:{scope}:{kind}:{value}'
+
+
+def consume(key, capacity, period, now=None):
+    """Takes one token from a bucket. Returns 0 if allowed, else seconds until a token is available."""
+    cache = caches[THROTTLE_CACHE]
+    now = time.time() if now is None else now
+    rate = capacity / period
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), math.ceil(period))
+    return 0
+
+
+def client_ip(request):
+    # Behind a reverse proxy, have it set REMOTE_ADDR (or adapt this function).
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check(request, scope, account=None):
+    """Seconds the client must wait before trying `scope` again, or 0."""
+    limits = settings.AUTH_THROTTLE.get(scope, {})
+    buckets = [('ip', client_ip(request))]
+    if account:
+        buckets.append(('conta', str(account).strip().lower()))
+    for kind, value in buckets:
+        if kind not in limits:
+            continue
+        capacity, period = limits[kind]
+        retry_after = consume(_bucket_key(scope, kind, value), capacity, period)
+        if retry_after:
+            metrics.incr(f'throttle.{scope}.rejected.{kind}')
+            return retry_after
+    metrics.incr(f'throttle.{scope}.allowed')
+    return 0
+
+
+def throttle(scope, account=None):
+    """Throttles POSTs to a view. `account(request, *args, **kwargs)` names the account being tried."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method == 'POST':
+                conta = account(request, *args, **kwargs) if account else None
+                retry_after = check(request, scope, conta)
+                if retry_after:
+                    retry_after = math.ceil(retry_after)
+                    response = render(request, 'encomendas/auth/muitas_tentativas.html', {
+                        'title': 'Muitas tentativas',
+                        'retry_after': retry_after,
+                    }, status=429)
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
@@ -24,6 +24,9 @@ urlpatterns = [
     path('encomendas/<int:encomenda_pk>/entrega/nova/', views.entrega_create, name='entrega_create'),
     path('entregas/<int:pk>/editar/', views.entrega_edit, name='entrega_edit'),
     path('entregas/<int:pk>/marcar-realizada/', views.marcar_entrega_realizada, name='marcar_entrega_realizada'),
+    path('api/entregas/confirmar/', views.api_confirmar_entregas, name='api_confirmar_entregas'), # Batch (JSON), checks team
+    path('equipes/<uuid:equipe_id>/entregas/', views.manifesto_entregas, name='manifesto_entregas'), # Daily manifest, checks team
+    path('equipes/<uuid:equipe_id>/relatorios/vendas/', views.relatorio_vendas, name='relatorio_vendas'), # Managers only
 
     # --- Team-Specific CRUD URLs ---
     path('equipes/<uuid:equipe_id>/clientes/', views.cliente_list, name='cliente_list'),
@@ -43,11 +46,22 @@ urlpatterns = [
     # --- PDFs & APIs ---
     path('encomendas/<int:pk>/pdf/', views.encomenda_pdf, name='encomenda_pdf'), # Checks team
     path('api/produto/<int:produto_id>/', views.api_produto_info, name='api_produto_info'), # Checks team access
+    path('api/produto/<int:produto_id>/precos/', views.api_produto_precos, name='api_produto_precos'), # Checks team access
+    path('api/equipes/<uuid:equipe_id>/catalogo/', views.api_catalogo_equipe, name='api_catalogo_equipe'), # Checks team
     path('api/encomenda/<int:encomenda_pk>/status/', views.api_update_status, name='api_update_status'), # Checks team
+    path('api/equipes/<uuid:equipe_id>/eventos/', views.api_eventos_equipe, name='api_eventos_equipe'), # SSE, checks team
+    path('api/equipes/<uuid:equipe_id>/clientes/telefone/', views.api_cliente_por_telefone, name='api_cliente_por_telefone'), # Checks team
+    path('api/equipes/<uuid:equipe_id>/relatorios/vendas/', views.api_relatorio_vendas, name='api_relatorio_vendas'), # Managers only
+    # Work queues: cotacao, pronta, entregas (checks team)
+    path('api/equipes/<uuid:equipe_id>/filas/<str:nome_fila>/', views.api_fila, name='api_fila'),
+    path('api/equipes/<uuid:equipe_id>/filas/<str:nome_fila>/reservar/', views.api_fila_reservar, name='api_fila_reservar'),
+    path('api/equipes/<uuid:equipe_id>/filas/<str:nome_fila>/renovar/', views.api_fila_renovar, name='api_fila_renovar'),
+    path('api/equipes/<uuid:equipe_id>/filas/<str:nome_fila>/liberar/', views.api_fila_liberar, name='api_fila_liberar'),
     # Team context needs to be considered for search APIs or handled via request params
     path('api/search-produtos/', views.search_produtos, name='search_produtos'), # View filters by user's teams
     path('api/search-clientes/', views.search_clientes, name='search_clientes'), # View filters by user's teams
     path('api/search-fornecedores/', views.search_fornecedores, name='search_fornecedores'), # View filters by user's teams
+    path('api/metricas/', views.api_metrics, name='api_metrics'), # Staff only
 
 
     # --- Authentication URLs ---
@@ -0,0 +1,324 @@
+# encomendas/vendas.py
+
+"""
+Sales rollup: ItemEncomenda totals pre-aggregated by (equipe, month,
+produto, fornecedor, order status) in VendaMensal and by (equipe, month,
+cliente, order status) in VendaClienteMensal, and the report builder that
+pivots them.
+
+Maintenance is incremental, inside the writing transaction like the usage
+counters (contadores.py): a write moves the contribution of each item it
+touches (quantity, value and one item) out of the rollup row it was in and
+into the row it belongs to now. The deltas are summed per row and applied
+with relative F() updates; a row that does not exist yet is created by an
+upsert that adds to it instead when a concurrent writer created it first,
+and a row left with no items is deleted. A write costs a few statements per
+row it touches, however big the month, and a rollback takes the deltas
+with it.
+
+The contributions taken out are read from the database, not from the
+instances: the order row is read FOR UPDATE first, then the item rows, so
+writers of the same order (or of its items) wait for each other and never
+work from a stale copy. Saves and deletes go through signals.py; code that
+writes with QuerySet.update(), bulk_create() or bulk_update() (no signals)
+calls `retirar_itens`/`registrar_itens` or `mover_encomendas` itself.
+`reconstruir_vendas` rebuilds everything from scratch.
+
+Archived orders (arquivo.py) stay in the rollup: moving orders to the
+archive changes no total, and the rebuild reads ItemEncomenda and
+ItemEncomendaArquivado.
+
+Reports read only the rollup tables: a team-year is a few thousand rows
+however many items it has. 'categoria' comes from the produto. Per-cliente
+totals live in their own table, since adding the cliente to VendaMensal
+would multiply it by the number of clients: the 'cliente' dimension can
+therefore only be crossed with 'mes' and 'status'.
+"""
+from collections import defaultdict, namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Encomenda, ItemEncomenda, ItemEncomendaArquivado, VendaClienteMensal, VendaMensal
+
+# Rollup table -> {its column: ItemEncomenda lookup}, besides month and order status
+CUBOS = {
+    VendaMensal: {'produto_id': 'produto_id', 'fornecedor_id': 'fornecedor_id'},
+    VendaClienteMensal: {'cliente_id': 'encomenda__cliente_id'},
+}
+
+# Dimension -> (rollup lookup used to group, lookup of its label)
+DIMENSOES = {
+    'mes': ('mes', 'mes'),
+    'produto': ('produto_id', 'produto__nome'),
+    'fornecedor': ('fornecedor_id', 'fornecedor__nome'),
+    'categoria': ('produto__categoria', 'produto__categoria'),
+    'cliente': ('cliente_id', 'cliente__nome'),
+    'status': ('status', 'status'),
+}
+DIMENSOES_CLIENTE = ('mes', 'cliente', 'status') # All VendaClienteMensal can answer
+MEDIDAS = ('valor_total', 'quantidade', 'itens')
+
+Relatorio = namedtuple('Relatorio', ['linhas', 'colunas', 'valores', 'totais_linhas', 'totais_colunas', 'total'])
+
+
+def inicio_do_mes(dia):
+    if isinstance(dia, datetime): # Encomenda.data_encomenda defaults to timezone.now
+        dia = timezone.localtime(dia).date() if timezone.is_aware(dia) else dia.date()
+    return dia.replace(day=1)
+
+
+# --- Maintenance ---
+
+def _agregar(itens, lookups):
+    """Grouped ItemEncomenda totals, one dict per rollup row."""
+    return itens.annotate(
+        mes_encomenda=TruncMonth('encomenda__data_encomenda'),
+    ).values(
+        'mes_encomenda', *lookups, 'encomenda__status',
+    ).annotate(
+        soma_quantidade=Sum('quantidade'), soma_valor=Sum('valor_total'), contagem=Count('pk'),
+    ).order_by()
+
+
+def _grupos(equipe_id, lookups, **filtro):
+    """_agregar() of a team's hot and archived items, merged."""
+    grupos = {}
+    for modelo in (ItemEncomenda, ItemEncomendaArquivado):
+        for grupo in _agregar(modelo.objects.filter(encomenda__equipe_id=equipe_id, **filtro), lookups):
+            chave = (grupo['mes_encomenda'], *(grupo[lookup] for lookup in lookups), grupo['encomenda__status'])
+            if chave not in grupos:
+                grupos[chave] = grupo
+                continue
+            for campo in ('soma_quantidade', 'soma_valor', 'contagem'):
+                grupos[chave][campo] = (grupos[chave][campo] or 0) + (grupo[campo] or 0)
+    return grupos.values()
+
+
+def _linhas(equipe_id, **filtro):
+    """Rows of every rollup table for the team's items matching `filtro`."""
+    linhas = {}
+    for cubo, colunas in CUBOS.items():
+        linhas[cubo] = [
+            cubo(
+                equipe_id=equipe_id,
+                mes=grupo['mes_encomenda'],
+                status=grupo['encomenda__status'],
+                quantidade=grupo['soma_quantidade'] or 0,
+                valor_total=grupo['soma_valor'] or Decimal('0.00'),
+                itens=grupo['contagem'],
+                **{coluna: grupo[lookup] for coluna, lookup in colunas.items()},
+            )
+            for grupo in _grupos(equipe_id, list(colunas.values()), **filtro)
+        ]
+    return linhas
+
+
+def reconstruir_equipe(equipe_id):
+    """Rebuilds every month of a team in one transaction. Returns the number of rows written."""
+    with transaction.atomic():
+        linhas = _linhas(equipe_id)
+        for cubo, linhas_cubo in linhas.items():
+            cubo.objects.filter(equipe_id=equipe_id).delete()
+            cubo.objects.bulk_create(linhas_cubo, batch_size=1000)
+    return sum(len(linhas_cubo) for linhas_cubo in linhas.values())
+
+
+CAMPOS_ENCOMENDA = ('equipe_id', 'data_encomenda', 'status', 'cliente_id') # What places an order's items in the rollup
+CAMPOS_ITEM = ('encomenda_id', 'produto_id', 'fornecedor_id', 'quantidade', 'valor_total')
+SOMAS = ('quantidade', 'valor_total', 'itens')
+
+
+def _deltas():
+    """Rollup row (cube, key) -> [quantidade, valor_total, itens] to add."""
+    return defaultdict(lambda: [0, Decimal('0.00'), 0])
+
+
+def _chave(encomenda):
+    """(equipe, month, status) of an order's rollup rows, or None if it has no team or date."""
+    if encomenda['equipe_id'] is None or encomenda['data_encomenda'] is None:
+        return None
+    return encomenda['equipe_id'], inicio_do_mes(encomenda['data_encomenda']), encomenda['status']
+
+
+def _somar(deltas, item, encomenda, sinal, itens=1):
+    """Adds (`sinal` 1) or takes out (-1) the contribution of an item (CAMPOS_ITEM) of an order (CAMPOS_ENCOMENDA)."""
+    chave = _chave(encomenda)
+    if chave is None:
+        return
+    valores = {**item, 'cliente_id': encomenda['cliente_id']}
+    for cubo, colunas in CUBOS.items():
+        delta = deltas[cubo, chave + tuple(valores[coluna] for coluna in colunas)]
+        delta[0] += sinal * (item['quantidade'] or 0)
+        delta[1] += sinal * (item['valor_total'] or 0)
+        delta[2] += sinal * itens
+
+
+def _encomendas(pks):
+    """CAMPOS_ENCOMENDA of the orders as stored, read FOR UPDATE."""
+    pks = sorted({pk for pk in pks if pk is not None})
+    if not pks:
+        return {}
+    linhas = Encomenda.objects.select_for_update().filter(pk__in=pks).order_by('pk').values('pk', *CAMPOS_ENCOMENDA)
+    return {linha.pop('pk'): linha for linha in linhas}
+
+
+def _upsert(cubo, filtro, somas):
+    """INSERT of a new row that adds to the existing one when its key is already taken."""
+    qn = connection.ops.quote_name
+    tabela = qn(cubo._meta.db_table)
+    valores = {**filtro, **somas}
+    colunas = [qn(cubo._meta.get_field(coluna).column) for coluna in valores]
+    parametros = [cubo._meta.get_field(coluna).get_db_prep_save(valor, connection) for coluna, valor in valores.items()]
+    if connection.vendor == 'mysql':
+        conflito = 'ON DUPLICATE KEY UPDATE ' + ', '.join(f'{qn(soma)} = {qn(soma)} + VALUES({qn(soma)})' for soma in somas)
+    else: # PostgreSQL, SQLite
+        unicas = ', '.join(qn(cubo._meta.get_field(coluna).column) for coluna in filtro)
+        conflito = f'ON CONFLICT ({unicas}) DO UPDATE SET ' + ', '.join(
+            f'{qn(soma)} = {tabela}.{qn(soma)} + EXCLUDED.{qn(soma)}' for soma in somas
+        )
+    sql = f'INSERT INTO {tabela} ({", ".join(colunas)}) VALUES ({", ".join(["%s"] * len(colunas))}) {conflito}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+
+
+def _aplicar(deltas):
+    """
+    Writes the deltas, one statement per row, rows in key order so that
+    concurrent writers lock them in the same order.
+    """
+    for cubo, colunas in CUBOS.items():
+        for chave in sorted(chave for cubo_delta, chave in deltas if cubo_delta is cubo):
+            somas = dict(zip(SOMAS, deltas[cubo, chave]))
+            if not any(somas.values()):
+                continue
+            filtro = dict(zip(('equipe_id', 'mes', 'status', *colunas), chave))
+            if somas['itens'] > 0 and min(somas.values()) >= 0:
+                _upsert(cubo, filtro, somas)
+                continue
+            # Takes something out: the row is there (unless the rollup drifted, which the rebuild fixes)
+            linhas = cubo.objects.filter(**filtro)
+            linhas.update(**{soma: F(soma) + valor for soma, valor in somas.items()})
+            if somas['itens'] < 0:
+                linhas.filter(itens=0).delete()
+
+
+def retirar_itens(itens):
+    """
+    Deltas that take the stored contribution of existing items out of the
+    rollup, before they are rewritten or deleted. Locks their orders, then
+    the item rows. Pass the result to `registrar_itens`.
+    """
+    deltas = _deltas()
+    pks = [item.pk for item in itens if item.pk is not None]
+    if not pks:
+        return deltas
+    encomendas = _encomendas(item.encomenda_id for item in itens)
+    guardados = list(ItemEncomenda.objects.select_for_update().filter(pk__in=pks).order_by('pk').values(*CAMPOS_ITEM))
+    # An item moved to another order meanwhile: lock that one too
+    encomendas.update(_encomendas(item['encomenda_id'] for item in guardados if item['encomenda_id'] not in encomendas))
+    for item in guardados:
+        _somar(deltas, item, encomendas[item['encomenda_id']], -1)
+    return deltas
+
+
+def registrar_itens(itens, deltas=None):
+    """
+    Adds the current contribution of the items (saved, or just inserted
+    with bulk_create) to `deltas` from `retirar_itens` and applies them.
+    """
+    deltas = deltas if deltas is not None else _deltas()
+    encomendas = _encomendas(item.encomenda_id for item in itens)
+    for item in itens:
+        if item.encomenda_id in encomendas:
+            _somar(deltas, {campo: getattr(item, campo) for campo in CAMPOS_ITEM}, encomendas[item.encomenda_id], 1)
+    _aplicar(deltas)
+
+
+def mover_encomendas(pks, **novos):
+    """
+    Moves the items of orders `pks` to the rollup rows of their new
+    CAMPOS_ENCOMENDA values (`novos`), before the orders are written.
+    """
+    movidas = {}
+    for pk, antes in _encomendas(pks).items():
+        depois = {**antes, **novos}
+        if (_chave(antes), antes['cliente_id']) != (_chave(depois), depois['cliente_id']):
+            movidas[pk] = antes, depois
+    if not movidas:
+        return
+    deltas = _deltas()
+    # Row by row: FOR UPDATE does not combine with GROUP BY
+    for item in ItemEncomenda.objects.select_for_update().filter(encomenda_id__in=movidas).order_by('pk').values(*CAMPOS_ITEM):
+        antes, depois = movidas[item['encomenda_id']]
+        _somar(deltas, item, antes, -1)
+        _somar(deltas, item, depois, 1)
+    _aplicar(deltas)
+
+
+# --- Report builder ---
+
+def relatorio(equipe_id, linhas, colunas=None, medida='valor_total', de=None, ate=None, status=None):
+    """
+    Pivot of a team's sales: `linhas` (and optionally `colunas`) are keys of
+    DIMENSOES; `de`/`ate` are months (inclusive); `status` limits the order
+    statuses (default: all but 'cancelada'). 'cliente' combines only with
+    DIMENSOES_CLIENTE.
+    """
+    if linhas not in DIMENSOES or (colunas and colunas not in DIMENSOES) or medida not in MEDIDAS:
+        raise ValueError('Dimensão ou medida inválida.')
+
+    dimensoes = [linhas] + ([colunas] if colunas and colunas != linhas else [])
+    cubo = VendaClienteMensal if 'cliente' in dimensoes else VendaMensal
+    if cubo is VendaClienteMensal and not set(dimensoes) <= set(DIMENSOES_CLIENTE):
+        raise ValueError('Vendas por cliente só podem ser cruzadas com mês ou status.')
+
+    vendas = cubo.objects.filter(equipe_id=equipe_id)
+    if de:
+        vendas = vendas.filter(mes__gte=inicio_do_mes(de))
+    if ate:
+        vendas = vendas.filter(mes__lte=inicio_do_mes(ate))
+    vendas = vendas.filter(status__in=status) if status else vendas.exclude(status='cancelada')
+
+    campos = {}
+    for dimensao in dimensoes:
+        chave, campo_rotulo = DIMENSOES[dimensao]
+        campos[f'{dimensao}_chave'] = F(chave)
+        campos[f'{dimensao}_rotulo'] = F(campo_rotulo)
+    grupos = vendas.values(**campos).annotate(valor=Sum(medida)).order_by()
+
+    status_display = dict(Encomenda.STATUS_CHOICES)
+
+    def rotulo(grupo, dimensao):
+        valor = grupo[f'{dimensao}_rotulo']
+        return status_display.get(valor, valor) if dimensao == 'status' else valor
+
+    rotulos_linhas, rotulos_colunas, celulas = {}, {}, {}
+    for grupo in grupos:
+        linha = grupo[f'{linhas}_chave']
+        coluna = grupo[f'{colunas}_chave'] if len(dimensoes) > 1 else None
+        rotulos_linhas[linha] = rotulo(grupo, linhas)
+        if len(dimensoes) > 1:
+            rotulos_colunas[coluna] = rotulo(grupo, colunas)
+        celulas[linha, coluna] = celulas.get((linha, coluna), 0) + grupo['valor']
+
+    def ordenadas(rotulos):
+        return sorted(rotulos, key=lambda chave: (rotulos[chave] is None, str(rotulos[chave] or '')))
+
+    ordem_linhas = ordenadas(rotulos_linhas)
+    ordem_colunas = ordenadas(rotulos_colunas) if len(dimensoes) > 1 else [None]
+    valores = [[celulas.get((linha, coluna), 0) for coluna in ordem_colunas] for linha in ordem_linhas]
+    totais_linhas = [sum(valores_linha) for valores_linha in valores]
+    totais_colunas = [sum(coluna) for coluna in zip(*valores)] if valores else [0] * len(ordem_colunas)
+    return Relatorio(
+        linhas=[rotulos_linhas[chave] for chave in ordem_linhas],
+        colunas=[rotulos_colunas[chave] for chave in ordem_colunas] if len(dimensoes) > 1 else [],
+        valores=valores,
+        totais_linhas=totais_linhas,
+        totais_colunas=totais_colunas,
+        total=sum(totais_linhas),
+    )
@@ -0,0 +1,59 @@
+# encomendas/vendor.py
+
+"""
+Pinned front-end libraries, served from encomendas/static/vendor/ by
+WhiteNoise with hashed names: pages never load anything from a CDN, so
+store networks without internet access get the same pages.
+
+The files are committed (licences included). `manage.py baixar_assets`
+fetches them from the pinned URLs below whenever a version changes; the
+deploy check (`check --deploy`) fails while one is missing, since
+`{% static %}` on a path missing from the manifest raises with DEBUG=False.
+"""
+from pathlib import Path
+
+from django.core.checks import Error, Tags, register
+
+VENDOR_DIR = Path(__file__).resolve().parent / 'static' / 'vendor'
+
+JSDELIVR = 'https://cdn.jsdelivr.net/npm'
+
+# (url, path under static/vendor/). Source maps are listed because the
+# minified files reference them and the manifest storage resolves every reference.
+VENDOR_FILES = [
+    (f'{JSDELIVR}/bootstrap@5.3.0/dist/css/bootstrap.min.css', 'bootstrap/bootstrap.min.css'),
+    (f'{JSDELIVR}/bootstrap@5.3.0/dist/css/bootstrap.min.css.map', 'bootstrap/bootstrap.min.css.map'),
+    (f'{JSDELIVR}/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js', 'bootstrap/bootstrap.bundle.min.js'),
+    (f'{JSDELIVR}/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js.map', 'bootstrap/bootstrap.bundle.min.js.map'),
+    (f'{JSDELIVR}/bootstrap@5.3.0/LICENSE', 'bootstrap/LICENSE'),
+    (f'{JSDELIVR}/bootstrap-icons@1.10.0/font/bootstrap-icons.css', 'bootstrap-icons/bootstrap-icons.css'),
+    (f'{JSDELIVR}/bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff2', 'bootstrap-icons/fonts/bootstrap-icons.woff2'),
+    (f'{JSDELIVR}/bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff', 'bootstrap-icons/fonts/bootstrap-icons.woff'),
+    (f'{JSDELIVR}/bootstrap-icons@1.10.0/LICENSE.md', 'bootstrap-icons/LICENSE.md'),
+    # 4.1: the version select2-bootstrap-5-theme and the templates are built against
+    (f'{JSDELIVR}/select2@4.1.0-rc.0/dist/css/select2.min.css', 'select2/select2.min.css'),
+    (f'{JSDELIVR}/select2@4.1.0-rc.0/dist/js/select2.min.js', 'select2/select2.min.js'),
+    (f'{JSDELIVR}/select2@4.1.0-rc.0/LICENSE.md', 'select2/LICENSE.md'),
+    (f'{JSDELIVR}/select2-bootstrap-5-theme@1.3.0/dist/select2-bootstrap-5-theme.min.css',
+     'select2-bootstrap-5-theme/select2-bootstrap-5-theme.min.css'),
+    (f'{JSDELIVR}/select2-bootstrap-5-theme@1.3.0/LICENSE', 'select2-bootstrap-5-theme/LICENSE'),
+    ('https://code.jquery.com/jquery-3.7.1.min.js', 'jquery/jquery-3.7.1.min.js'),
+    (f'{JSDELIVR}/jquery@3.7.1/LICENSE.txt', 'jquery/LICENSE.txt'),
+]
+
+
+def ausentes():
+    """Pinned files not in the tree."""
+    return [path for _, path in VENDOR_FILES if not (VENDOR_DIR / path).is_file()]
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_vendor_files(app_configs, **kwargs):
+    faltando = ausentes()
+    if not faltando:
+        return []
+    return [Error(
+        f'Arquivos de front-end ausentes em static/vendor/: {", ".join(faltando)}.',
+        hint='Rode `manage.py baixar_assets` e faça commit dos arquivos baixados.',
+        id='encomendas.E001',
+    )]
@@ -1,22 +1,25 @@
 # encomendas/views.py
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
 # Import necessary query tools
-from django.db.models import Q, Sum, Value, Count, Subquery, OuterRef
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q, Sum, Value, Count, F, Max, Prefetch
 from django.db.models.functions import Coalesce
 from django.template.loader import get_template
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
 from django.forms import modelformset_factory # Keep if needed later
 
 # Make sure all models are imported
 from .models import (
-    Encomenda, Cliente, Produto, Fornecedor, ItemEncomenda, Entrega,
-    Equipe, MembroEquipe, Usuario
+    Encomenda, EncomendaArquivada, Cliente, Produto, Fornecedor, ItemEncomenda, Entrega,
+    Equipe, MembroEquipe, Usuario, VendaMensal, PALAVRA_MAX, normalizar_busca, normalizar_telefone
 )
 from .forms import (
     EncomendaForm, ItemEncomendaFormSet, EntregaForm, ClienteForm,
@@ -24,7 +27,28 @@ from .forms import (
     # Import filter forms
     FiltroClienteForm, FiltroProdutoForm, FiltroFornecedorForm
 )
+from django.utils.cache import get_conditional_response, patch_cache_control
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
+import json
+import re
+import time
+from . import arquivo, contadores, eventos, fila, historico, manifesto, metrics, precos, team_cache, vendas
+from .conditional import conditional_page, latest, make_etag
+from .paginacao import PaginatorEstimado, estimativa_consulta
+
+# Versioned catalog snapshots never change, so browsers may keep them for a year
+CATALOGO_MAX_AGE = 60 * 60 * 24 * 365
+
+# auto_now is set before the transaction commits, so a row can show up with an
+# updated_at slightly older than rows already streamed: look back this far.
+EVENTOS_JANELA = timedelta(seconds=10)
+EVENTOS_REPLAY_MAX = timedelta(hours=1) # Oldest Last-Event-ID honoured on reconnection
+
+CONFIRMACOES_MAX = 200 # Deliveries per batch in api_confirmar_entregas
+
+STATUS_PENDENTES = ['criada', 'cotacao', 'aprovada', 'em_andamento', 'pronta']
 
 # --- Helper function to get current team ---
 def get_equipe_atual(request, equipe_id=None):
@@ -61,6 +85,47 @@ def get_equipe_atual(request, equipe_id=None):
         # User is authenticated but has no teams
         raise Http404("Você não pertence a nenhuma equipe.")
 
+# --- Conditional GET versions (see conditional.py) ---
+# Each one costs a single query; team generations come from the cache.
+
+def _user_team_generations(request):
+    equipe_ids = list(request.user.equipes.values_list('id', flat=True))
+    generations = team_cache.get_generations(equipe_ids)
+    return sorted((str(equipe_id), generation) for equipe_id, generation in generations.items())
+
+
+def _encomenda_detail_version(request, pk):
+    rows = Encomenda.objects.filter(
+        pk=pk, equipe__in=request.user.equipes.values('id')
+    ).values_list(
+        'equipe_id', 'updated_at', 'cliente__updated_at', 'entrega__updated_at'
+    ).annotate(
+        itens_updated_at=Max('itens__updated_at'), itens_count=Count('itens')
+    ).order_by()
+    row = next(iter(rows), None)
+    if row is None:
+        return None # Let the view answer 404
+    equipe_id, updated_at, cliente_updated_at, entrega_updated_at, itens_updated_at, itens_count = row
+    last_modified = latest(updated_at, cliente_updated_at, entrega_updated_at, itens_updated_at)
+    etag_parts = (pk, last_modified, itens_count, team_cache.get_generation(equipe_id))
+    return etag_parts, last_modified
+
+
+def _team_list_version(request, *args, **kwargs):
+    # Lists and searches span all the user's teams: any change in one of them
+    # moves its generation. No cheap Last-Modified exists for these.
+    return _user_team_generations(request), None
+
+
+def _produto_info_version(request, produto_id):
+    updated_at = Produto.objects.filter(
+        id=produto_id, equipe__in=request.user.equipes.values('id')
+    ).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return (produto_id, updated_at), updated_at
+
+
 # --- Dashboard View ---
 @login_required(login_url='login')
 def dashboard(request):
@@ -78,7 +143,27 @@ def dashboard(request):
 
 # --- Encomenda Views ---
 
+def _totais_encomendas(queryset):
+    """Totals shown above the order list, in one aggregate query."""
+    return queryset.aggregate(
+        total=Count('pk'),
+        pendentes=Count('pk', filter=Q(status__in=STATUS_PENDENTES)),
+        entregues=Count('pk', filter=Q(status='entregue')),
+        total_valor=Coalesce(Sum('valor_total'), Value(Decimal('0.00'))),
+    )
+
+
+def _encomendas_por_numero(numeros):
+    """Hot and archived orders with these numbers, in the same order."""
+    numeros = list(numeros)
+    encomendas = {}
+    for model in (Encomenda, EncomendaArquivada):
+        encomendas.update(model.objects.select_related('cliente', 'equipe').in_bulk(numeros))
+    return [encomendas[numero] for numero in numeros if numero in encomendas]
+
+
 @login_required(login_url='login')
+@conditional_page(_team_list_version)
 def encomenda_list(request):
     """Lists encomendas based on user's teams, with filters for status, client, team, and search."""
     user_equipes = request.user.equipes.all()
@@ -91,9 +176,6 @@ def encomenda_list(request):
             'equipes_usuario': None, 'current_equipe': None
         })
 
-    # Base queryset: encomendas from teams the user is in
-    encomendas_list = Encomenda.objects.filter(equipe__in=user_equipes).select_related('cliente', 'equipe').order_by('-numero_encomenda')
-
     # Initialize filter form, passing user to limit choices
     filtro_form = FiltroEncomendaForm(request.GET, user=request.user)
 
@@ -101,29 +183,34 @@ def encomenda_list(request):
     current_cliente_id = request.GET.get('cliente')
     current_search = request.GET.get('search')
     current_equipe_id = request.GET.get('equipe') # Allow filtering by specific team
+    incluir_arquivo = bool(request.GET.get('arquivo')) # Archived orders are only read on request
+
+    # The same filters apply to the archive (same field names, see models)
+    filtro = Q()
 
     # Filter by selected team if provided
     current_equipe = None
+    equipe_invalida = False
     if current_equipe_id:
         try:
             # Ensure the selected team is one the user belongs to
             current_equipe = user_equipes.get(id=current_equipe_id)
-            encomendas_list = encomendas_list.filter(equipe=current_equipe)
+            filtro &= Q(equipe=current_equipe)
         except Equipe.DoesNotExist:
             messages.warning(request, "Equipe selecionada inválida.")
-            encomendas_list = Encomenda.objects.none() # Show no results for invalid team
+            equipe_invalida = True # Show no results for invalid team
 
     # Apply other filters
     if current_status:
-        encomendas_list = encomendas_list.filter(status=current_status)
+        filtro &= Q(status=current_status)
 
     if current_cliente_id:
         # Ensure client belongs to one of user's teams before applying filter
         if Cliente.objects.filter(id=current_cliente_id, equipe__in=user_equipes).exists():
-            encomendas_list = encomendas_list.filter(cliente_id=current_cliente_id)
+            filtro &= Q(cliente_id=current_cliente_id)
 
     if current_search:
-        encomendas_list = encomendas_list.filter(
+        filtro &= (
             Q(numero_encomenda__icontains=current_search) |
             Q(cliente__nome__icontains=current_search) |
             Q(cliente__codigo__icontains=current_search) |
@@ -133,19 +220,64 @@ def encomenda_list(request):
             Q(responsavel_criacao__icontains=current_search) |
             Q(observacoes__icontains=current_search) |
             Q(equipe__nome__icontains=current_search)
-        ).distinct()
+        )
+
+    def filtrar(model):
+        if equipe_invalida:
+            return model.objects.none()
+        queryset = model.objects.filter(filtro, equipe__in=user_equipes)
+        return queryset.distinct() if current_search else queryset
+
+    # Base queryset: encomendas from teams the user is in
+    encomendas_list = filtrar(Encomenda).select_related('cliente', 'equipe').order_by('-numero_encomenda')
 
     # Aggregation and Pagination (applied to the final filtered list)
-    total_geral_filtrado = encomendas_list.count()
-    total_pendentes_filtrado = encomendas_list.filter(status__in=['criada', 'cotacao', 'aprovada', 'em_andamento', 'pronta']).count()
-    total_entregues_filtrado = encomendas_list.filter(status='entregue').count()
-    valor_total_filtrado = encomendas_list.aggregate(
-        total_valor=Coalesce(Sum('valor_total'), Value(Decimal('0.00')))
-    )['total_valor']
-
-    paginator = Paginator(encomendas_list, 20)
+    if incluir_arquivo:
+        # Hot and archived orders share the number sequence: page through the
+        # union of the numbers, then load the page's orders from each table
+        arquivadas = filtrar(EncomendaArquivada)
+        totais = _totais_encomendas(encomendas_list)
+        for campo, valor in _totais_encomendas(arquivadas).items():
+            totais[campo] += valor
+        numeros = encomendas_list.order_by().values_list('numero_encomenda', flat=True).union(
+            arquivadas.order_by().values_list('numero_encomenda', flat=True), all=True,
+        ).order_by('-numero_encomenda')
+        paginator = PaginatorEstimado(numeros, 20, contagem=totais['total'])
+    else:
+        filtrada = bool(current_equipe_id or current_status or current_cliente_id or current_search)
+        paginator = PaginatorEstimado(encomendas_list, 20, estimar_filtrados=not filtrada)
+        totais = None if paginator.estimada is not None else _totais_encomendas(encomendas_list)
+
+    if totais is None:
+        # Large unfiltered list: no pass over all the orders. The value comes
+        # from the sales rollup (same total as the orders' valor_total, as
+        # long as it is kept as the sum of the items) minus the archive's;
+        # pending orders are a small working set counted on the
+        # (equipe, status) index.
+        equipe_ids = list(user_equipes.values_list('id', flat=True))
+        total_geral_filtrado = paginator.count
+        total_pendentes_filtrado = encomendas_list.filter(status__in=STATUS_PENDENTES).count()
+        entregues = encomendas_list.filter(status='entregue')
+        total_entregues_filtrado = estimativa_consulta(entregues)
+        if total_entregues_filtrado is None:
+            total_entregues_filtrado = entregues.count()
+        valor_total_filtrado = VendaMensal.objects.filter(equipe_id__in=equipe_ids).aggregate(
+            total_valor=Coalesce(Sum('valor_total'), Value(Decimal('0.00')))
+        )['total_valor'] - arquivo.valor_arquivado(equipe_ids)
+    else:
+        # One pass for every total; the paginator reuses its count
+        total_geral_filtrado = totais['total']
+        total_pendentes_filtrado = totais['pendentes']
+        total_entregues_filtrado = totais['entregues']
+        valor_total_filtrado = totais['total_valor']
+        paginator.contagem = total_geral_filtrado
+
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    if incluir_arquivo:
+        page_obj.object_list = _encomendas_por_numero(page_obj.object_list)
+    # Only the pages around the current one: page_range would build every page
+    page_range = paginator.get_elided_page_range(page_obj.number, on_each_side=2, on_ends=0)
 
     # Get selected client object for display/logic if ID is present and valid
     selected_cliente_obj = None
@@ -157,6 +289,7 @@ def encomenda_list(request):
 
     context = {
         'page_obj': page_obj,
+        'page_range': page_range,
         'filtro_form': filtro_form, # Pass the bound form
         'current_status': current_status,
         'current_cliente_id': current_cliente_id,
@@ -164,6 +297,7 @@ def encomenda_list(request):
         'current_search': current_search,
         'current_equipe_id': current_equipe_id,
         'current_equipe': current_equipe, # Pass the selected team object
+        'incluir_arquivo': incluir_arquivo,
         'total_geral_filtrado': total_geral_filtrado,
         'total_pendentes_filtrado': total_pendentes_filtrado,
         'total_entregues_filtrado': total_entregues_filtrado,
@@ -174,14 +308,20 @@ def encomenda_list(request):
 
 
 @login_required(login_url='login')
+@conditional_page(_encomenda_detail_version)
 def encomenda_detail(request, pk):
-    """Details of an order, ensuring the user is part of the team."""
+    """Details of an order, ensuring the user is part of the team. With ?arquivo=1, archived orders too."""
     user_equipes_ids = request.user.equipes.values_list('id', flat=True)
-    encomenda = get_object_or_404(
-        Encomenda.objects.select_related('cliente', 'equipe'),
+    encomenda = Encomenda.objects.select_related('cliente', 'equipe').filter(
         pk=pk,
         equipe_id__in=user_equipes_ids # Check team membership
-    )
+    ).first()
+    if encomenda is None and request.GET.get('arquivo'):
+        encomenda = EncomendaArquivada.objects.select_related('cliente', 'equipe').filter(
+            pk=pk, equipe_id__in=user_equipes_ids,
+        ).first()
+    if encomenda is None:
+        raise Http404("Encomenda não encontrada.")
 
     # Filter items ensuring related product/supplier belong to the order's team
     itens = encomenda.itens.filter(
@@ -191,11 +331,19 @@ def encomenda_detail(request, pk):
 
     entrega = getattr(encomenda, 'entrega', None) # Fetch delivery using related_name
 
+    try:
+        historico_antes = int(request.GET['historico_antes'])
+    except (KeyError, ValueError):
+        historico_antes = None
+    eventos_historico, historico_proximo = historico.pagina(encomenda.pk, historico_antes)
+
     context = {
         'encomenda': encomenda,
         'itens': itens,
         'entrega': entrega,
-        'equipe': encomenda.equipe # Pass team context
+        'equipe': encomenda.equipe, # Pass team context
+        'historico': [(evento, historico.descrever(evento)) for evento in eventos_historico],
+        'historico_proximo': historico_proximo,
     }
     return render(request, 'encomendas/encomenda_detail.html', context)
 
@@ -226,44 +374,50 @@ def encomenda_create(request, equipe_id=None):
                  context = {'form': form, 'formset': formset, 'title': f'Nova Encomenda (Equipe: {equipe_atual.nome})', 'equipe': equipe_atual}
                  return render(request, 'encomendas/encomenda_form.html', context)
 
-            encomenda = form.save(commit=False)
-            encomenda.equipe = equipe_atual
-            encomenda.responsavel_criacao = request.user.nome_completo or request.user.username
-            encomenda.save() # Save encomenda first to get PK
-
-            instances = formset.save(commit=False)
-            total_items_value = Decimal('0.00')
-            items_to_save = []
-            valid_items = True
-            for instance in instances:
-                instance.encomenda = encomenda
-                # Ensure selected product/supplier belong to the team
-                if instance.produto.equipe != equipe_atual or instance.fornecedor.equipe != equipe_atual:
-                     messages.error(request, f"Item inválido: Produto '{instance.produto.nome}' ou Fornecedor '{instance.fornecedor.nome}' não pertence à equipe '{equipe_atual.nome}'.")
-                     valid_items = False
-                     break # Stop processing further items
-
-                # Calculate item total
-                if instance.quantidade is not None and instance.preco_cotado is not None:
-                    instance.valor_total = instance.quantidade * instance.preco_cotado
-                    total_items_value += instance.valor_total
-                else:
-                    instance.valor_total = Decimal('0.00')
-                items_to_save.append(instance)
-
-            if not valid_items:
-                # If an item was invalid, delete the partially created encomenda and re-render form
-                encomenda.delete() # Clean up the created Encomenda object
-                context = {'form': form, 'formset': formset, 'title': f'Nova Encomenda (Equipe: {equipe_atual.nome})', 'equipe': equipe_atual}
-                return render(request, 'encomendas/encomenda_form.html', context)
-
-            # Bulk create items if all were valid
-            if items_to_save:
-                ItemEncomenda.objects.bulk_create(items_to_save)
-
-            # Update encomenda total based on calculated item totals
-            encomenda.valor_total = total_items_value
-            encomenda.save(update_fields=['valor_total'])
+            with transaction.atomic(): # One transaction: one change log write (historico.py)
+                encomenda = form.save(commit=False)
+                encomenda.equipe = equipe_atual
+                encomenda.responsavel_criacao = request.user.nome_completo or request.user.username
+                encomenda.save() # Save encomenda first to get PK
+
+                instances = formset.save(commit=False)
+                total_items_value = Decimal('0.00')
+                items_to_save = []
+                valid_items = True
+                for instance in instances:
+                    instance.encomenda = encomenda
+                    # Ensure selected product/supplier belong to the team
+                    if instance.produto.equipe != equipe_atual or instance.fornecedor.equipe != equipe_atual:
+                         messages.error(request, f"Item inválido: Produto '{instance.produto.nome}' ou Fornecedor '{instance.fornecedor.nome}' não pertence à equipe '{equipe_atual.nome}'.")
+                         valid_items = False
+                         break # Stop processing further items
+
+                    # Calculate item total
+                    if instance.quantidade is not None and instance.preco_cotado is not None:
+                        instance.valor_total = instance.quantidade * instance.preco_cotado
+                        total_items_value += instance.valor_total
+                    else:
+                        instance.valor_total = Decimal('0.00')
+                    items_to_save.append(instance)
+
+                if not valid_items:
+                    # If an item was invalid, delete the partially created encomenda and re-render form
+                    encomenda.delete() # Clean up the created Encomenda object
+                    context = {'form': form, 'formset': formset, 'title': f'Nova Encomenda (Equipe: {equipe_atual.nome})', 'equipe': equipe_atual}
+                    return render(request, 'encomendas/encomenda_form.html', context)
+
+                # Bulk create items if all were valid
+                if items_to_save:
+                    ItemEncomenda.objects.bulk_create(items_to_save)
+                    # bulk_create sends no signals
+                    vendas.registrar_itens(items_to_save)
+                    precos.marcar_itens_on_commit(items_to_save)
+                    contadores.registrar_itens(items_to_save, encomenda.data_encomenda, novos=True)
+                    historico.registrar_varios(items_to_save, historico.CRIACAO)
+
+                # Update encomenda total based on calculated item totals
+                encomenda.valor_total = total_items_value
+                encomenda.save(update_fields=['valor_total', 'updated_at'])
 
             messages.success(request, f'Encomenda #{encomenda.numero_encomenda} criada com sucesso para a equipe {equipe_atual.nome}!')
             return redirect('encomenda_detail', pk=encomenda.pk)
@@ -306,54 +460,66 @@ def encomenda_edit(request, pk):
                  context = {'form': form, 'formset': formset, 'encomenda': encomenda, 'title': f'Editar Encomenda #{encomenda.numero_encomenda} (Equipe: {equipe_atual.nome})', 'equipe': equipe_atual}
                  return render(request, 'encomendas/encomenda_form.html', context)
 
-            encomenda = form.save() # Save encomenda changes first
-
-            instances = formset.save(commit=False)
-            total_items_value = Decimal('0.00')
-            items_to_update = []
-            items_to_create = []
-            valid_items = True
-
-            for instance in instances:
-                 # Ensure selected product/supplier belong to the team
-                if instance.produto.equipe != equipe_atual or instance.fornecedor.equipe != equipe_atual:
-                     messages.error(request, f"Item inválido: Produto '{instance.produto.nome}' ou Fornecedor '{instance.fornecedor.nome}' não pertence à equipe '{equipe_atual.nome}'.")
-                     valid_items = False
-                     break # Stop processing items
-
-                # Calculate value before saving
-                if instance.quantidade is not None and instance.preco_cotado is not None:
-                     instance.valor_total = instance.quantidade * instance.preco_cotado
-                     total_items_value += instance.valor_total
-                else:
-                     instance.valor_total = Decimal('0.00')
-
-                if instance.pk: # Existing item
-                     items_to_update.append(instance)
-                else: # New item added during edit
-                     instance.encomenda = encomenda # Associate with parent
-                     items_to_create.append(instance)
-
-            if not valid_items:
-                # Re-render form if an item was invalid
-                context = {'form': form, 'formset': formset, 'encomenda': encomenda, 'title': f'Editar Encomenda #{encomenda.numero_encomenda} (Equipe: {equipe_atual.nome})', 'equipe': equipe_atual}
-                return render(request, 'encomendas/encomenda_form.html', context)
-
-            # Handle deletions marked by the formset
-            for form_in_formset in formset.deleted_forms:
-                if form_in_formset.instance.pk:
-                     form_in_formset.instance.delete()
-
-            # Save updated items
-            if items_to_update:
-                ItemEncomenda.objects.bulk_update(items_to_update, ['produto', 'fornecedor', 'quantidade', 'preco_cotado', 'valor_total', 'observacoes'])
-            # Save newly created items
-            if items_to_create:
-                ItemEncomenda.objects.bulk_create(items_to_create)
-
-            # Final update of encomenda total
-            encomenda.valor_total = total_items_value
-            encomenda.save(update_fields=['valor_total'])
+            with transaction.atomic(): # One transaction: one change log write (historico.py)
+                encomenda = form.save() # Save encomenda changes first
+
+                instances = formset.save(commit=False)
+                total_items_value = Decimal('0.00')
+                items_to_update = []
+                items_to_create = []
+                valid_items = True
+
+                for instance in instances:
+                     # Ensure selected product/supplier belong to the team
+                    if instance.produto.equipe != equipe_atual or instance.fornecedor.equipe != equipe_atual:
+                         messages.error(request, f"Item inválido: Produto '{instance.produto.nome}' ou Fornecedor '{instance.fornecedor.nome}' não pertence à equipe '{equipe_atual.nome}'.")
+                         valid_items = False
+                         break # Stop processing items
+
+                    # Calculate value before saving
+                    if instance.quantidade is not None and instance.preco_cotado is not None:
+                         instance.valor_total = instance.quantidade * instance.preco_cotado
+                         total_items_value += instance.valor_total
+                    else:
+                         instance.valor_total = Decimal('0.00')
+
+                    if instance.pk: # Existing item
+                         items_to_update.append(instance)
+                    else: # New item added during edit
+                         instance.encomenda = encomenda # Associate with parent
+                         items_to_create.append(instance)
+
+                if not valid_items:
+                    # Re-render form if an item was invalid
+                    context = {'form': form, 'formset': formset, 'encomenda': encomenda, 'title': f'Editar Encomenda #{encomenda.numero_encomenda} (Equipe: {equipe_atual.nome})', 'equipe': equipe_atual}
+                    return render(request, 'encomendas/encomenda_form.html', context)
+
+                # Handle deletions marked by the formset
+                for form_in_formset in formset.deleted_forms:
+                    if form_in_formset.instance.pk:
+                         form_in_formset.instance.delete()
+
+                # Save updated items (bulk_update skips auto_now, so stamp them here)
+                vendas_retiradas = vendas.retirar_itens(items_to_update) # Read before bulk_update rewrites them
+                if items_to_update:
+                    agora = timezone.now()
+                    for item in items_to_update:
+                        item.updated_at = agora
+                    ItemEncomenda.objects.bulk_update(items_to_update, ['produto', 'fornecedor', 'quantidade', 'preco_cotado', 'valor_total', 'observacoes', 'updated_at'])
+                # Save newly created items
+                if items_to_create:
+                    ItemEncomenda.objects.bulk_create(items_to_create)
+                # Neither bulk call sends signals; old pairs come from the loaded instances
+                vendas.registrar_itens(items_to_update + items_to_create, vendas_retiradas)
+                precos.marcar_itens_on_commit(items_to_update + items_to_create)
+                contadores.registrar_itens(items_to_update, encomenda.data_encomenda)
+                contadores.registrar_itens(items_to_create, encomenda.data_encomenda, novos=True)
+                historico.registrar_varios(items_to_update, historico.ALTERACAO)
+                historico.registrar_varios(items_to_create, historico.CRIACAO)
+
+                # Final update of encomenda total
+                encomenda.valor_total = total_items_value
+                encomenda.save(update_fields=['valor_total', 'updated_at'])
 
             messages.success(request, f'Encomenda #{encomenda.numero_encomenda} atualizada com sucesso!')
             return redirect('encomenda_detail', pk=encomenda.pk)
@@ -480,7 +646,7 @@ def entrega_edit(request, pk):
             # Update encomenda status if delivery date/time was SET
             if entrega.data_realizada and encomenda.status != 'entregue':
                 encomenda.status = 'entregue'
-                encomenda.save(update_fields=['status'])
+                encomenda.save(update_fields=['status', 'updated_at'])
                 messages.info(request, f'Status da Encomenda #{encomenda.numero_encomenda} atualizado para Entregue.')
             # Optional: Revert status if date/time was CLEARED
             elif not entrega.data_realizada and encomenda.status == 'entregue':
@@ -512,6 +678,40 @@ def entrega_edit(request, pk):
 
 # --- Cliente, Produto, Fornecedor Views (UPDATED with team context & annotations) ---
 
+def _filtro_busca(model, search, equipes):
+    """
+    Every word of `search` must start a word of the row's normalized search
+    copy (models.atualizar_busca): accent- and case-insensitive. Each word is
+    a range on the (equipe, palavra) index of the model's word table
+    (models.indexar_palavras), so no search scans the rows themselves.
+    Words are stored normalized: istartswith matches what startswith would,
+    and on MySQL it is a plain LIKE the index serves (startswith is LIKE BINARY).
+    """
+    palavras = model.palavras.field.model
+    filtro = Q()
+    for termo in normalizar_busca(search).split():
+        filtro &= Q(pk__in=palavras.objects.filter(
+            equipe_id__in=equipes, palavra__istartswith=termo[:PALAVRA_MAX],
+        ).values('objeto_id'))
+    return filtro
+
+
+def _filtrar_por_uso(queryset, filtro_form, contador, campo_data):
+    """Applies the list's 'uso' filter and 'ordem' (FiltroCadastroForm) on the stored usage counters."""
+    uso = ordem = ''
+    if filtro_form.is_valid():
+        uso, ordem = filtro_form.cleaned_data['uso'], filtro_form.cleaned_data['ordem']
+    if uso == 'usados':
+        queryset = queryset.filter(**{f'{contador}__gt': 0})
+    elif uso == 'sem_uso':
+        queryset = queryset.filter(**{f'{contador}__lte': 0})
+    if ordem == 'uso':
+        return queryset.order_by(f'-{contador}', 'nome')
+    if ordem == 'recentes':
+        return queryset.order_by(F(campo_data).desc(nulls_last=True), 'nome')
+    return queryset.order_by('nome')
+
+
 @login_required(login_url='login')
 def cliente_list(request, equipe_id):
     """Lists clients for a specific team, including encomenda count."""
@@ -524,28 +724,15 @@ def cliente_list(request, equipe_id):
         messages.error(request, str(e))
         return redirect('listar_equipes')
 
-    # Subquery to count encomendas within this team for each client
-    encomendas_count_subquery = Encomenda.objects.filter(
-        cliente=OuterRef('pk'),
-        equipe=equipe_atual # Filter by the current team
-    ).values('cliente').annotate(count=Count('pk')).values('count')
+    # Base queryset for clients in the current team; usage comes from the stored counters
+    clientes_list = Cliente.objects.filter(equipe=equipe_atual)
 
-    # Base queryset for clients in the current team, annotated with the count
-    clientes_list = Cliente.objects.filter(
-        equipe=equipe_atual
-    ).annotate(
-        encomendas_equipe_count=Coalesce(Subquery(encomendas_count_subquery), 0)
-    ).order_by('nome')
-
-    # Apply search filter
+    # Apply search filter and usage ordering
     filtro_form = FiltroClienteForm(request.GET)
+    clientes_list = _filtrar_por_uso(clientes_list, filtro_form, 'encomendas_count', 'ultima_encomenda')
     search = request.GET.get('search')
     if search:
-        clientes_list = clientes_list.filter(
-            Q(nome__icontains=search) | Q(codigo__icontains=search) |
-            Q(endereco__icontains=search) | Q(bairro__icontains=search) |
-            Q(telefone__icontains=search)
-        ).distinct()
+        clientes_list = clientes_list.filter(_filtro_busca(Cliente, search, [equipe_atual.id]))
 
     # Paginate results
     paginator = Paginator(clientes_list, 20)
@@ -613,27 +800,15 @@ def produto_list(request, equipe_id):
         messages.error(request, str(e))
         return redirect('listar_equipes')
 
-    # Subquery to count usage in ItemEncomenda within this team
-    item_usage_subquery = ItemEncomenda.objects.filter(
-        produto=OuterRef('pk'),
-        encomenda__equipe=equipe_atual # Filter by the current team via related encomenda
-    ).values('produto').annotate(count=Count('pk')).values('count')
-
-    # Base queryset for products in the current team, annotated with usage count
-    produtos_list = Produto.objects.filter(
-        equipe=equipe_atual
-    ).annotate(
-        uso_equipe_count=Coalesce(Subquery(item_usage_subquery), 0)
-    ).order_by('nome')
+    # Base queryset for the team; usage comes from the stored counters
+    produtos_list = Produto.objects.filter(equipe=equipe_atual)
 
-    # Apply search filter
+    # Apply search filter and usage ordering
     filtro_form = FiltroProdutoForm(request.GET)
+    produtos_list = _filtrar_por_uso(produtos_list, filtro_form, 'uso_count', 'ultimo_uso')
     search = request.GET.get('search')
     if search:
-        produtos_list = produtos_list.filter(
-            Q(nome__icontains=search) | Q(codigo__icontains=search) |
-            Q(categoria__icontains=search) | Q(descricao__icontains=search)
-        ).distinct()
+        produtos_list = produtos_list.filter(_filtro_busca(Produto, search, [equipe_atual.id]))
 
     # Paginate results
     paginator = Paginator(produtos_list, 20)
@@ -701,28 +876,15 @@ def fornecedor_list(request, equipe_id):
         messages.error(request, str(e))
         return redirect('listar_equipes')
 
-    # Subquery to count usage in ItemEncomenda within this team
-    item_usage_subquery = ItemEncomenda.objects.filter(
-        fornecedor=OuterRef('pk'),
-        encomenda__equipe=equipe_atual # Filter by the current team via related encomenda
-    ).values('fornecedor').annotate(count=Count('pk')).values('count')
-
-    # Base queryset for suppliers in the current team, annotated with usage count
-    fornecedores_list = Fornecedor.objects.filter(
-        equipe=equipe_atual
-    ).annotate(
-        uso_equipe_count=Coalesce(Subquery(item_usage_subquery), 0)
-    ).order_by('nome')
+    # Base queryset for the team; usage comes from the stored counters
+    fornecedores_list = Fornecedor.objects.filter(equipe=equipe_atual)
 
-    # Apply search filter
+    # Apply search filter and usage ordering
     filtro_form = FiltroFornecedorForm(request.GET)
+    fornecedores_list = _filtrar_por_uso(fornecedores_list, filtro_form, 'uso_count', 'ultimo_uso')
     search = request.GET.get('search')
     if search:
-        fornecedores_list = fornecedores_list.filter(
-            Q(nome__icontains=search) | Q(codigo__icontains=search) |
-            Q(contato__icontains=search) | Q(email__icontains=search) |
-            Q(telefone__icontains=search)
-        ).distinct()
+        fornecedores_list = fornecedores_list.filter(_filtro_busca(Fornecedor, search, [equipe_atual.id]))
 
     # Paginate results
     paginator = Paginator(fornecedores_list, 20)
@@ -782,12 +944,14 @@ def fornecedor_create(request, equipe_id):
 
 @login_required(login_url='login')
 @require_http_methods(["GET"])
-def api_produto_info(request, produto_id):
+@conditional_page(_produto_info_version)
+async def api_produto_info(request, produto_id):
     """Returns product info via AJAX. Checks team access."""
-    user_equipes_ids = request.user.equipes.values_list('id', flat=True)
+    user = await request.auser()
+    user_equipes_ids = user.equipes.values_list('id', flat=True)
     try:
         # Ensure the product belongs to one of the user's teams
-        produto = Produto.objects.get(id=produto_id, equipe_id__in=user_equipes_ids)
+        produto = await Produto.objects.aget(id=produto_id, equipe_id__in=user_equipes_ids)
         data = {
             'nome': produto.nome,
             'codigo': produto.codigo,
@@ -799,19 +963,103 @@ def api_produto_info(request, produto_id):
         return JsonResponse({'error': 'Produto não encontrado ou acesso não permitido'}, status=404)
 
 
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+async def api_produto_precos(request, produto_id):
+    """
+    Price suggestions for the item form: the product's base price and, per
+    fornecedor, the statistics of its recent quotes (precos.py), cheapest
+    last price first. One call per product; checks team access.
+    """
+    user = await request.auser()
+    user_equipes_ids = user.equipes.values_list('id', flat=True)
+    try:
+        produto = await Produto.objects.aget(id=produto_id, equipe_id__in=user_equipes_ids)
+    except Produto.DoesNotExist:
+        return JsonResponse({'error': 'Produto não encontrado ou acesso não permitido'}, status=404)
+
+    fornecedores = [
+        {
+            'fornecedor_id': preco.fornecedor_id,
+            'fornecedor': preco.fornecedor.nome,
+            'ultimo_preco': str(preco.ultimo_preco),
+            'ultima_cotacao': preco.ultima_cotacao.isoformat(),
+            'ultimo_atipico': preco.ultimo_atipico,
+            'amostras': preco.amostras,
+            'minimo': str(preco.minimo),
+            'p25': str(preco.p25),
+            'mediana': str(preco.mediana),
+            'p75': str(preco.p75),
+            'maximo': str(preco.maximo),
+            'media': str(preco.media),
+        }
+        async for preco in precos.sugestoes(produto.id)
+    ]
+    return JsonResponse({
+        'produto_id': produto.id,
+        'preco_base': str(produto.preco_base),
+        'fornecedores': fornecedores,
+    })
+
+
+def _build_catalogo(equipe_id, versao):
+    """Columnar JSON of the team's catalog: one array per column, gzip-friendly."""
+    def colunas(queryset, campos):
+        linhas = list(queryset.filter(equipe_id=equipe_id).order_by('nome').values_list(*campos))
+        return {campo: [linha[i] for linha in linhas] for i, campo in enumerate(campos)}
+
+    produtos = colunas(Produto.objects, ('id', 'codigo', 'nome', 'preco_base'))
+    produtos['preco_base'] = [str(preco) for preco in produtos['preco_base']]
+    data = {
+        'equipe': str(equipe_id),
+        'versao': versao,
+        'produtos': produtos,
+        'fornecedores': colunas(Fornecedor.objects, ('id', 'codigo', 'nome')),
+        'clientes': colunas(Cliente.objects, ('id', 'codigo', 'nome')),
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def api_catalogo_equipe(request, equipe_id):
+    """
+    Versioned snapshot of a team's produtos, fornecedores and clientes for
+    client-side lookups in the order form. Requested as ?v=<generation>: a
+    matching version is immutable and cached by the browser for a year; any
+    other request revalidates through the ETag.
+    """
+    if not request.user.equipes.filter(id=equipe_id).exists():
+        return JsonResponse({'error': 'Equipe não encontrada ou acesso não permitido'}, status=404)
+
+    versao = team_cache.get_generation(equipe_id)
+    etag = make_etag('catalogo', equipe_id, versao)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        body = team_cache.get_or_set(equipe_id, 'catalogo', lambda: _build_catalogo(equipe_id, versao))
+        response = HttpResponse(body, content_type='application/json')
+    response.headers['ETag'] = etag
+    if request.GET.get('v') == str(versao):
+        patch_cache_control(response, private=True, max_age=CATALOGO_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @login_required(login_url='login')
 @require_http_methods(["POST"])
-def api_update_status(request, encomenda_pk):
+async def api_update_status(request, encomenda_pk):
     """Updates order status via AJAX, checking team membership."""
-    user_equipes_ids = request.user.equipes.values_list('id', flat=True)
-    encomenda = get_object_or_404(Encomenda, pk=encomenda_pk, equipe_id__in=user_equipes_ids)
+    user = await request.auser()
+    user_equipes_ids = user.equipes.values_list('id', flat=True)
+    encomenda = await aget_object_or_404(Encomenda, pk=encomenda_pk, equipe_id__in=user_equipes_ids)
 
     new_status = request.POST.get('status')
     valid_statuses = [choice[0] for choice in Encomenda.STATUS_CHOICES]
     if new_status in valid_statuses:
         old_status_display = encomenda.get_status_display()
         encomenda.status = new_status
-        encomenda.save(update_fields=['status'])
+        await encomenda.asave(update_fields=['status', 'updated_at'])
         new_status_display = encomenda.get_status_display() # Get display name after save
         return JsonResponse({
             'success': True,
@@ -823,6 +1071,125 @@ def api_update_status(request, encomenda_pk):
         return JsonResponse({'error': 'Status inválido'}, status=400)
 
 
+# --- Live updates (Server-Sent Events) ---
+
+def _cursor_eventos(request):
+    """Where a stream starts: Last-Event-ID on reconnection, else ?desde= (µs since epoch)."""
+    agora = timezone.now()
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+    try:
+        desde = datetime.fromtimestamp(int(valor) / 1_000_000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return agora
+    return min(max(desde, agora - EVENTOS_REPLAY_MAX), agora)
+
+
+def _mensagem_sse(evento, dados, updated_at):
+    event_id = round(updated_at.timestamp() * 1_000_000)
+    return f'id: {event_id}\nevent: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n'
+
+
+def _ler_mudancas(equipe_id, desde):
+    """
+    Orders and deliveries of the team changed since `desde`. Runs in one
+    sync_to_async call that also gives the connection back, so an idle
+    stream holds none (nor a pool slot) while it waits for the next poll.
+    """
+    try:
+        encomendas = list(Encomenda.objects.filter(equipe_id=equipe_id, updated_at__gt=desde).values_list(
+            'numero_encomenda', 'status', 'cliente__nome', 'data_criacao', 'updated_at',
+        ))
+        entregas = list(Entrega.objects.filter(encomenda__equipe_id=equipe_id, updated_at__gt=desde).values_list(
+            'encomenda_id', 'data_realizada', 'updated_at',
+        ))
+    finally:
+        if not connection.in_atomic_block:
+            close_old_connections()
+    return encomendas, entregas
+
+
+async def _mudancas_equipe(equipe_id, cursor, enviados, inicio):
+    """SSE messages for the team's orders and deliveries changed since `cursor`, oldest first."""
+    encomendas, entregas = await sync_to_async(_ler_mudancas)(equipe_id, cursor - EVENTOS_JANELA)
+    status_display = dict(Encomenda.STATUS_CHOICES)
+    mudancas = [
+        (updated_at, ('encomenda', numero), {
+            'numero': numero,
+            'status': status,
+            'status_display': status_display.get(status, status),
+            'cliente': cliente,
+            'nova': data_criacao > inicio,
+        })
+        for numero, status, cliente, data_criacao, updated_at in encomendas
+    ]
+    mudancas += [
+        (updated_at, ('entrega', encomenda_id), {'encomenda': encomenda_id, 'realizada': data_realizada is not None})
+        for encomenda_id, data_realizada, updated_at in entregas
+    ]
+
+    mensagens = []
+    for updated_at, chave, dados in sorted(mudancas, key=lambda mudanca: mudanca[0]):
+        if enviados.get(chave) == updated_at:
+            continue # Already streamed, still inside the look-back window
+        enviados[chave] = updated_at
+        mensagens.append(_mensagem_sse(chave[0], dados, updated_at))
+        cursor = max(cursor, updated_at)
+    for chave in [chave for chave, updated_at in enviados.items() if updated_at <= cursor - EVENTOS_JANELA]:
+        del enviados[chave]
+    return mensagens, cursor
+
+
+async def _stream_eventos(equipe_id, cursor, continuo):
+    """
+    Event stream of one team. The database is the source of truth: the hub
+    (eventos.py) only says when to look, and the team generation catches
+    writes made by other workers.
+    """
+    yield f'retry: {eventos.RETRY_MS}\n\n'
+    inicio, enviados, geracao = cursor, {}, None
+    aberto_em = ultimo_envio = time.monotonic()
+    acordado = True
+    with eventos.Assinatura(equipe_id) as assinatura:
+        while True:
+            geracao_atual = await sync_to_async(team_cache.get_generation)(equipe_id)
+            if acordado or geracao_atual != geracao:
+                geracao = geracao_atual
+                mensagens, cursor = await _mudancas_equipe(equipe_id, cursor, enviados, inicio)
+                if mensagens:
+                    yield ''.join(mensagens)
+                    ultimo_envio = time.monotonic()
+            if not continuo or time.monotonic() - aberto_em >= eventos.STREAM_MAX_AGE:
+                return # The browser reconnects after `retry`, sending the last event id
+            if time.monotonic() - ultimo_envio >= eventos.HEARTBEAT_INTERVAL:
+                yield ': ping\n\n'
+                ultimo_envio = time.monotonic()
+            acordado = await assinatura.esperar(min(eventos.POLL_INTERVAL, eventos.HEARTBEAT_INTERVAL))
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+async def api_eventos_equipe(request, equipe_id):
+    """
+    Server-Sent Events stream of a team's order changes (status, new orders,
+    completed deliveries), consumed by the order list and the dashboard.
+    Held open only under ASGI; a WSGI worker answers with what changed since
+    the cursor and closes, and the browser polls through its reconnections.
+    """
+    user = await request.auser()
+    if not await user.equipes.filter(id=equipe_id).aexists():
+        return JsonResponse({'error': 'Equipe não encontrada ou acesso não permitido'}, status=404)
+
+    metrics.incr('eventos.streams')
+    continuo = isinstance(request, ASGIRequest)
+    response = StreamingHttpResponse(
+        _stream_eventos(equipe_id, _cursor_eventos(request), continuo),
+        content_type='text/event-stream',
+    )
+    patch_cache_control(response, no_cache=True)
+    response.headers['X-Accel-Buffering'] = 'no' # nginx: do not buffer the stream
+    return response
+
+
 @login_required(login_url='login')
 def encomenda_pdf(request, pk):
     """Generates PDF for an order, checking team membership."""
@@ -885,87 +1252,459 @@ def marcar_entrega_realizada(request, pk):
     # Update encomenda status
     if encomenda.status != 'entregue':
         encomenda.status = 'entregue'
-        encomenda.save(update_fields=['status'])
+        encomenda.save(update_fields=['status', 'updated_at'])
 
     messages.success(request, f'Entrega da encomenda #{encomenda.numero_encomenda} marcada como realizada!')
     return redirect('encomenda_detail', pk=encomenda.pk)
 
 
-# --- Search APIs (Updated to filter by user's teams) ---
+def _validar_confirmacao(item, agora):
+    """(entrega_id, data_realizada, entregue_por, assinatura) of one posted item, or raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError('Item inválido')
+    entrega_id = item.get('entrega')
+    if not isinstance(entrega_id, int) or isinstance(entrega_id, bool):
+        raise ValueError('Campo "entrega" deve ser o id da entrega')
+    data_realizada = parse_datetime(str(item.get('data_realizada', '')))
+    if data_realizada is None:
+        raise ValueError('Campo "data_realizada" inválido (use ISO 8601)')
+    if timezone.is_naive(data_realizada):
+        data_realizada = timezone.make_aware(data_realizada)
+    if data_realizada > agora + timedelta(minutes=5): # Allow for a device clock slightly ahead
+        raise ValueError('Campo "data_realizada" está no futuro')
+    entregue_por = str(item.get('entregue_por') or '').strip()
+    if len(entregue_por) > Entrega._meta.get_field('entregue_por').max_length:
+        raise ValueError('Campo "entregue_por" muito longo')
+    return entrega_id, data_realizada, entregue_por, bool(item.get('assinatura_cliente', False))
+
 
 @login_required(login_url='login')
-def search_produtos(request):
-    """API view for searching products (Select2) within user's teams."""
-    search_term = request.GET.get('q', '')
-    equipe_id = request.GET.get('equipe_id') # Optional: specific team context
-    user_equipes = request.user.equipes.all()
+@require_http_methods(["POST"])
+def api_confirmar_entregas(request):
+    """
+    Applies a batch of delivery confirmations recorded offline by a driver:
 
-    produtos = Produto.objects.filter(equipe__in=user_equipes) # Start with user's accessible products
+        {"confirmacoes": [{"entrega": 12, "data_realizada": "2025-10-19T14:32:00-03:00",
+                           "entregue_por": "Carlos", "assinatura_cliente": true}, ...]}
 
-    # Further filter by specific team if requested AND user belongs to it
-    if equipe_id:
-         if user_equipes.filter(id=equipe_id).exists():
-             produtos = produtos.filter(equipe_id=equipe_id)
-         else:
-             produtos = Produto.objects.none() # Invalid team for user
-
-    # Apply search term
-    if search_term:
-        produtos = produtos.filter(
-            Q(nome__icontains=search_term) | Q(codigo__icontains=search_term)
-        )
+    All valid items are applied in one transaction: one bulk UPDATE of the
+    Entregas and one UPDATE of the orders' status. Returns one result per
+    item: ok, ja_realizada (safe to resend a batch), nao_encontrada or invalida.
+    """
+    try:
+        confirmacoes = json.loads(request.body)['confirmacoes']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'JSON inválido: esperado {"confirmacoes": [...]}'}, status=400)
+    if not isinstance(confirmacoes, list) or len(confirmacoes) > CONFIRMACOES_MAX:
+        return JsonResponse({'error': f'Envie uma lista de até {CONFIRMACOES_MAX} confirmações'}, status=400)
+
+    agora = timezone.now()
+    resultados, validas = [], {}
+    for item in confirmacoes:
+        try:
+            entrega_id, *dados = _validar_confirmacao(item, agora)
+        except ValueError as e:
+            resultados.append({'entrega': item.get('entrega') if isinstance(item, dict) else None, 'status': 'invalida', 'erro': str(e)})
+            continue
+        resultados.append({'entrega': entrega_id, 'status': None})
+        validas[entrega_id] = dados # A repeated id keeps its last confirmation
+
+    nome_usuario = request.user.nome_completo or request.user.username
+    with transaction.atomic():
+        entregas = {
+            entrega.pk: entrega
+            for entrega in Entrega.objects.select_for_update().filter(
+                pk__in=validas, encomenda__equipe__in=request.user.equipes.all()
+            ).select_related('encomenda')
+        }
+        alteradas = []
+        for entrega_id, (data_realizada, entregue_por, assinatura) in validas.items():
+            entrega = entregas.get(entrega_id)
+            if entrega is None or entrega.data_realizada:
+                continue
+            local = timezone.localtime(data_realizada)
+            entrega.data_realizada = data_realizada
+            entrega.data_entrega_realizada = local.date()
+            entrega.hora_entrega = local.time()
+            entrega.entregue_por = entregue_por or entrega.entregue_por or nome_usuario
+            entrega.assinatura_cliente = entrega.assinatura_cliente or assinatura
+            entrega.updated_at = agora # bulk_update does not apply auto_now
+            alteradas.append(entrega)
+
+        Entrega.objects.bulk_update(alteradas, [
+            'data_realizada', 'data_entrega_realizada', 'hora_entrega', 'entregue_por',
+            'assinatura_cliente', 'updated_at',
+        ])
+        vendas.mover_encomendas([entrega.encomenda_id for entrega in alteradas], status='entregue')
+        Encomenda.objects.filter(
+            pk__in=[entrega.encomenda_id for entrega in alteradas]
+        ).exclude(status='entregue').update(status='entregue', updated_at=agora)
+
+        # Set-based updates send no signals: do what signals.py would
+        for equipe_id in {entrega.encomenda.equipe_id for entrega in alteradas}:
+            team_cache.bump_generation_on_commit(equipe_id)
+            eventos.publicar_on_commit(equipe_id)
+        for entrega in alteradas:
+            entrega.encomenda.status = 'entregue' # As the UPDATE above left it, for the change log
+            historico.registrar(entrega.encomenda, historico.ALTERACAO)
+        historico.registrar_varios(alteradas, historico.ALTERACAO)
+
+    aplicadas = {entrega.pk for entrega in alteradas}
+    for resultado in resultados:
+        if resultado['status'] is None:
+            entrega_id = resultado['entrega']
+            if entrega_id in aplicadas:
+                resultado['status'] = 'ok'
+            elif entrega_id in entregas:
+                resultado['status'] = 'ja_realizada'
+            else:
+                resultado['status'] = 'nao_encontrada'
+    metrics.incr('entregas.confirmadas_em_lote', len(alteradas))
+    return JsonResponse({'confirmadas': len(alteradas), 'resultados': resultados})
 
-    produtos = produtos.select_related('equipe').order_by('nome')[:20] # Limit results, include team for display
 
-    results = [{'id': p.id, 'text': f"{p.codigo} - {p.nome} ({p.equipe.nome})"} for p in produtos]
-    return JsonResponse({'results': results})
+@login_required(login_url='login')
+def manifesto_entregas(request, equipe_id):
+    """Printable delivery manifest of a team for a day (?dia=AAAA-MM-DD, default today)."""
+    try:
+        equipe_atual = get_equipe_atual(request, equipe_id)
+        if equipe_atual is None:
+            messages.error(request, "ID da equipe não especificado ou acesso negado.")
+            return redirect('listar_equipes')
+    except Http404 as e:
+        messages.error(request, str(e))
+        return redirect('listar_equipes')
+
+    hoje = timezone.localdate()
+    try:
+        dia = datetime.strptime(request.GET.get('dia', ''), '%Y-%m-%d').date()
+    except ValueError:
+        dia = hoje
+
+    context = {
+        'equipe': equipe_atual,
+        'manifesto': manifesto.get_manifesto(equipe_atual.id, dia),
+        'dia_anterior': dia - timedelta(days=1),
+        'dia_seguinte': dia + timedelta(days=1),
+        'hoje': hoje,
+        'title': f'Entregas - {equipe_atual.nome}',
+    }
+    return render(request, 'encomendas/entrega_manifesto.html', context)
+
+
+# --- Work queues (see fila.py) ---
+
+def _fila_erro(request, equipe_id, nome_fila):
+    """JSON error response if the queue does not exist or the user is not in the team, else None."""
+    if nome_fila not in fila.FILAS:
+        return JsonResponse({'error': 'Fila inexistente'}, status=404)
+    if not request.user.equipes.filter(id=equipe_id).exists():
+        return JsonResponse({'error': 'Equipe não encontrada ou acesso não permitido'}, status=404)
+    return None
+
+
+def _itens_fila(queryset):
+    """JSON rows of queue items (Encomendas or Entregas)."""
+    if queryset.model is Entrega:
+        return [
+            {
+                'id': entrega.pk,
+                'encomenda': entrega.encomenda_id,
+                'cliente': entrega.encomenda.cliente.nome,
+                'bairro': entrega.encomenda.cliente.bairro,
+                'data_prevista': entrega.data_prevista,
+                'reservada_ate': entrega.reservada_ate,
+            }
+            for entrega in queryset.select_related('encomenda__cliente')
+        ]
+    return [
+        {
+            'id': encomenda.pk,
+            'numero': encomenda.numero_encomenda,
+            'cliente': encomenda.cliente.nome,
+            'status': encomenda.status,
+            'reservada_ate': encomenda.reservada_ate,
+        }
+        for encomenda in queryset.select_related('cliente')
+    ]
+
+
+def _ids_do_post(request):
+    return [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
 
 
 @login_required(login_url='login')
-def search_clientes(request):
-    """API view for searching clients (Select2) within user's teams."""
-    search_term = request.GET.get('q', '')
-    equipe_id = request.GET.get('equipe_id')
-    user_equipes = request.user.equipes.all()
+@require_http_methods(["GET"])
+def api_fila(request, equipe_id, nome_fila):
+    """Free item count of a queue and the items the user holds in it."""
+    erro = _fila_erro(request, equipe_id, nome_fila)
+    if erro:
+        return erro
+    livres, minhas = fila.resumo(nome_fila, equipe_id, request.user)
+    return JsonResponse({
+        'fila': nome_fila,
+        'descricao': fila.FILAS[nome_fila].descricao,
+        'livres': livres,
+        'minhas': _itens_fila(minhas),
+    })
 
-    clientes = Cliente.objects.filter(equipe__in=user_equipes)
 
-    if equipe_id:
-        if user_equipes.filter(id=equipe_id).exists():
-             clientes = clientes.filter(equipe_id=equipe_id)
-        else:
-             clientes = Cliente.objects.none()
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def api_fila_reservar(request, equipe_id, nome_fila):
+    """Claims the next ?quantidade= free items of a queue for the user."""
+    erro = _fila_erro(request, equipe_id, nome_fila)
+    if erro:
+        return erro
+    try:
+        quantidade = int(request.POST.get('quantidade', 1))
+    except ValueError:
+        return JsonResponse({'error': 'Quantidade inválida'}, status=400)
+    pks = fila.reservar(nome_fila, equipe_id, request.user, quantidade)
+    metrics.incr(f'fila.{nome_fila}.reservados', len(pks))
+    itens = fila.FILAS[nome_fila].model.objects.filter(pk__in=pks).order_by(*fila.FILAS[nome_fila].ordem)
+    return JsonResponse({'itens': _itens_fila(itens)})
 
-    if search_term:
-        clientes = clientes.filter(
-            Q(nome__icontains=search_term) | Q(codigo__icontains=search_term) | Q(telefone__icontains=search)
-        )
 
-    clientes = clientes.select_related('equipe').order_by('nome')[:20]
-    results = [{'id': c.id, 'text': f"{c.codigo} - {c.nome} ({c.equipe.nome})"} for c in clientes]
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def api_fila_renovar(request, equipe_id, nome_fila):
+    """Extends the user's leases on the posted ids."""
+    erro = _fila_erro(request, equipe_id, nome_fila)
+    if erro:
+        return erro
+    return JsonResponse({'renovados': fila.renovar(nome_fila, equipe_id, request.user, _ids_do_post(request))})
+
+
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def api_fila_liberar(request, equipe_id, nome_fila):
+    """Returns the posted ids held by the user to the queue."""
+    erro = _fila_erro(request, equipe_id, nome_fila)
+    if erro:
+        return erro
+    return JsonResponse({'liberados': fila.liberar(nome_fila, equipe_id, request.user, _ids_do_post(request))})
+
+
+# --- Sales reports (see vendas.py) ---
+
+def _mes_do_get(request, nome):
+    valor = request.GET.get(nome)
+    return datetime.strptime(valor, '%Y-%m').date() if valor else None
+
+
+def _relatorio_vendas(request, equipe):
+    """Runs vendas.relatorio() with the GET parameters. Raises ValueError on bad input."""
+    return vendas.relatorio(
+        equipe.id,
+        linhas=request.GET.get('linhas', 'produto'),
+        colunas=request.GET.get('colunas') or None,
+        medida=request.GET.get('medida', 'valor_total'),
+        de=_mes_do_get(request, 'de'),
+        ate=_mes_do_get(request, 'ate'),
+        status=request.GET.getlist('status') or None,
+    )
+
+
+@login_required(login_url='login')
+def relatorio_vendas(request, equipe_id):
+    """Report builder: team sales pivoted by month, produto, fornecedor, categoria, cliente or status."""
+    try:
+        equipe_atual = get_equipe_atual(request, equipe_id)
+        if equipe_atual is None or not equipe_atual.pode_gerenciar(request.user):
+            messages.error(request, "Apenas administradores e gerentes podem ver os relatórios da equipe.")
+            return redirect('listar_equipes')
+    except Http404 as e:
+        messages.error(request, str(e))
+        return redirect('listar_equipes')
+
+    try:
+        relatorio = _relatorio_vendas(request, equipe_atual)
+    except ValueError:
+        messages.error(request, "Parâmetros do relatório inválidos.")
+        relatorio = None
+
+    context = {
+        'equipe': equipe_atual,
+        'relatorio': relatorio,
+        'tabela': zip(relatorio.linhas, relatorio.valores, relatorio.totais_linhas) if relatorio else None,
+        'linhas': request.GET.get('linhas', 'produto'),
+        'colunas': request.GET.get('colunas', ''),
+        'medida': request.GET.get('medida', 'valor_total'),
+        'status_selecionados': request.GET.getlist('status'),
+        'dimensoes': list(vendas.DIMENSOES),
+        'medidas': vendas.MEDIDAS,
+        'status_choices': Encomenda.STATUS_CHOICES,
+        'de': request.GET.get('de', ''),
+        'ate': request.GET.get('ate', ''),
+        'title': f'Relatório de Vendas - {equipe_atual.nome}',
+    }
+    return render(request, 'encomendas/relatorio_vendas.html', context)
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def api_relatorio_vendas(request, equipe_id):
+    """JSON version of relatorio_vendas (same parameters)."""
+    equipe = request.user.equipes.filter(id=equipe_id).first()
+    if equipe is None or not equipe.pode_gerenciar(request.user):
+        return JsonResponse({'error': 'Equipe não encontrada ou acesso não permitido'}, status=404)
+    try:
+        relatorio = _relatorio_vendas(request, equipe)
+    except ValueError:
+        return JsonResponse({'error': 'Parâmetros do relatório inválidos'}, status=400)
+    return JsonResponse(relatorio._asdict())
+
+
+# --- Search APIs (Updated to filter by user's teams) ---
+# Async: these autocomplete requests are tiny and mostly wait on the database,
+# so under ASGI they no longer hold a whole worker each.
+
+SEARCH_LIMIT = 20
+
+TELEFONE_MIN_DIGITOS = 8 # A local number without area code
+TELEFONE_MAX_CLIENTES = 10
+TELEFONE_ULTIMAS_ENCOMENDAS = 5
+
+
+def _filtro_telefone(telefone):
+    """Clients whose number ends with `telefone`, or equals it without the area code."""
+    digitos = normalizar_telefone(telefone)
+    filtro = Q(telefone_reverso__startswith=digitos[::-1])
+    if len(digitos) >= 10: # Typed with the area code; saved without it
+        filtro |= Q(telefone_reverso=digitos[2:][::-1])
+    return filtro
+
+
+def _filtro_telefone_digitado(search_term):
+    # Only input that looks like a phone number goes through the phone column
+    if len(normalizar_telefone(search_term)) >= TELEFONE_MIN_DIGITOS and not re.search(r'[^\d\s()+.-]', search_term):
+        return _filtro_telefone(search_term)
+    return Q(pk__in=[])
+
+
+async def _search_results(request, queryset, filtro_extra=None):
+    """
+    Select2 results for `queryset` limited to the user's teams (and ?equipe_id=).
+
+    Names or codes starting with the input come first, through the
+    (equipe, nome_busca) and codigo indexes, plus `filtro_extra(input)` if
+    given; only when those do not fill the page are rows with any word
+    starting with it added, through the word index (_filtro_busca).
+    """
+    search_term = request.GET.get('q', '').strip()
+    equipe_id = request.GET.get('equipe_id') # Optional: specific team context
+    user = await request.auser()
+    user_equipes = user.equipes.all()
+
+    queryset = queryset.filter(equipe__in=user_equipes) # Start with user's accessible rows
+
+    # Further filter by specific team; stays empty unless the user belongs to it
+    if equipe_id:
+        queryset = queryset.filter(equipe_id=equipe_id)
+
+    queryset = queryset.select_related('equipe').order_by('nome')
+    encontrados = []
+    prefixo = normalizar_busca(search_term)
+    if prefixo:
+        filtro = Q(nome_busca__istartswith=prefixo) | Q(codigo__istartswith=search_term)
+        if filtro_extra is not None:
+            filtro |= filtro_extra(search_term)
+        por_prefixo = queryset.filter(filtro)
+        encontrados = [obj async for obj in por_prefixo[:SEARCH_LIMIT]]
+        if len(encontrados) < SEARCH_LIMIT:
+            equipes = [equipe_id] if equipe_id else user_equipes.values('id')
+            por_palavra = queryset.filter(_filtro_busca(queryset.model, search_term, equipes)).exclude(
+                pk__in=[obj.pk for obj in encontrados]
+            )
+            encontrados += [obj async for obj in por_palavra[:SEARCH_LIMIT - len(encontrados)]]
+    elif not search_term:
+        encontrados = [obj async for obj in queryset[:SEARCH_LIMIT]]
+
+    # Include team for display
+    results = [
+        {'id': obj.id, 'text': f"{obj.codigo} - {obj.nome} ({obj.equipe.nome})"}
+        for obj in encontrados
+    ]
     return JsonResponse({'results': results})
 
 
 @login_required(login_url='login')
-def search_fornecedores(request):
+@conditional_page(_team_list_version)
+async def search_produtos(request):
+    """API view for searching products (Select2) within user's teams."""
+    return await _search_results(request, Produto.objects.all())
+
+
+@login_required(login_url='login')
+@conditional_page(_team_list_version)
+async def search_clientes(request):
+    """API view for searching clients (Select2) within user's teams."""
+    return await _search_results(request, Cliente.objects.all(), _filtro_telefone_digitado)
+
+
+@login_required(login_url='login')
+@conditional_page(_team_list_version)
+async def search_fornecedores(request):
     """API view for searching suppliers (Select2) within user's teams."""
-    search_term = request.GET.get('q', '')
-    equipe_id = request.GET.get('equipe_id')
-    user_equipes = request.user.equipes.all()
+    return await _search_results(request, Fornecedor.objects.all())
 
-    fornecedores = Fornecedor.objects.filter(equipe__in=user_equipes)
 
-    if equipe_id:
-        if user_equipes.filter(id=equipe_id).exists():
-            fornecedores = fornecedores.filter(equipe_id=equipe_id)
-        else:
-            fornecedores = Fornecedor.objects.none()
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+async def api_cliente_por_telefone(request, equipe_id):
+    """
+    Counter lookup "customer calls, we search by phone": the team's clients
+    with that number (any formatting, with or without area code) and their
+    last orders, in one request. ?numero=
+    """
+    user = await request.auser()
+    if not await user.equipes.filter(id=equipe_id).aexists():
+        return JsonResponse({'error': 'Equipe não encontrada ou acesso não permitido'}, status=404)
+    numero = request.GET.get('numero', '')
+    if len(normalizar_telefone(numero)) < TELEFONE_MIN_DIGITOS:
+        return JsonResponse({'error': f'Informe ao menos {TELEFONE_MIN_DIGITOS} dígitos do telefone.'}, status=400)
+
+    ultimas = Encomenda.objects.order_by('-data_encomenda', '-numero_encomenda')[:TELEFONE_ULTIMAS_ENCOMENDAS]
+    clientes = Cliente.objects.filter(
+        _filtro_telefone(numero), equipe_id=equipe_id,
+    ).order_by('-encomendas_count', 'nome').prefetch_related(
+        Prefetch('encomenda_set', queryset=ultimas, to_attr='ultimas_encomendas'),
+    )[:TELEFONE_MAX_CLIENTES]
+
+    status_display = dict(Encomenda.STATUS_CHOICES)
+    resultados = [
+        {
+            'id': cliente.id,
+            'codigo': cliente.codigo,
+            'nome': cliente.nome,
+            'telefone': cliente.telefone,
+            'endereco': cliente.endereco,
+            'bairro': cliente.bairro,
+            'referencia': cliente.referencia,
+            'encomendas_count': cliente.encomendas_count,
+            'ultimas_encomendas': [
+                {
+                    'numero': encomenda.numero_encomenda,
+                    'data': encomenda.data_encomenda.isoformat(),
+                    'status': encomenda.status,
+                    'status_display': status_display.get(encomenda.status, encomenda.status),
+                    'valor_total': str(encomenda.valor_total),
+                }
+                for encomenda in cliente.ultimas_encomendas
+            ],
+        }
+        async for cliente in clientes
+    ]
+    return JsonResponse({'clientes': resultados})
 
-    if search_term:
-        fornecedores = fornecedores.filter(
-            Q(nome__icontains=search_term) | Q(codigo__icontains=search_term) | Q(contato__icontains=search)
-        )
 
-    fornecedores = fornecedores.select_related('equipe').order_by('nome')[:20]
-    results = [{'id': f.id, 'text': f"{f.codigo} - {f.nome} ({f.equipe.nome})"} for f in fornecedores]
-    return JsonResponse({'results': results})
\ No newline at end of file
+# --- Operational metrics (staff only) ---
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def api_metrics(request):
+    """Returns in-process metrics (connection pool, caches, ...) as JSON."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Acesso não permitido'}, status=403)
+    return JsonResponse(metrics.snapshot())
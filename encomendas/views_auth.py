@@ -11,7 +11,7 @@ from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Q, Count
 from datetime import timedelta
 import uuid
 from django.urls import reverse
@@ -25,13 +25,16 @@ from .forms_auth import (
     AlterarPapelForm
 )
 # Make sure all models are imported, including Encomenda
-from .models import Usuario, Equipe, MembroEquipe, ConviteEquipe, Encomenda
+from .models import Usuario, Equipe, MembroEquipe, ConviteEquipe, Encomenda, normalizar_email
 # Import helper function if needed elsewhere
 from .views import get_equipe_atual
+from . import team_cache
+from .throttle import throttle
 
 # --- Other views (registro, logout_view, solicitar_reset_senha, etc.) remain the same ---
 
 # NO @login_required here
+@throttle('login', account=lambda request: request.POST.get('email'))
 def login_view(request):
     """View para login de usuário"""
     if request.user.is_authenticated:
@@ -92,6 +95,7 @@ def logout_view(request):
 
 
 # NO @login_required here
+@throttle('registro')
 def registro(request):
     """View para registro de novo usuário"""
     if request.user.is_authenticated:
@@ -137,7 +141,7 @@ def solicitar_reset_senha(request):
             email = form.cleaned_data['email']
 
             try:
-                usuario = Usuario.objects.get(email__iexact=email, is_active=True)
+                usuario = Usuario.objects.get(email=normalizar_email(email), is_active=True)
                 token = usuario.gerar_token_reset()
                 # Check if function exists before calling
                 if callable(globals().get('enviar_email_reset_senha')):
@@ -158,6 +162,7 @@ def solicitar_reset_senha(request):
 
 
 # NO @login_required here
+@throttle('redefinir_senha', account=lambda request, token: token)
 def redefinir_senha(request, token):
     """View para redefinir senha com token"""
     if request.user.is_authenticated:
@@ -195,6 +200,7 @@ def redefinir_senha(request, token):
 
 
 @login_required(login_url='login')
+@throttle('alterar_senha', account=lambda request: request.user.pk)
 def alterar_senha(request):
     """View para alterar senha do usuário logado"""
     if request.method == 'POST':
@@ -242,7 +248,7 @@ def listar_equipes(request):
 
     equipes_administradas = request.user.equipes_administradas.order_by('nome')
     convites_pendentes = ConviteEquipe.objects.filter(
-        email__iexact=request.user.email,
+        email=request.user.email,
         status='pendente'
     ).select_related('equipe', 'criado_por').order_by('-data_criacao')
 
@@ -320,7 +326,7 @@ def convidar_membro(request, equipe_id):
     if request.method == 'POST':
         form = ConvidarMembroForm(request.POST)
         if form.is_valid():
-            email = form.cleaned_data['email']
+            email = normalizar_email(form.cleaned_data['email'])
             papel = form.cleaned_data['papel']
 
             if papel == 'administrador' and not equipe.eh_administrador(request.user):
@@ -329,14 +335,14 @@ def convidar_membro(request, equipe_id):
                  return render(request, 'encomendas/equipes/convidar_membro.html', context)
 
             try:
-                usuario_existente = Usuario.objects.get(email__iexact=email)
+                usuario_existente = Usuario.objects.get(email=email)
                 if equipe.eh_membro(usuario_existente):
                     messages.warning(request, f'{usuario_existente.nome_completo or email} já é membro desta equipe.')
                     return redirect('gerenciar_equipe', equipe_id=equipe.id)
             except Usuario.DoesNotExist:
                 pass
 
-            if ConviteEquipe.objects.filter(equipe=equipe, email__iexact=email, status='pendente').exists():
+            if ConviteEquipe.objects.filter(equipe=equipe, email=email, status='pendente').exists():
                 messages.warning(request, f'Já existe um convite pendente para {email} nesta equipe.')
                 return redirect('gerenciar_equipe', equipe_id=equipe.id)
 
@@ -468,7 +474,7 @@ def sair_equipe(request, equipe_id):
 @require_http_methods(["POST"])
 def aceitar_convite(request, convite_id):
     """View para aceitar convite de equipe"""
-    convite = get_object_or_404(ConviteEquipe, id=convite_id, email__iexact=request.user.email)
+    convite = get_object_or_404(ConviteEquipe, id=convite_id, email=request.user.email)
 
     if not convite.eh_valido():
         messages.error(request, 'Este convite expirou ou não é mais válido.')
@@ -497,7 +503,7 @@ def aceitar_convite(request, convite_id):
 @require_http_methods(["POST"])
 def rejeitar_convite(request, convite_id):
     """View para rejeitar convite de equipe"""
-    convite = get_object_or_404(ConviteEquipe, id=convite_id, email__iexact=request.user.email)
+    convite = get_object_or_404(ConviteEquipe, id=convite_id, email=request.user.email)
 
     if convite.status != 'pendente':
         messages.warning(request, f'Este convite já foi respondido ou expirou.')
@@ -522,17 +528,18 @@ def dashboard_equipe(request, equipe_id):
 
     encomendas_da_equipe = Encomenda.objects.filter(equipe=equipe)
 
-    total_encomendas = encomendas_da_equipe.count()
-    encomendas_pendentes = encomendas_da_equipe.filter(status__in=['criada', 'cotacao', 'aprovada', 'em_andamento', 'pronta']).count()
-    encomendas_entregues = encomendas_da_equipe.filter(status='entregue').count()
+    # Counts only change when the team's data changes: cache them per generation
+    contagens = team_cache.get_or_set(equipe.id, 'dashboard_contagens', lambda: encomendas_da_equipe.aggregate(
+        total_encomendas=Count('pk'),
+        encomendas_pendentes=Count('pk', filter=Q(status__in=['criada', 'cotacao', 'aprovada', 'em_andamento', 'pronta'])),
+        encomendas_entregues=Count('pk', filter=Q(status='entregue')),
+    ))
     ultimas_encomendas = encomendas_da_equipe.select_related('cliente').order_by('-data_criacao')[:5]
 
     context = {
         'equipe': equipe,
         'title': f'Dashboard - {equipe.nome}',
-        'total_encomendas': total_encomendas,
-        'encomendas_pendentes': encomendas_pendentes,
-        'encomendas_entregues': encomendas_entregues,
+        **contagens,
         'ultimas_encomendas': ultimas_encomendas,
     }
     return render(request, 'encomendas/dashboard.html', context)
@@ -20,6 +20,11 @@ echo "🗄️ Configurando banco de dados..."
 python3 manage.py makemigrations
 python3 manage.py migrate
 
+# Baixar bibliotecas de front-end e coletar arquivos estáticos
+echo "🎨 Preparando arquivos estáticos..."
+python3 manage.py baixar_assets
+python3 manage.py collectstatic --noinput
+
 # Criar dados de exemplo
 echo "📊 Criando dados de exemplo..."
 python3 populate_db.py
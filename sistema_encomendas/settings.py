@@ -40,16 +40,21 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'whitenoise.runserver_nostatic', # runserver serves static files through WhiteNoise too
     'django.contrib.staticfiles',
     'encomendas', # Your app
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # WhiteNoise, right after SecurityMiddleware (subclass that also runs natively under ASGI)
+    'encomendas.middleware.AsyncWhiteNoiseMiddleware',
+    'encomendas.middleware.CompressionMiddleware', # brotli/gzip; before anything that edits the body
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'encomendas.middleware.HistoricoMiddleware', # Acting user of the change log
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'encomendas.context_processors.navegacao', # Lazy teams/roles/invites for menus
             ],
         },
     },
@@ -79,7 +85,9 @@ WSGI_APPLICATION = 'sistema_encomendas.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # Django's MySQL backend plus a per-process connection pool
+        # (see encomendas/db/mysql_pool/base.py)
+        'ENGINE': 'encomendas.db.mysql_pool',
         'NAME': 'sistema_encomendas',
         'USER': 'root',  # Replace with your MySQL user if different
         'PASSWORD': 'root',  # Replace with your MySQL password
@@ -90,10 +98,58 @@ DATABASES = {
             # Ensure MySQL uses transactions correctly
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
+        # Connections go back to the pool at the end of each request; the
+        # init_command above only runs when a new physical connection is opened.
+        'POOL': {
+            'MAX_SIZE': 10,
+            'TIMEOUT': 10,
+            'MAX_LIFETIME': 1800,
+            'PING_INTERVAL': 30,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'default' is the cache shared by every process: team generation counters,
+# sessions, login throttle buckets and cached users live here. LocMem below
+# is per process, so it is only right for development and single-process
+# servers. With several workers use Redis (or Memcached), e.g.
+#
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379',
+#         'TIMEOUT': 60 * 60,
+#     },
+#
+# Do not use FileBasedCache: every set() scans the directory to cull it, and
+# the files are readable by anyone who can read the project directory.
+# 'team' adds a per-process LRU in front of it for team-scoped data (see
+# encomendas/team_cache.py); template fragments use the same two-tier setup.
+
+_TWO_TIER_CACHE = {
+    'BACKEND': 'encomendas.cache_backends.TwoTierCache',
+    'TIMEOUT': 60 * 60,
+    'OPTIONS': {
+        'SHARED_ALIAS': 'default',
+        'LOCAL_MAX_ENTRIES': 2000,
+        'LOCAL_TIMEOUT': 5 * 60,
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sistema-encomendas',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'team': _TWO_TIER_CACHE,
+    'template_fragments': _TWO_TIER_CACHE,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -129,11 +185,31 @@ USE_TZ = True # Important for timezone-aware datetimes
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
-# Add STATIC_ROOT for collectstatic in production
-# STATIC_ROOT = BASE_DIR / 'staticfiles'
+# collectstatic target, served by WhiteNoise (no CDN needed). Vendor libraries
+# live in encomendas/static/vendor/ (see `manage.py baixar_assets`).
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 # Add STATICFILES_DIRS if you have static files outside app directories
 # STATICFILES_DIRS = [BASE_DIR / 'static']
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # collectstatic writes hashed names (base.3f2a9c.css) plus .gz/.br copies
+    # (brotli needs the Brotli package). WhiteNoise serves hashed files with
+    # 'max-age=315360000, immutable' and picks the precompressed variant.
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Response compression (encomendas.middleware.CompressionMiddleware).
+# Brotli is used when the client accepts it and the Brotli package is installed.
+COMPRESSION_MIN_SIZE = 512 # bytes; smaller bodies are sent as they are
+COMPRESSION_BROTLI_QUALITY = 5 # 0-11; higher costs much more CPU per response
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_MAX_RANDOM_BYTES = 100 # random padding on HTML (BREACH); at most 256
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -167,6 +243,26 @@ SITE_URL = 'http://127.0.0.1:8000'
 # Session Settings (optional, example for longer session)
 # SESSION_COOKIE_AGE = 60 * 60 * 24 * 7 * 2 # 2 weeks in seconds
 
+# Sessions are read from the shared cache and written through to the
+# database, so they survive a cache flush; most requests do no session query.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'default'
+
+# Logged-in users are loaded from the shared cache too (invalidated on save)
+AUTHENTICATION_BACKENDS = ['encomendas.auth_backends.CachedModelBackend']
+
+# Flash messages travel in a signed cookie instead of forcing a session write
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Token buckets for the views that hash passwords (encomendas/throttle.py):
+# (capacity, period in seconds) per client IP and per account tried.
+AUTH_THROTTLE = {
+    'login': {'ip': (30, 60), 'conta': (5, 300)},
+    'registro': {'ip': (10, 600)},
+    'redefinir_senha': {'ip': (10, 300), 'conta': (5, 300)},
+    'alterar_senha': {'ip': (10, 300), 'conta': (5, 300)},
+}
+
 # Message Framework Tags (optional, aligns with Bootstrap alert classes)
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {
@@ -178,4 +274,10 @@ MESSAGE_TAGS = {
 }
 
 # Invitation expiration days (optional custom setting)
-CONVITE_EXPIRACAO_DIAS = 7
\ No newline at end of file
+CONVITE_EXPIRACAO_DIAS = 7
+# Work queue leases (encomendas/fila.py): claimed items return to the queue
+# after this many seconds unless renewed
+FILA_LEASE = 15 * 60
+# Order archive (encomendas/arquivo.py): delivered and cancelled orders
+# unchanged for this many days move to the archive tables
+ARQUIVO_IDADE_DIAS = 365